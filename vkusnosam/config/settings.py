@@ -54,6 +54,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'recipes.db_router.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "debug_toolbar.middleware.DebugToolbarMiddleware",
@@ -87,9 +88,19 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    },
+    # Реплика для чтения: используется, только если указана в DATABASE_REPLICAS.
+    # В тестах - отдельный файл, данные в который не копируются
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        'TEST': {'NAME': BASE_DIR / 'test_db_replica.sqlite3'},
+    },
 }
 
+DATABASE_ROUTERS = ['recipes.db_router.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -190,3 +201,96 @@ LOGGING = {
 # Email
 
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
+
+# Счетчик просмотров рецептов
+
+RECIPE_VIEWS_FLUSH_INTERVAL = 10  # Как часто (в секундах) накопленные просмотры записываются в базу
+
+# Поиск рецептов
+
+RECIPE_SEARCH_BACKEND = 'recipes.search.SqliteFTSBackend'  # Для баз без FTS5: 'recipes.search.SimpleSearchBackend'
+
+RECIPE_SEARCH_MAX_RESULTS = 500  # Сколько самых релевантных рецептов выдает поиск
+
+# Кэш. LocMemCache хранит данные в памяти процесса; при нескольких процессах лучше Redis или Memcached
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'vkusnosam',
+    }
+}
+
+# Списки популярных рецептов в сайдбарах
+
+RECIPE_TOP_LIST_SIZE = 4
+
+RECIPE_TOP_LIST_TTL = 300  # Через сколько секунд список пересчитывается, даже если не было изменений
+
+# Пагинация списков рецептов
+
+RECIPE_LISTING_PAGINATION = 'cursor'  # 'cursor' - курсорная пагинация, 'offset' - обычная с номерами страниц
+
+RECIPE_LISTING_SHOW_TOTAL = False  # Показывать примерное общее кол-во рецептов
+
+RECIPE_APPROXIMATE_COUNT_TTL = 60  # На сколько секунд кэшируется общее кол-во рецептов
+
+# Условные GET-запросы (ETag / Last-Modified) для страниц рецептов (recipes/conditional.py).
+# Номер поколения каталога хранится в кэше, поэтому при нескольких процессах кэш должен быть общим
+
+CONDITIONAL_GET_VERSION = 6  # Увеличить после изменения шаблонов, чтобы браузеры не получили 304 со старой разметкой
+
+# Кэш страниц рецептов и списков для анонимных посетителей (recipes/page_cache.py)
+
+RECIPE_PAGE_CACHE_TTL = 600  # Сколько секунд хранится страница; 0 - не кэшировать
+
+# Асинхронные варианты страниц рецептов (recipes/async_views.py). Включать при запуске через ASGI (config/asgi.py):
+# под WSGI каждый асинхронный запрос выполнялся бы в отдельном цикле событий
+
+RECIPE_ASYNC_VIEWS = False
+
+# Уменьшенные варианты изображений (recipes/images.py)
+
+IMAGE_VARIANT_WIDTHS = (100, 200, 350, 600, 1000)  # Ширины вариантов в пикселях
+
+IMAGE_VARIANT_FORMATS = ('webp', 'jpeg')
+
+IMAGE_VARIANT_QUALITY = 80
+
+IMAGE_VARIANT_WORKERS = 2  # Кол-во процессов, которые строят варианты
+
+IMAGE_VARIANTS_ASYNC = True  # False - строить варианты сразу при сохранении, без пула процессов
+
+# Загрузка файлов. Файлы сразу пишутся во временный файл частями, а не держатся в памяти,
+# и при сохранении переносятся в MEDIA_ROOT без копирования
+
+FILE_UPLOAD_HANDLERS = ['django.core.files.uploadhandler.TemporaryFileUploadHandler']
+
+DATA_UPLOAD_MAX_NUMBER_FILES = 100  # Фото рецепта и до 99 фото шагов в одной форме
+
+# Комментарии на странице рецепта (recipes/comments.py): первая страница выводится сразу, следующие подгружаются
+
+RECIPE_COMMENTS_PAGE_SIZE = 20
+
+# Списки рецептов и комментариев в профиле пользователя подгружаются страницами по столько объектов
+
+PROFILE_PAGE_SIZE = 20
+
+# Поиск рецептов по продуктам "Приготовить из того, что есть" (recipes/ingredient_index.py)
+
+RECIPE_COOK_MAX_INGREDIENTS = 10  # Сколько продуктов из запроса учитывается
+
+# Похожие рецепты на странице рецепта (recipes/similar.py): MinHash-сигнатуры продуктов и тегов, корзины LSH
+
+RECIPE_SIMILAR_COUNT = 6  # Сколько похожих рецептов хранится и выводится
+
+RECIPE_SIMILAR_MIN_SCORE = 0.2  # Минимальная оценка сходства наборов продуктов (коэффициент Жаккара)
+
+RECIPE_SIMILAR_WORKERS = 2  # Кол-во процессов для полного пересчета (rebuild_similar_recipes)
+
+# Реплики базы данных для чтения (recipes/db_router.py): алиасы из DATABASES.
+# GET-запросы страниц рецептов и списков читают рецепты и теги с реплик, запись - всегда в основную базу
+
+DATABASE_REPLICAS = []  # Например, ['replica']
+
+DATABASE_REPLICA_LAG = 5  # Сколько секунд после записи пользователя его чтения идут в основную базу
@@ -1,7 +1,8 @@
 from django.contrib import admin
-from django.utils.safestring import mark_safe
+from django.utils.html import format_html
 from taggit.models import Tag
 
+from .images import variant_url
 from .models import *
 
 @admin.register(Comment)
@@ -66,7 +67,8 @@ class RecipeAdmin(admin.ModelAdmin):
         Метод позволяет отображать поле с изображением в админке
         """
         if recipe.image:
-            return mark_safe(f'<img src="{recipe.image.url}" width=50>')
+            # Уменьшенный вариант вместо исходного файла (ширина 50 с запасом для экранов высокой плотности)
+            return format_html('<img src="{}" width=50>', variant_url(recipe.image, 100))
         else:
             return "без изображения"
 
@@ -0,0 +1,167 @@
+import asyncio
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.db.models import QuerySet
+from django.http import HttpResponse
+from django.shortcuts import aget_object_or_404
+from taggit.models import Tag
+
+from .comments import afirst_comments_page
+from .conditional import ConditionalGetMixin
+from .models import RecipeStepPreparing, TagsCategory
+from .page_cache import AnonymousPageCacheMixin, remember_recipe_slug
+from .similar import similar_queryset
+from .top_lists import most_viewed_recipes, top_rated_recipes
+from .view_counter import view_counter
+from .viewer_state import get_viewer_state
+from .views import HomeView, RecipeDetail, TagCloudByCategoryView, TaggedRecipesView
+
+
+async def alist(queryset: QuerySet) -> list:
+    """
+    Метод загружает объекты запроса через асинхронный ORM.
+    :param queryset: QuerySet
+    :return: List
+    """
+    return [obj async for obj in queryset]
+
+
+class AsyncViewMixin:
+    """
+    Общая часть асинхронных вариантов представлений (для запуска через config/asgi.py,
+    настройка RECIPE_ASYNC_VIEWS = True).
+    Все данные страницы загружаются через асинхронный ORM до рендеринга, независимые запросы -
+    одновременно через asyncio.gather. Шаблон рендерится в потоке (sync_to_async),
+    потому что теги шаблонов и контекстные процессоры синхронные.
+    Кэш страниц и условные GET-запросы работают так же, как в синхронных представлениях.
+    """
+
+    async def aprepare(self) -> None:
+        """
+        Метод загружает данные, которые нужны для проверки версии страницы (ETag).
+        :return: None
+        """
+
+    async def aget_context_data(self) -> dict:
+        """
+        Метод загружает данные страницы и возвращает контекст шаблона.
+        :return: Dict
+        """
+        raise NotImplementedError
+
+    async def get(self, request, *args, **kwargs) -> HttpResponse:
+        # Сессия и пользователь загружаются здесь, дальше проверки кэша и сообщений обходятся без запросов
+        request.user = await request.auser()
+        page_cache = isinstance(self, AnonymousPageCacheMixin)
+        conditional = isinstance(self, ConditionalGetMixin)
+
+        response = self.get_cached_page(request) if page_cache else None
+        if response is None:
+            await self.aprepare()
+            response = self.get_not_modified(request) if conditional else None
+            if response is None:
+                response = self.render_to_response(await self.aget_context_data())
+                if page_cache:
+                    self.cache_page_on_render(response)
+                await sync_to_async(response.render)()
+            if conditional:
+                response = self.add_conditional_headers(response)
+        return response
+
+
+class AsyncHomeView(AsyncViewMixin, HomeView):
+    """
+    Асинхронный вариант HomeView: страница рецептов и оба блока сайдбара загружаются одновременно.
+    """
+
+    def find_recipes(self, query: str) -> list:
+        return self.found_recipes
+
+    def paginate_queryset(self, queryset, page_size):
+        return self.paginated
+
+    async def aget_context_data(self) -> dict:
+        query = self.request.GET.get('search')
+        if query:  # Поисковый индекс работает через синхронный курсор
+            self.found_recipes = await sync_to_async(super().find_recipes)(query)
+        self.object_list = self.get_queryset()
+        # Списки сайдбаров кладутся в кэш, откуда их возьмут теги шаблона
+        self.paginated, _, _ = await asyncio.gather(
+            self.apaginate_queryset(self.object_list, self.get_paginate_by(self.object_list)),
+            top_rated_recipes.aget(),
+            most_viewed_recipes.aget(),
+        )
+        # Состояние рецептов страницы для пользователя (оценки, авторство) - для тегов шаблона
+        await get_viewer_state(self.request).aload(self.paginated[2])
+        return self.get_context_data()
+
+
+class AsyncTaggedRecipesView(AsyncViewMixin, TaggedRecipesView):
+    """
+    Асинхронный вариант TaggedRecipesView.
+    """
+
+    def paginate_queryset(self, queryset, page_size):
+        return self.paginated
+
+    async def aget_context_data(self) -> dict:
+        self.tag = await aget_object_or_404(Tag, slug=self.kwargs.get('tag_slug'))
+        self.object_list = self.get_recipes()
+        self.paginated = await self.apaginate_queryset(self.object_list, self.get_paginate_by(self.object_list))
+        return self.get_context_data()
+
+
+class AsyncTagCloudByCategoryView(AsyncViewMixin, TagCloudByCategoryView):
+    """
+    Асинхронный вариант TagCloudByCategoryView: теги облака и список категорий загружаются одновременно.
+    """
+
+    async def aget_context_data(self) -> dict:
+        slug = self.kwargs.get('tag_category_slug')
+        self.category_tag = await aget_object_or_404(TagsCategory, slug=slug) if slug else None
+        self.object_list, categories = await asyncio.gather(alist(self.get_usages()),
+                                                            alist(TagsCategory.objects.all()))
+        context = self.get_context_data()
+        context['categorys_tags'] = categories
+        return context
+
+
+class AsyncRecipeDetail(AsyncViewMixin, RecipeDetail):
+    """
+    Асинхронный вариант RecipeDetail: первая страница комментариев, шаги рецепта, похожие рецепты
+    и оценка пользователя загружаются одновременно.
+    Добавление комментария (POST) выполняется синхронным обработчиком в потоке.
+    """
+    hit_recipe_id: Optional[int] = None
+
+    def page_cache_hit(self) -> None:
+        # Счетчик просмотров может записать буфер в базу, поэтому просмотр учитывается после ответа из кэша
+        self.hit_recipe_id = int(self.page_cache_version.split(':', 1)[0])
+
+    async def aprepare(self) -> None:
+        self.object = self._cached_object = await aget_object_or_404(
+            self.get_queryset(), slug=self.kwargs[self.slug_url_kwarg])
+
+    async def aget_context_data(self) -> dict:
+        comments, steps, similar, _ = await asyncio.gather(
+            afirst_comments_page(self.object),
+            alist(RecipeStepPreparing.objects.filter(recipe_id=self.object)),
+            alist(similar_queryset(self.object.pk)),
+            get_viewer_state(self.request).aload([self.object]),
+        )
+        context = self.get_context_data(object=self.object, comments_page=comments, similar_recipes=similar)
+        context['recipe_step_preparing'] = steps
+        return context
+
+    async def get(self, request, *args, **kwargs) -> HttpResponse:
+        response = await AsyncViewMixin.get(self, request, *args, **kwargs)
+        if self.hit_recipe_id is not None:
+            await sync_to_async(view_counter.increment)(self.hit_recipe_id)
+        else:
+            await sync_to_async(self.object.increment_views)()
+            remember_recipe_slug(self.object.slug, self.object.pk)
+        return response
+
+    async def post(self, request, *args, **kwargs) -> HttpResponse:
+        return await sync_to_async(super().post)(request, *args, **kwargs)
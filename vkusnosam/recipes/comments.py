@@ -0,0 +1,72 @@
+from typing import Optional
+
+from django.conf import settings
+from django.db.models import QuerySet
+
+from .models import Comment, Recipe
+from .pagination import CursorPage, KeysetPaginator
+
+# Новые комментарии первыми; ключ совпадает с индексом (recipe, -time_create, -id)
+COMMENT_ORDERING = ('-time_create', '-pk')
+
+
+def comments_queryset(recipe_id: int) -> QuerySet:
+    """
+    Метод возвращает комментарии рецепта вместе с авторами.
+    Из автора загружаются только поля, которые выводятся рядом с комментарием.
+    :param recipe_id: Int
+    :return: QuerySet
+    """
+    return Comment.objects.filter(recipe_id=recipe_id).select_related('user').only(
+        'content', 'time_create', 'recipe_id', 'user__username', 'user__avatar', 'user__avatar_variants')
+
+
+def comments_paginator(recipe_id: int) -> KeysetPaginator:
+    """
+    Метод возвращает курсорную пагинацию комментариев рецепта (RECIPE_COMMENTS_PAGE_SIZE на странице).
+    :param recipe_id: Int
+    :return: KeysetPaginator
+    """
+    return KeysetPaginator(comments_queryset(recipe_id), COMMENT_ORDERING,
+                           getattr(settings, 'RECIPE_COMMENTS_PAGE_SIZE', 20))
+
+
+def comments_page(recipe_id: int, cursor: Optional[str]) -> CursorPage:
+    """
+    Метод возвращает страницу комментариев рецепта после курсора (без курсора - первую).
+    :param recipe_id: Int
+    :param cursor: токен курсора или None
+    :return: CursorPage
+    """
+    return comments_paginator(recipe_id).page(cursor)
+
+
+def first_comments_page(recipe: Recipe) -> CursorPage:
+    """
+    Метод возвращает первую страницу комментариев для страницы рецепта.
+    Есть ли следующая страница, видно по счетчику комментариев рецепта,
+    поэтому лишний комментарий, как в KeysetPaginator.page, не загружается.
+    :param recipe: Recipe
+    :return: CursorPage
+    """
+    paginator = comments_paginator(recipe.pk)
+    return _make_first_page(paginator, recipe, list(_first_page_queryset(paginator)))
+
+
+async def afirst_comments_page(recipe: Recipe) -> CursorPage:
+    """
+    Асинхронный вариант first_comments_page.
+    :param recipe: Recipe
+    :return: CursorPage
+    """
+    paginator = comments_paginator(recipe.pk)
+    return _make_first_page(paginator, recipe, [obj async for obj in _first_page_queryset(paginator)])
+
+
+def _first_page_queryset(paginator: KeysetPaginator) -> QuerySet:
+    return paginator.queryset.order_by(*paginator.ordering)[:paginator.per_page]
+
+
+def _make_first_page(paginator: KeysetPaginator, recipe: Recipe, objects: list) -> CursorPage:
+    has_next = len(objects) == paginator.per_page and recipe.comments_count > paginator.per_page
+    return CursorPage(objects, paginator.next_cursor(objects[-1]) if has_next else None, None)
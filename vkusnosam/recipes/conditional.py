@@ -0,0 +1,177 @@
+import datetime
+import hashlib
+import time
+from typing import Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpRequest, HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .db_router import replica_lag, request_replica
+from .models import Recipe
+
+GENERATION_KEY = 'recipes:catalog:generation'
+MODIFIED_KEY = 'recipes:catalog:modified'
+
+
+def catalog_state() -> Tuple[int, datetime.datetime]:
+    """
+    Метод возвращает номер поколения каталога и время его последнего изменения.
+    Номер увеличивается при любом изменении рецептов, поэтому по нему списки рецептов
+    проверяют актуальность без запросов к базе.
+    Если кэш потерял номер, новый номер начинается с текущего времени в миллисекундах,
+    чтобы не совпасть с номерами, которые уже видели браузеры.
+    :return: Tuple (номер, время изменения)
+    """
+    state = cache.get_many([GENERATION_KEY, MODIFIED_KEY])
+    if len(state) < 2:
+        now = time.time()
+        cache.add(GENERATION_KEY, int(now * 1000), None)
+        cache.add(MODIFIED_KEY, now, None)
+        state = cache.get_many([GENERATION_KEY, MODIFIED_KEY])
+    return state[GENERATION_KEY], datetime.datetime.fromtimestamp(state[MODIFIED_KEY], datetime.timezone.utc)
+
+
+def bump_catalog_generation() -> None:
+    """
+    Метод увеличивает номер поколения каталога после фиксации текущей транзакции.
+    :return: None
+    """
+    transaction.on_commit(_bump_catalog_generation)
+
+
+def _bump_catalog_generation() -> None:
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:  # Номера в кэше нет - создастся при следующем чтении
+        cache.delete(MODIFIED_KEY)
+        return
+    cache.set(MODIFIED_KEY, time.time(), None)
+
+
+def touch_recipes(recipe_ids: Iterable[int]) -> None:
+    """
+    Метод отмечает рецепты измененными (их шаги, теги, оценки или комментарии)
+    и увеличивает номер поколения каталога.
+    :param recipe_ids: id рецептов
+    :return: None
+    """
+    Recipe.objects.filter(pk__in=list(recipe_ids)).update(time_update=timezone.now())
+    bump_catalog_generation()
+
+
+def has_pending_messages(request: HttpRequest) -> bool:
+    """
+    Метод проверяет, ждут ли пользователя сообщения (они выводятся на странице один раз).
+    :param request: HttpRequest
+    :return: Bool
+    """
+    return hasattr(request, '_messages') and len(get_messages(request)) > 0
+
+
+class ConditionalGetMixin:
+    """
+    Миксин для условных GET-запросов: страница отдается с ETag и Last-Modified,
+    а на If-None-Match / If-Modified-Since с той же версией отвечает 304 без выполнения запросов
+    к списку объектов и без рендеринга шаблона.
+    Версию страницы задает метод get_version, время изменения - get_last_modified.
+    В ETag также входят пользователь (от него зависят шапка и формы) и для авторизованного - CSRF-cookie
+    (токен в формах; анонимам страницы рецептов отдаются без форм с токеном),
+    а пока у пользователя есть непоказанные сообщения, страница всегда рендерится полностью.
+    """
+
+    def get_version(self) -> str:
+        """
+        Метод возвращает версию содержимого страницы.
+        :return: Str
+        """
+        raise NotImplementedError
+
+    def get_last_modified(self) -> Optional[datetime.datetime]:
+        """
+        Метод возвращает время последнего изменения содержимого страницы.
+        :return: Datetime или None
+        """
+        return None
+
+    def get_etag(self) -> str:
+        """
+        Метод возвращает строгий ETag страницы.
+        :return: Str (в кавычках)
+        """
+        user = self.request.user
+        parts = [
+            str(getattr(settings, 'CONDITIONAL_GET_VERSION', 1)),
+            type(self).__name__,
+            self.get_version(),
+            str(user.pk if user.is_authenticated else 0),
+            self.request.COOKIES.get(settings.CSRF_COOKIE_NAME, '') if user.is_authenticated else '',
+        ]
+        return '"%s"' % hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+    def get_not_modified(self, request: HttpRequest) -> Optional[HttpResponse]:
+        """
+        Метод вычисляет ETag и Last-Modified страницы и возвращает ответ 304,
+        если у клиента актуальная версия. Иначе - None, и страницу нужно отрисовать.
+        :param request: HttpRequest
+        :return: HttpResponse или None
+        """
+        self.conditional_validators = None
+        if has_pending_messages(request):
+            return None
+        etag = self.get_etag()
+        last_modified = self.get_last_modified()
+        self.conditional_validators = (etag, last_modified)
+        return get_conditional_response(
+            request, etag=etag, last_modified=last_modified and int(last_modified.timestamp()))
+
+    def add_conditional_headers(self, response: HttpResponse) -> HttpResponse:
+        """
+        Метод добавляет к ответу ETag, Last-Modified и Cache-Control, вычисленные в get_not_modified.
+        :param response: HttpResponse
+        :return: HttpResponse
+        """
+        if self.conditional_validators is None or response.status_code not in (200, 304):
+            return response
+        etag, last_modified = self.conditional_validators
+        response.headers['ETag'] = etag
+        if last_modified:
+            response.headers['Last-Modified'] = http_date(last_modified.timestamp())
+        # Браузер и CDN хранят страницу, но перед показом каждый раз проверяют ее версию
+        patch_cache_control(response, no_cache=True, private=self.request.user.is_authenticated)
+        patch_vary_headers(response, ['Cookie'])
+        return response
+
+    def get(self, request, *args, **kwargs) -> HttpResponse:
+        response = self.get_not_modified(request)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        return self.add_conditional_headers(response)
+
+
+class CatalogConditionalGetMixin(ConditionalGetMixin):
+    """
+    Миксин условных GET-запросов для списков рецептов: версия страницы - номер поколения каталога.
+    """
+
+    def get_version(self) -> str:
+        self._catalog_state = catalog_state()
+        return str(self._catalog_state[0])
+
+    def get_last_modified(self) -> Optional[datetime.datetime]:
+        if not hasattr(self, '_catalog_state'):
+            self._catalog_state = catalog_state()
+        return self._catalog_state[1]
+
+    def add_conditional_headers(self, response: HttpResponse) -> HttpResponse:
+        # Версия берется из кэша, а не из прочитанных рецептов: список с отстающей реплики
+        # не должен получить ETag новой версии каталога, иначе браузер сохранит старые данные до следующего изменения
+        if response.status_code == 200 and request_replica() is not None and \
+                time.time() - self.get_last_modified().timestamp() < replica_lag():
+            return response
+        return super().add_conditional_headers(response)
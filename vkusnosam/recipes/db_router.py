@@ -0,0 +1,116 @@
+import random
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.http import HttpRequest
+
+# Время, до которого чтения пользователя идут с основной базы (после его записи реплики могут отставать)
+SESSION_KEY = '_db_primary_until'
+
+# Приложения, модели которых читаются с реплик. Пользователи и сессии всегда читаются с основной базы:
+# только что зарегистрированного или вошедшего пользователя на реплике может еще не быть
+REPLICA_APPS = {'recipes', 'taggit'}
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+class RoutingState:
+    """
+    Маршрутизация запросов к базе для текущего HTTP-запроса.
+    """
+
+    def __init__(self, replica: Optional[str] = None):
+        self.replica = replica  # Реплика для чтения (None - читать с основной базы)
+        self.written = False  # В запросе была запись: дальше читаем с основной базы
+
+
+_state: ContextVar[Optional[RoutingState]] = ContextVar('recipes_db_routing', default=None)
+
+
+def replica_lag() -> float:
+    return getattr(settings, 'DATABASE_REPLICA_LAG', 5)
+
+
+def request_replica() -> Optional[str]:
+    """
+    Метод возвращает реплику, выбранную для чтения в текущем запросе (даже если после записи
+    чтения уже идут в основную базу), или None.
+    :return: Str или None
+    """
+    state = _state.get()
+    return state.replica if state is not None else None
+
+
+def reading_from_replica() -> bool:
+    """
+    Метод проверяет, читает ли текущий запрос данные рецептов с реплики.
+    :return: Bool
+    """
+    state = _state.get()
+    return state is not None and state.replica is not None and not state.written
+
+
+class ReplicaRouter:
+    """
+    Роутер баз данных: запись - всегда в основную базу, чтение - с реплики (настройка DATABASE_REPLICAS),
+    если представление отмечено replica_reads = True и запрос - GET или HEAD (см. ReplicaRoutingMiddleware).
+    Остальные чтения (команды, сигналы, формы, POST) идут в основную базу. После записи в запросе
+    его чтения тоже идут в основную базу, после записи в POST-запросе - чтения пользователя
+    в течение DATABASE_REPLICA_LAG секунд.
+    """
+
+    def db_for_read(self, model, **hints) -> str:
+        if reading_from_replica() and model._meta.app_label in REPLICA_APPS:
+            return _state.get().replica
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints) -> str:
+        state = _state.get()
+        if state is not None:
+            state.written = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints) -> Optional[bool]:
+        aliases = {DEFAULT_DB_ALIAS, *getattr(settings, 'DATABASE_REPLICAS', ())}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True  # На репликах те же данные, что и в основной базе
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Middleware выбирает базу для чтения на время запроса (вместе с рендерингом шаблона и тегами шаблона).
+    Реплика выбирается для GET и HEAD представлений с replica_reads = True, если пользователь
+    недавно ничего не записывал. После POST-запроса с записью в базу сессия запоминает время,
+    до которого чтения пользователя идут в основную базу. Ставится после AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest):
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.written and request.method not in SAFE_METHODS and hasattr(request, 'session') and \
+                getattr(settings, 'DATABASE_REPLICAS', ()):
+            request.session[SESSION_KEY] = time.time() + replica_lag()
+        return response
+
+    def process_view(self, request: HttpRequest, view_func, view_args, view_kwargs) -> None:
+        replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+        view_class = getattr(view_func, 'view_class', None)
+        if not replicas or request.method not in SAFE_METHODS or not getattr(view_class, 'replica_reads', False):
+            return None
+        # Без cookie сессии посетитель ничего не записывал - сессию не загружаем
+        if settings.SESSION_COOKIE_NAME in request.COOKIES and \
+                request.session.get(SESSION_KEY, 0) > time.time():
+            return None
+        _state.get().replica = random.choice(replicas)
+        return None
@@ -3,6 +3,7 @@ from django.core.exceptions import ValidationError
 from django.db.transaction import commit
 
 from recipes.models import Recipe, Comment, Rating, RecipeStepPreparing
+from recipes.tagging import sync_recipe_tags
 
 
 def validate_text_format(value):
@@ -69,8 +70,8 @@ class RecipeForm(forms.ModelForm):
 
     def save(self, commit=True) -> Recipe:
         """
-        Метод берет названия продуктов из поля products, после чего создает их них список.
-        Далее из списка создаются привязанные к рецепту теги.
+        Метод сохраняет рецепт и приводит его теги к продуктам из поля products
+        (названия нормализуются, лишние теги снимаются, см. recipes/tagging.py).
         :param commit: Если True, сохраняет объект в БД. Если False, возвращает несохраненный объект.
         :return: Объект модели Recipe (сохраненный или нет, в зависимости от commit)
         """
@@ -80,13 +81,8 @@ class RecipeForm(forms.ModelForm):
             recipe.save()  # Сохраняем рецепт в БД
             self.save_m2m()  # Сохраняем ManyToMany-поля (если есть)
 
-            # Обрабатываем продукты и добавляем теги
-            products_text = self.cleaned_data.get('products', '')
-            print(products_text)
-            if products_text:
-                product_names = recipe.create_list_from_data_field_products()  # Получаем список названий
-                print(product_names)
-                recipe.tags.add(*product_names)
+            # Теги из продуктов, разобранных при сохранении рецепта
+            sync_recipe_tags([recipe])
 
         return recipe
 
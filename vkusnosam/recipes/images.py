@@ -0,0 +1,278 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import Model
+from django.db.models.fields.files import FieldFile
+from PIL import Image, ImageOps
+
+from .conditional import touch_recipes
+from .page_cache import invalidate_recipe_pages
+from .similar import touch_similar_lists
+
+logger = logging.getLogger(__name__)
+
+# Поля с изображениями и поля, в которых хранятся их уменьшенные варианты: {модель: [(поле, поле вариантов)]}
+IMAGE_FIELDS = {
+    'recipes.Recipe': [('image', 'image_variants')],
+    'recipes.RecipeStepPreparing': [('step_image', 'step_image_variants')],
+    settings.AUTH_USER_MODEL: [('avatar', 'avatar_variants')],
+}
+
+# Поле с id рецепта, на странице и в карточках которого выводится изображение: {модель: поле}
+RECIPE_FIELDS = {'recipes.Recipe': 'pk', 'recipes.RecipeStepPreparing': 'recipe_id'}
+
+# Формат Pillow и расширение файла для каждого формата вариантов
+FORMATS = {'webp': ('WEBP', 'webp'), 'jpeg': ('JPEG', 'jpg')}
+
+
+def variant_widths() -> Tuple[int, ...]:
+    return tuple(getattr(settings, 'IMAGE_VARIANT_WIDTHS', (100, 200, 350, 600, 1000)))
+
+
+def variant_formats() -> Tuple[str, ...]:
+    return tuple(getattr(settings, 'IMAGE_VARIANT_FORMATS', ('webp', 'jpeg')))
+
+
+def variants_field_name(model: type, field_name: str) -> Optional[str]:
+    """
+    Метод возвращает имя поля, в котором хранятся варианты изображения поля field_name модели.
+    :param model: класс модели
+    :param field_name: Str
+    :return: Str или None, если для поля варианты не создаются
+    """
+    for image_field, variants_field in IMAGE_FIELDS.get(model._meta.label, []):
+        if image_field == field_name:
+            return variants_field
+    return None
+
+
+def get_variants(file: FieldFile) -> dict:
+    """
+    Метод возвращает готовые варианты изображения: {'webp': {ширина: путь}, 'jpeg': {...}}.
+    Если варианты еще не созданы или созданы для прежнего файла - пустой словарь.
+    :param file: FieldFile
+    :return: Dict
+    """
+    if not file:
+        return {}
+    variants_field = variants_field_name(type(file.instance), file.field.name)
+    variants = getattr(file.instance, variants_field, None) if variants_field else None
+    if not variants or variants.get('source') != file.name:
+        return {}
+    return variants
+
+
+def variant_url(file: FieldFile, width: int, image_format: str = 'jpeg') -> str:
+    """
+    Метод возвращает адрес самого маленького варианта не уже width (или самого большого из имеющихся).
+    Пока вариантов нет - адрес исходного файла.
+    :param file: FieldFile
+    :param width: нужная ширина в пикселях
+    :param image_format: 'webp' или 'jpeg'
+    :return: Str
+    """
+    sources = sorted((int(w), name) for w, name in get_variants(file).get(image_format, {}).items())
+    if not sources:
+        return file.url
+    for source_width, name in sources:
+        if source_width >= width:
+            return default_storage.url(name)
+    return default_storage.url(sources[-1][1])
+
+
+def _variant_name(name: str, width: int, extension: str) -> str:
+    stem, _ = os.path.splitext(name)
+    return f'variants/{stem}-{width}.{extension}'
+
+
+def build_variants(name: str, widths: Tuple[int, ...], formats: Tuple[str, ...], quality: int) -> dict:
+    """
+    Метод создает уменьшенные и пережатые варианты изображения и сохраняет их в хранилище.
+    Выполняется в процессе из пула, поэтому принимает и возвращает только простые значения.
+    Варианты шире исходного изображения не создаются.
+    :param name: путь исходного файла в хранилище
+    :param widths: ширины вариантов
+    :param formats: форматы вариантов
+    :param quality: качество сжатия
+    :return: Dict {'source': name, 'webp': {ширина: путь}, 'jpeg': {...}}
+    """
+    with default_storage.open(name) as file:
+        image = Image.open(file)
+        image.load()
+    image = ImageOps.exif_transpose(image)  # Учитываем поворот из EXIF, иначе фото с телефона лягут на бок
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+    targets = sorted({min(width, image.width) for width in widths})
+    variants = {'source': name}
+    for image_format in formats:
+        pil_format, extension = FORMATS[image_format]
+        variants[image_format] = {}
+        for width in targets:
+            resized = image if width == image.width else image.resize(
+                (width, max(1, round(image.height * width / image.width))), Image.Resampling.LANCZOS)
+            if pil_format == 'JPEG' and resized.mode == 'RGBA':  # JPEG без прозрачности: подкладываем белый фон
+                background = Image.new('RGB', resized.size, 'white')
+                background.paste(resized, mask=resized.getchannel('A'))
+                resized = background
+            buffer = BytesIO()
+            resized.save(buffer, pil_format, quality=quality, optimize=True)
+            variant_name = _variant_name(name, width, extension)
+            if default_storage.exists(variant_name):
+                default_storage.delete(variant_name)
+            variants[image_format][str(width)] = default_storage.save(variant_name, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def store_variants(model_label: str, pk, field_name: str, variants: dict) -> None:
+    """
+    Метод сохраняет варианты изображения в объекте модели.
+    Если изображение успело смениться, варианты не сохраняются (для нового файла строятся свои).
+    Страницы рецепта с изображением отмечаются измененными: вместо исходного файла на них теперь выводятся
+    варианты, поэтому меняются ETag и версии закэшированных страниц. Варианты прежнего файла удаляются из хранилища.
+    :param model_label: 'app.Model'
+    :param pk: id объекта
+    :param field_name: поле с изображением
+    :param variants: результат build_variants
+    :return: None
+    """
+    model = apps.get_model(model_label)
+    variants_field = variants_field_name(model, field_name)
+    recipe_field = RECIPE_FIELDS.get(model_label)
+    queryset = model._default_manager.filter(pk=pk)
+    old_variants, recipe_id = queryset.values_list(variants_field, recipe_field or 'pk').first() or ({}, None)
+    if queryset.filter(**{field_name: variants['source']}).update(**{variants_field: variants}):
+        if recipe_field and recipe_id is not None:
+            touch_recipes([recipe_id])  # Увеличивает и номер поколения каталога (изображения есть в карточках)
+            invalidate_recipe_pages([recipe_id])
+            if model_label == 'recipes.Recipe':
+                touch_similar_lists(recipe_id)  # Изображение выводится и в списках похожих рецептов
+        _delete_variants(old_variants or {}, keep=variants)
+    else:  # Файл сменился или объект удален - созданные варианты уже не нужны
+        _delete_variants(variants, keep={})
+
+
+def _delete_variants(variants: dict, keep: dict) -> None:
+    keep_names = {name for image_format in FORMATS for name in keep.get(image_format, {}).values()}
+    for image_format in FORMATS:
+        for name in variants.get(image_format, {}).values():
+            if name not in keep_names:
+                default_storage.delete(name)
+
+
+def _init_worker() -> None:
+    import django
+    django.setup()
+
+
+def create_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Метод создает пул процессов для построения вариантов.
+    Процессы запускаются через spawn, а не fork: форк процесса с потоками веб-сервера
+    может зависнуть на блокировке, захваченной другим потоком.
+    :param workers: кол-во процессов
+    :return: ProcessPoolExecutor
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_worker)
+
+
+class VariantBuilder:
+    """
+    Очередь построения вариантов изображений в пуле процессов.
+    Пул создается при первой задаче. Результат записывается в базу из потока пула в основном процессе,
+    поэтому обработка запроса не ждет Pillow.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+        self._in_flight = set()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = create_pool(getattr(settings, 'IMAGE_VARIANT_WORKERS', 2))
+            return self._executor
+
+    def submit(self, model_label: str, pk, field_name: str, name: str) -> Optional[Future]:
+        """
+        Метод ставит в очередь построение вариантов файла name.
+        Повторная задача для того же файла, пока первая не завершилась, не создается.
+        При IMAGE_VARIANTS_ASYNC = False варианты строятся сразу в текущем процессе.
+        :return: Future или None
+        """
+        args = (name, variant_widths(), variant_formats(), getattr(settings, 'IMAGE_VARIANT_QUALITY', 80))
+        if not getattr(settings, 'IMAGE_VARIANTS_ASYNC', True):
+            store_variants(model_label, pk, field_name, build_variants(*args))
+            return None
+
+        key = (model_label, pk, field_name, name)
+        with self._lock:
+            if key in self._in_flight:
+                return None
+            self._in_flight.add(key)
+        future = self.executor.submit(build_variants, *args)
+        future.add_done_callback(lambda done: self._store(key, done))
+        return future
+
+    def _store(self, key: tuple, future: Future) -> None:
+        model_label, pk, field_name, name = key
+        try:
+            store_variants(model_label, pk, field_name, future.result())
+        except Exception:
+            logger.exception("Не удалось создать варианты изображения %s", name)
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
+            close_old_connections()  # Поток пула не обрабатывает запросы, соединение закрываем сами
+
+
+variant_builder = VariantBuilder()
+
+
+def schedule_variants(instance: Model, update_fields=None) -> List[str]:
+    """
+    Метод ставит в очередь построение вариантов для изображений объекта, у которых варианты устарели.
+    Задача ставится после фиксации транзакции, чтобы пул видел сохраненный объект.
+    Возвращает имена полей, для которых поставлены задачи.
+    :param instance: сохраненный объект модели из IMAGE_FIELDS
+    :param update_fields: поля, переданные в save()
+    :return: List
+    """
+    label = instance._meta.label
+    scheduled = []
+    for field_name, variants_field in IMAGE_FIELDS.get(label, []):
+        if update_fields is not None and field_name not in update_fields:
+            continue
+        file = getattr(instance, field_name)
+        variants = getattr(instance, variants_field) or {}
+        if not file:
+            if variants:  # Изображение удалено - удаляем и варианты
+                type(instance)._default_manager.filter(pk=instance.pk).update(**{variants_field: {}})
+                transaction.on_commit(lambda variants=variants: _delete_variants(variants, keep={}))
+            continue
+        if variants.get('source') != file.name:
+            transaction.on_commit(lambda field_name=field_name, name=file.name: variant_builder.submit(
+                label, instance.pk, field_name, name))
+            scheduled.append(field_name)
+    return scheduled
+
+
+def iter_image_fields() -> Dict[type, List[Tuple[str, str]]]:
+    """
+    Метод возвращает {класс модели: [(поле, поле вариантов)]} для всех моделей с вариантами изображений.
+    :return: Dict
+    """
+    return {apps.get_model(label): fields for label, fields in IMAGE_FIELDS.items()}
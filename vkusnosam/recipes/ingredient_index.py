@@ -0,0 +1,222 @@
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import IngredientIndex, Recipe
+from .tagging import tag_key
+
+# Сколько битовых карт продуктов держится в памяти процесса (самые нужные по последнему использованию).
+# Карта занимает (максимальный id рецепта / 8) байт: 125 КБ при миллионе рецептов
+BITMAP_CACHE_SIZE = 256
+
+_bitmaps: 'OrderedDict[str, Tuple[int, int]]' = OrderedDict()  # {продукт: (версия, битовая карта)}
+_bitmaps_lock = threading.Lock()
+
+
+class IngredientMatch(NamedTuple):
+    """
+    Рецепт, найденный по продуктам: id рецепта и сколько продуктов из запроса в нем есть.
+    """
+    recipe_id: int
+    matched: int
+
+
+class IngredientSearchResult(NamedTuple):
+    """
+    Страница результатов поиска по продуктам.
+    next_cursor - (совпало продуктов, id рецепта) последнего рецепта страницы, если есть следующая страница.
+    """
+    matches: List[IngredientMatch]
+    next_cursor: Optional[Tuple[int, int]]
+    total: int  # Рецептов, в которых есть хотя бы один продукт
+    complete: int  # Рецептов, в которых есть все продукты
+    keys: List[str]
+
+
+def ingredient_keys(ingredients: Iterable[dict]) -> Set[str]:
+    """
+    Метод возвращает нормализованные названия продуктов из поля ingredients рецепта.
+    :param ingredients: List (словари с ключом name)
+    :return: Set
+    """
+    return {key for key in (tag_key(ingredient['name']) for ingredient in ingredients or ()) if key}
+
+
+def encode_bitmap(bits: int) -> bytes:
+    """
+    Метод сжимает битовую карту для хранения в базе. Карты редких продуктов почти целиком
+    состоят из нулей и сжимаются до нескольких байт на рецепт.
+    :param bits: Int (бит N - рецепт с id N)
+    :return: Bytes
+    """
+    return zlib.compress(bits.to_bytes((bits.bit_length() + 7) // 8, 'little'), 1)
+
+
+def decode_bitmap(data: bytes) -> int:
+    """
+    Метод распаковывает битовую карту из базы.
+    :param data: Bytes
+    :return: Int
+    """
+    return int.from_bytes(zlib.decompress(data), 'little') if data else 0
+
+
+def bitmap_from_ids(ids: Iterable[int]) -> int:
+    """
+    Метод строит битовую карту из id рецептов. Биты ставятся в буфере байтов,
+    а не сдвигами большого числа, поэтому время растет линейно с кол-вом id.
+    :param ids: id рецептов
+    :return: Int
+    """
+    ids = list(ids)
+    if not ids:
+        return 0
+    buffer = bytearray(max(ids) // 8 + 1)
+    for recipe_id in ids:
+        buffer[recipe_id >> 3] |= 1 << (recipe_id & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def update_recipe_index(recipe_id: int, old_keys: Set[str], new_keys: Set[str]) -> None:
+    """
+    Метод переносит рецепт между битовыми картами продуктов при изменении его ингредиентов.
+    Изменяемые строки индекса блокируются до конца транзакции, чтобы параллельное сохранение
+    другого рецепта с тем же продуктом не затерло изменение карты.
+    :param recipe_id: Int
+    :param old_keys: продукты рецепта до изменения
+    :param new_keys: продукты рецепта после изменения
+    :return: None
+    """
+    added, removed = new_keys - old_keys, old_keys - new_keys
+    if not added and not removed:
+        return
+    bit = 1 << recipe_id
+    with transaction.atomic():
+        IngredientIndex.objects.bulk_create([IngredientIndex(key=key) for key in added], ignore_conflicts=True)
+        rows = list(IngredientIndex.objects.select_for_update().filter(key__in=added | removed))
+        for row in rows:
+            bits = decode_bitmap(row.bitmap)
+            bits = bits | bit if row.key in added else bits & ~bit
+            row.bitmap = encode_bitmap(bits)
+            row.recipes_count = bits.bit_count()
+            row.version += 1
+        IngredientIndex.objects.bulk_update(rows, ['bitmap', 'recipes_count', 'version'])
+
+
+def rebuild_ingredient_index(batch_size: int = 5000) -> int:
+    """
+    Метод заново строит индекс продуктов по полю ingredients всех рецептов
+    (после загрузки каталога через bulk_create, когда сигналы не вызываются).
+    :param batch_size: сколько рецептов читается одним запросом
+    :return: Int (кол-во продуктов в индексе)
+    """
+    postings: Dict[str, List[int]] = {}  # {продукт: id рецептов}
+    recipes = Recipe.objects.order_by('pk').values_list('pk', 'ingredients')
+    last_pk = 0
+    while True:
+        batch = list(recipes.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1][0]
+        for recipe_id, ingredients in batch:
+            for key in ingredient_keys(ingredients):
+                postings.setdefault(key, []).append(recipe_id)
+
+    rows = []
+    for key, ids in postings.items():
+        rows.append(IngredientIndex(key=key, bitmap=encode_bitmap(bitmap_from_ids(ids)), recipes_count=len(ids)))
+    with transaction.atomic():
+        # Версии продолжают старые, чтобы процессы не оставили в памяти карты до перестройки
+        versions = dict(IngredientIndex.objects.values_list('key', 'version'))
+        for row in rows:
+            row.version = versions.get(row.key, 0) + 1
+        IngredientIndex.objects.all().delete()
+        IngredientIndex.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def load_bitmaps(keys: List[str]) -> Dict[str, int]:
+    """
+    Метод возвращает битовые карты продуктов. Карты хранятся в памяти процесса, из базы каждый раз
+    читаются только версии, а сами карты - только новые или изменившиеся (обычно 1 запрос, при изменениях 2).
+    :param keys: нормализованные названия продуктов
+    :return: Dict {продукт: битовая карта} (продуктов, которых нет в индексе, в словаре нет)
+    """
+    versions = dict(IngredientIndex.objects.filter(key__in=keys).values_list('key', 'version'))
+    result = {}
+    with _bitmaps_lock:
+        for key, version in versions.items():
+            cached = _bitmaps.get(key)
+            if cached is not None and cached[0] == version:
+                result[key] = cached[1]
+                _bitmaps.move_to_end(key)
+    stale = versions.keys() - result.keys()
+    if stale:
+        loaded = {key: (version, decode_bitmap(data)) for key, version, data in
+                  IngredientIndex.objects.filter(key__in=stale).values_list('key', 'version', 'bitmap')}
+        with _bitmaps_lock:
+            _bitmaps.update(loaded)
+            while len(_bitmaps) > BITMAP_CACHE_SIZE:
+                _bitmaps.popitem(last=False)
+        result.update({key: bits for key, (version, bits) in loaded.items()})
+    return result
+
+
+def clear_bitmap_cache() -> None:
+    """
+    Метод очищает битовые карты в памяти процесса (для тестов).
+    :return: None
+    """
+    with _bitmaps_lock:
+        _bitmaps.clear()
+
+
+def search_by_ingredients(names: Iterable[str], cursor: Optional[Tuple[int, int]] = None,
+                          limit: int = 20) -> IngredientSearchResult:
+    """
+    Метод ищет рецепты, которые можно приготовить из продуктов: сначала рецепты с наибольшим кол-вом
+    совпавших продуктов, при равенстве - новые (с большим id).
+    Пересечение считается в памяти над битовыми картами: levels[m] - рецепты, в которых есть не меньше m
+    продуктов из запроса. Каждая операция проходит карту целиком на C (миллион рецептов - 125 КБ),
+    поэтому время зависит от кол-ва продуктов в запросе, а не от кол-ва найденных рецептов.
+    :param names: названия продуктов в любом написании
+    :param cursor: (совпало продуктов, id рецепта) последнего рецепта предыдущей страницы
+    :param limit: кол-во рецептов на странице
+    :return: IngredientSearchResult
+    """
+    keys = list(dict.fromkeys(key for key in map(tag_key, names) if key))
+    keys = keys[:getattr(settings, 'RECIPE_COOK_MAX_INGREDIENTS', 10)]
+    bitmaps = load_bitmaps(keys) if keys else {}
+    levels = [0] * (len(keys) + 2)
+    for count, bits in enumerate(bitmaps.values(), start=1):
+        for matched in range(count, 1, -1):
+            levels[matched] |= levels[matched - 1] & bits
+        levels[1] |= bits
+
+    matches = []
+    for matched in range(len(keys), 0, -1):
+        if cursor is not None and matched > cursor[0]:
+            continue
+        bits = levels[matched] & ~levels[matched + 1]  # Ровно matched совпавших продуктов
+        # id из курсора не больше старшего бита карты: иначе маска ничего не меняет, а сдвиг на огромный id
+        # из подделанного курсора занял бы всю память
+        if cursor is not None and matched == cursor[0] and cursor[1] <= bits.bit_length():
+            bits &= (1 << max(cursor[1], 0)) - 1
+        # Рецепты уровня берутся со старших битов (новые первыми), один лишний - признак следующей страницы
+        while bits and len(matches) <= limit:
+            recipe_id = bits.bit_length() - 1
+            matches.append(IngredientMatch(recipe_id, matched))
+            bits ^= 1 << recipe_id
+        if len(matches) > limit:
+            break
+
+    next_cursor = None
+    if len(matches) > limit:
+        matches = matches[:limit]
+        next_cursor = (matches[-1].matched, matches[-1].recipe_id)
+    return IngredientSearchResult(matches, next_cursor, levels[1].bit_count(),
+                                  levels[len(keys)].bit_count() if keys else 0, keys)
@@ -0,0 +1,54 @@
+import re
+from typing import Dict, List, Optional
+
+DASHES_RE = re.compile(r'[–—]')
+BRACKETS_RE = re.compile(r'\(.*?\)')
+AMOUNT_RE = re.compile(r'^(?P<quantity>\d+(?:[.,/]\d+)?)?\s*(?P<unit>.*?)[\s.]*$')
+
+
+def parse_amount(text: str) -> Dict[str, Optional[str]]:
+    """
+    Метод разбирает граммовку продукта на количество и единицу измерения.
+    "150гр." -> {'quantity': '150', 'unit': 'гр'}, "по вкусу" -> {'quantity': None, 'unit': 'по вкусу'}
+    :param text: Str
+    :return: Dict
+    """
+    match = AMOUNT_RE.match(text.strip())
+    return {'quantity': match['quantity'], 'unit': match['unit']}
+
+
+def parse_products(products: str) -> List[Dict[str, Optional[str]]]:
+    """
+    Метод разбирает текст поля products ("Мука - 150гр.; Молоко - 1 л.;") на список ингредиентов.
+    Название продукта - первые два слова до дефиса без текста в скобках.
+    Повторяющиеся продукты отбрасываются.
+    :param products: Str
+    :return: List (словари с ключами name, quantity, unit)
+    """
+    if not products:
+        return []
+    ingredients = []
+    seen_names = set()
+    # Нормализуем текст: заменяем все тире/дефисы на единый разделитель
+    normalized_text = DASHES_RE.sub('-', products)
+
+    for line in normalized_text.split(';'):
+        line = line.strip()
+        if not line or '-' not in line:
+            continue
+
+        # Разделяем по первому дефису
+        product_part, amount_part = line.split('-', 1)
+
+        # Удаляем содержимое в скобках (если есть)
+        product_part = BRACKETS_RE.sub('', product_part).strip()
+
+        # Берем первые два слова (игнорируя проценты и другие спецсимволы)
+        words = [word for word in product_part.split() if not word.startswith('%')]
+        name = ' '.join(words[:2])
+
+        if name and name not in seen_names:
+            seen_names.add(name)
+            ingredients.append({'name': name, **parse_amount(amount_part)})
+
+    return ingredients
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.ingredient_index import rebuild_ingredient_index
+from recipes.ingredients import parse_products
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Команда для заполнения поля ingredients у существующих рецептов.
+    bulk_update не вызывает сигналы, поэтому индекс продуктов перестраивается в конце.
+    """
+    help = 'Разбирает поле products существующих рецептов и сохраняет ингредиенты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Сколько рецептов обрабатывать в одной транзакции')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.only('products').order_by('pk')
+        last_pk = 0
+        processed = 0
+        while True:
+            batch = list(recipes.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            for recipe in batch:
+                recipe.ingredients = parse_products(recipe.products)
+            with transaction.atomic():
+                Recipe.objects.bulk_update(batch, ['ingredients'])
+            processed += len(batch)
+            self.stdout.write(f'Обработано рецептов: {processed}')
+
+        rebuild_ingredient_index()
+        self.stdout.write(self.style.SUCCESS(f'Ингредиенты сохранены для {processed} рецептов'))
@@ -0,0 +1,195 @@
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle, islice
+from typing import List, Tuple
+from urllib.parse import unquote, unquote_to_bytes
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test.utils import override_settings
+from django.urls import reverse
+from taggit.models import Tag
+
+from recipes.models import Recipe
+
+# Адрес посетителя вне INTERNAL_IPS, чтобы панель отладки не влияла на замеры
+REMOTE_ADDR = '10.0.0.1'
+
+
+class Command(BaseCommand):
+    """
+    Команда для сравнения пропускной способности WSGI и ASGI на страницах рецептов.
+    Запросы отправляются прямо в обработчик Django внутри процесса (без HTTP-сервера):
+    для WSGI - из пула потоков, для ASGI - из задач asyncio, в обоих случаях по --concurrency одновременно.
+    Под ASGI страницы обслуживают асинхронные варианты представлений (recipes/async_views.py).
+    Маршруты выбираются при загрузке urls.py, поэтому каждый обработчик замеряется в отдельном процессе.
+    Кэш страниц для анонимов по умолчанию отключен, чтобы замерялись сами представления.
+    """
+    help = 'Сравнивает пропускную способность страниц рецептов под WSGI и ASGI'
+    # Проверки проекта загрузили бы маршруты до выбора вариантов представлений
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--handler', choices=['wsgi', 'asgi'],
+                            help='Замерить только один обработчик в текущем процессе')
+        parser.add_argument('--requests', type=int, default=2000, help='Сколько запросов отправить')
+        parser.add_argument('--concurrency', type=int, default=50, help='Сколько запросов выполнять одновременно')
+        parser.add_argument('--sync-views', action='store_true',
+                            help='Под ASGI использовать синхронные представления (через пул потоков)')
+        parser.add_argument('--page-cache', action='store_true', help='Не отключать кэш страниц для анонимов')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests и --concurrency должны быть больше нуля')
+        if not options['handler']:
+            for handler in ('wsgi', 'asgi'):
+                self.run_subprocess(handler, options)
+            return
+
+        if options['handler'] == 'asgi' and not options['sync_views']:
+            settings.RECIPE_ASYNC_VIEWS = True
+        ttl = settings.RECIPE_PAGE_CACHE_TTL if options['page_cache'] else 0
+        with override_settings(RECIPE_PAGE_CACHE_TTL=ttl, ALLOWED_HOSTS=['*']):
+            paths = self.get_paths()
+            urls = list(islice(cycle(paths), options['requests']))
+            if options['handler'] == 'wsgi':
+                elapsed, results = self.run_wsgi(urls, options['concurrency'])
+            else:
+                elapsed, results = asyncio.run(self.run_asgi(urls, options['concurrency']))
+        self.report(options, elapsed, results)
+
+    def run_subprocess(self, handler: str, options: dict) -> None:
+        """
+        Метод запускает замер обработчика в отдельном процессе с теми же параметрами.
+        :param handler: 'wsgi' или 'asgi'
+        :param options: параметры команды
+        :return: None
+        """
+        command = [sys.executable, sys.argv[0], 'benchmark_handlers', '--handler', handler,
+                   '--requests', str(options['requests']), '--concurrency', str(options['concurrency'])]
+        command += ['--sync-views'] if options['sync_views'] else []
+        command += ['--page-cache'] if options['page_cache'] else []
+        self.stdout.flush()
+        if subprocess.run(command).returncode:
+            raise CommandError(f'Замер {handler} завершился с ошибкой')
+
+    @staticmethod
+    def get_paths() -> List[str]:
+        """
+        Метод возвращает адреса страниц для замера: главная, рецепт, облако тегов и рецепты по тегу.
+        :return: List
+        """
+        recipe = Recipe.objects.order_by('-views').only('slug').first()
+        tag = Tag.objects.order_by('pk').first()
+        if recipe is None or tag is None:
+            raise CommandError('В базе нет рецептов или тегов (заполнить можно командой seed_catalog)')
+        return [
+            reverse('home'),
+            reverse('recipe_detail', kwargs={'recipe_slug': recipe.slug}),
+            reverse('tag_cloud_by_category'),
+            reverse('tagged_recipes', kwargs={'tag_slug': tag.slug}),
+        ]
+
+    @staticmethod
+    def run_wsgi(urls: List[str], concurrency: int) -> Tuple[float, list]:
+        """
+        Метод отправляет запросы в WSGI-обработчик из пула потоков.
+        :param urls: адреса запросов
+        :param concurrency: Int
+        :return: Tuple (время в секундах, [(статус, длительность)])
+        """
+        from django.core.wsgi import get_wsgi_application
+        from django.test.client import FakePayload
+        application = get_wsgi_application()
+
+        def request(url: str) -> Tuple[int, float]:
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': unquote_to_bytes(url).decode('iso-8859-1'),
+                'QUERY_STRING': '', 'SCRIPT_NAME': '',
+                'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'REMOTE_ADDR': REMOTE_ADDR, 'wsgi.url_scheme': 'http', 'wsgi.input': FakePayload(b''),
+                'wsgi.errors': sys.stderr, 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+                'wsgi.run_once': False, 'wsgi.version': (1, 0),
+            }
+            status = []
+            started = time.perf_counter()
+            response = application(environ, lambda line, headers, exc_info=None: status.append(line))
+            try:
+                for _ in response:
+                    pass
+            finally:
+                response.close()
+            return int(status[0].split()[0]), time.perf_counter() - started
+
+        def worker(chunk: List[str]) -> list:
+            try:
+                return [request(url) for url in chunk]
+            finally:
+                close_old_connections()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            chunks = executor.map(worker, [urls[index::concurrency] for index in range(concurrency)])
+            results = [result for chunk in chunks for result in chunk]
+        return time.perf_counter() - started, results
+
+    @staticmethod
+    async def run_asgi(urls: List[str], concurrency: int) -> Tuple[float, list]:
+        """
+        Метод отправляет запросы в ASGI-обработчик из задач asyncio.
+        :param urls: адреса запросов
+        :param concurrency: Int
+        :return: Tuple (время в секундах, [(статус, длительность)])
+        """
+        from django.core.asgi import get_asgi_application
+        application = get_asgi_application()
+
+        async def request(url: str) -> Tuple[int, float]:
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': unquote(url), 'raw_path': url.encode(), 'root_path': '', 'query_string': b'',
+                'headers': [(b'host', b'localhost')], 'client': (REMOTE_ADDR, 50000), 'server': ('localhost', 80),
+            }
+            finished = asyncio.Event()
+            messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+            status = []
+
+            async def receive() -> dict:
+                if messages:
+                    return messages.pop()
+                await finished.wait()  # Клиент не отключается, пока ждет ответ
+                return {'type': 'http.disconnect'}
+
+            async def send(message: dict) -> None:
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+                elif not message.get('more_body'):
+                    finished.set()
+
+            started = time.perf_counter()
+            await application(scope, receive, send)
+            return status[0], time.perf_counter() - started
+
+        async def worker(chunk: List[str]) -> list:
+            return [await request(url) for url in chunk]
+
+        started = time.perf_counter()
+        chunks = await asyncio.gather(*(worker(urls[index::concurrency]) for index in range(concurrency)))
+        return time.perf_counter() - started, [result for chunk in chunks for result in chunk]
+
+    def report(self, options: dict, elapsed: float, results: list) -> None:
+        durations = sorted(duration for _, duration in results)
+        errors = sum(status != 200 for status, _ in results)
+        quantiles = statistics.quantiles(durations, n=100) if len(durations) > 1 else durations * 99
+        views = 'синхронные' if options['handler'] == 'wsgi' or options['sync_views'] else 'асинхронные'
+        self.stdout.write(
+            f"{options['handler'].upper()} ({views} представления): {len(results)} запросов, "
+            f"одновременно {options['concurrency']}, {elapsed:.2f} сек., {len(results) / elapsed:.0f} запросов в сек., "
+            f'p50 {quantiles[49] * 1000:.1f} мс, p95 {quantiles[94] * 1000:.1f} мс, p99 {quantiles[98] * 1000:.1f} мс')
+        if errors:
+            self.stdout.write(self.style.WARNING(f'Ответов со статусом не 200: {errors}'))
@@ -0,0 +1,49 @@
+from concurrent.futures import as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from recipes.images import (build_variants, create_pool, get_variants, iter_image_fields, store_variants,
+                            variant_formats, variant_widths)
+
+
+class Command(BaseCommand):
+    """
+    Команда для построения уменьшенных вариантов уже загруженных изображений
+    (рецептов, шагов приготовления и аватаров).
+    """
+    help = 'Строит уменьшенные варианты изображений, у которых их еще нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'IMAGE_VARIANT_WORKERS', 2),
+                            help='Сколько процессов строят варианты')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Сколько объектов обрабатывать за один проход')
+        parser.add_argument('--force', action='store_true', help='Перестроить и уже готовые варианты')
+
+    def handle(self, *args, **options):
+        args = (variant_widths(), variant_formats(), getattr(settings, 'IMAGE_VARIANT_QUALITY', 80))
+        built = 0
+        with create_pool(options['workers']) as executor:
+            for model, fields in iter_image_fields().items():
+                for field_name, variants_field in fields:
+                    objects = (model._default_manager.exclude(Q(**{f'{field_name}__isnull': True}) |
+                                                              Q(**{field_name: ''}))
+                               .only(field_name, variants_field).order_by('pk'))
+                    last_pk = 0
+                    while batch := list(objects.filter(pk__gt=last_pk)[:options['batch_size']]):
+                        last_pk = batch[-1].pk
+                        futures = {
+                            executor.submit(build_variants, getattr(obj, field_name).name, *args): obj.pk
+                            for obj in batch if options['force'] or not get_variants(getattr(obj, field_name))
+                        }
+                        for future in as_completed(futures):
+                            try:
+                                store_variants(model._meta.label, futures[future], field_name, future.result())
+                                built += 1
+                            except Exception as error:  # Битый или пропавший файл не останавливает команду
+                                self.stderr.write(f'{model._meta.label} {futures[future]}: {error}')
+                        self.stdout.write(f'{model._meta.verbose_name_plural}: обработано до id {last_pk}')
+
+        self.stdout.write(self.style.SUCCESS(f'Построены варианты для {built} изображений'))
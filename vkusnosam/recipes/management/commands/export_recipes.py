@@ -0,0 +1,37 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.transfer import export_queryset, open_dump, serialize_recipe
+
+
+class Command(BaseCommand):
+    """
+    Команда для выгрузки каталога рецептов в формате JSON Lines (один рецепт на строку).
+    Рецепты читаются через iterator(chunk_size), поэтому память не растет с размером каталога.
+    """
+    help = 'Выгружает рецепты с тегами, категорией, шагами, оценками и комментариями в JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Файл выгрузки (*.gz - со сжатием, "-" - стандартный вывод)')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Сколько рецептов загружать из базы за один запрос')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        exported = 0
+        dump = open_dump(options['output'], 'wb')
+        try:
+            for recipe in export_queryset().iterator(chunk_size=options['chunk_size']):
+                dump.write(json.dumps(serialize_recipe(recipe), ensure_ascii=False).encode() + b'\n')
+                exported += 1
+                if exported % options['chunk_size'] == 0:
+                    self.stderr.write(f'Выгружено рецептов: {exported} '
+                                      f'({exported / (time.monotonic() - started):.0f} в сек.)')
+        finally:
+            if options['output'] != '-':
+                dump.close()
+
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгружено рецептов: {exported} за {time.monotonic() - started:.1f} сек.'))
@@ -0,0 +1,291 @@
+import datetime
+import json
+import os
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from taggit.models import TaggedItem
+
+from recipes.conditional import bump_catalog_generation
+from recipes.ingredient_index import rebuild_ingredient_index
+from recipes.ingredients import parse_products
+from recipes.models import Comment, Rating, Recipe, RecipeStepPreparing, TagsCategory
+from recipes.page_cache import invalidate_recipe_pages
+from recipes.signal_guard import suppress_signals
+from recipes.slugs import allocate_slugs
+from recipes.tag_cloud import rebuild_tag_usage
+from recipes.tagging import resolve_tags, tag_key
+from recipes.top_lists import most_viewed_recipes, top_rated_recipes
+from recipes.transfer import RECIPE_FIELDS, open_dump
+
+# Поля рецепта, которые перезаписываются, если рецепт с таким slug уже есть в базе.
+# time_update заполняется при вставке (auto_now) и обновляется вместе с рецептом, чтобы сменился ETag страницы
+UPDATE_FIELDS = [field for field in RECIPE_FIELDS if field != 'slug'] + [
+    'image', 'ingredients', 'user', 'tags_category', 'rating_sum', 'rating_count', 'rating_average', 'comments_count',
+    'time_update']
+
+
+def parse_time(value) -> datetime.datetime:
+    """
+    Метод разбирает дату из выгрузки (ISO 8601). Если даты нет - текущее время, как при создании объекта.
+    :param value: Str или None
+    :return: Datetime
+    """
+    return datetime.datetime.fromisoformat(value) if value else timezone.now()
+
+
+class Command(BaseCommand):
+    """
+    Команда для загрузки каталога рецептов из JSON Lines (формат export_recipes).
+    Файл читается построчно, в памяти держится только текущий пакет рецептов.
+    Рецепт с уже существующим slug обновляется, а его шаги, теги, оценки и комментарии заменяются.
+    Рецепту без slug подбирается новый свободный slug по названию, поэтому при повторной загрузке он добавится еще раз.
+    После каждой транзакции в файл контрольной точки записывается позиция в выгрузке,
+    поэтому прерванную загрузку можно продолжить с --resume.
+    Сигналы при bulk_create не вызываются, поэтому счетчики рецептов считаются по выгрузке,
+    а облако тегов, поисковый индекс и варианты изображений пересчитываются в конце.
+    """
+    help = 'Загружает рецепты с тегами, категорией, шагами, оценками и комментариями из JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Файл выгрузки (*.gz - со сжатием, "-" - стандартный ввод)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Сколько рецептов загружать одним bulk_create')
+        parser.add_argument('--transaction-size', type=int, default=2000,
+                            help='Сколько рецептов загружать в одной транзакции (округляется до целых пакетов)')
+        parser.add_argument('--checkpoint', help='Файл контрольной точки (по умолчанию <input>.checkpoint)')
+        parser.add_argument('--resume', action='store_true',
+                            help='Продолжить загрузку с позиции из файла контрольной точки')
+        parser.add_argument('--skip-search-index', action='store_true',
+                            help='Не перестраивать поисковый индекс после загрузки')
+        parser.add_argument('--skip-similar-recipes', action='store_true',
+                            help='Не пересчитывать похожие рецепты после загрузки')
+        parser.add_argument('--skip-image-variants', action='store_true',
+                            help='Не строить уменьшенные варианты загруженных изображений')
+
+    def handle(self, *args, **options):
+        path = options['input']
+        checkpoint_path = options['checkpoint'] or (None if path == '-' else f'{path}.checkpoint')
+        if options['resume'] and not checkpoint_path:
+            raise CommandError('Для загрузки со стандартного ввода нужно указать --checkpoint')
+        position = self.read_checkpoint(checkpoint_path) if options['resume'] else {'offset': 0, 'line': 0}
+        self.content_type = ContentType.objects.get_for_model(Recipe)
+
+        dump = open_dump(path, 'rb')
+        if position['offset']:
+            if path == '-':
+                raise CommandError('Стандартный ввод нельзя продолжить с середины')
+            dump.seek(position['offset'])
+            self.stdout.write(f"Продолжение со строки {position['line'] + 1}")
+
+        started = time.monotonic()
+        imported = 0
+        batches_per_transaction = max(1, options['transaction_size'] // options['batch_size'])
+        lines = self.read_lines(dump, position)
+        try:
+            while True:
+                with transaction.atomic():
+                    loaded = 0
+                    for _ in range(batches_per_transaction):
+                        batch = list(islice(lines, options['batch_size']))
+                        if not batch:
+                            break
+                        self.import_batch([data for data, _ in batch])
+                        loaded += len(batch)
+                        end = batch[-1][1]
+                if not loaded:
+                    break
+                imported += loaded
+                position = end
+                self.write_checkpoint(checkpoint_path, position)
+                self.stdout.write(f"Загружено рецептов: {imported} (строка {position['line']}, "
+                                  f'{imported / (time.monotonic() - started):.0f} в сек.)')
+        finally:
+            if path != '-':
+                dump.close()
+
+        self.stdout.write('Пересчет облака тегов...')
+        rebuild_tag_usage()
+        self.stdout.write('Перестройка индекса продуктов...')
+        rebuild_ingredient_index()
+        if not options['skip_search_index']:
+            call_command('rebuild_search_index', stdout=self.stdout)
+        if not options['skip_similar_recipes']:
+            call_command('rebuild_similar_recipes', stdout=self.stdout)
+        if not options['skip_image_variants']:
+            call_command('build_image_variants', stdout=self.stdout)
+        top_rated_recipes.expire()
+        most_viewed_recipes.expire()
+        bump_catalog_generation()
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено рецептов: {imported} за {elapsed:.1f} сек. ({imported / max(elapsed, 1e-9):.0f} в сек.)'))
+
+    @staticmethod
+    def read_lines(dump, position: dict):
+        """
+        Метод построчно читает выгрузку и возвращает пары (рецепт, позиция после строки).
+        Позиция - смещение в байтах (для распакованного потока у *.gz) и номер строки.
+        :param dump: файл, открытый в бинарном режиме
+        :param position: позиция, с которой начинается чтение
+        :return: Iterator
+        """
+        offset, number = position['offset'], position['line']
+        for line in dump:
+            offset += len(line)
+            number += 1
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError as error:
+                raise CommandError(f'Строка {number}: {error}')
+            if not data.get('slug') and not data.get('name'):
+                raise CommandError(f'Строка {number}: у рецепта нет ни slug, ни названия')
+            yield data, {'offset': offset, 'line': number}
+
+    @staticmethod
+    def read_checkpoint(path: str) -> dict:
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            raise CommandError(f'Файл контрольной точки {path} не найден')
+
+    @staticmethod
+    def write_checkpoint(path, position: dict) -> None:
+        if not path:
+            return
+        # Пишем во временный файл и переименовываем, чтобы при обрыве не остался недописанный файл
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump(position, file)
+        os.replace(f'{path}.tmp', path)
+
+    def get_user_ids(self, batch: list) -> dict:
+        """
+        Метод возвращает {username: id} для авторов, оценщиков и комментаторов пакета.
+        Отсутствующие пользователи создаются без пароля (войти они смогут после сброса пароля).
+        :param batch: рецепты из выгрузки
+        :return: Dict
+        """
+        user_model = get_user_model()
+        names = {data['author'] for data in batch if data.get('author')}
+        for data in batch:
+            names.update(item['user'] for item in data.get('ratings', []) + data.get('comments', []))
+        user_ids = dict(user_model.objects.filter(username__in=names).values_list('username', 'pk'))
+        missing = names - user_ids.keys()
+        if missing:
+            user_model.objects.bulk_create([user_model(username=name, password='!') for name in missing],
+                                           ignore_conflicts=True)
+            user_ids.update(user_model.objects.filter(username__in=missing).values_list('username', 'pk'))
+        return user_ids
+
+    @staticmethod
+    def get_category_ids(batch: list) -> dict:
+        """
+        Метод возвращает {slug: id} для категорий пакета, создавая отсутствующие.
+        :param batch: рецепты из выгрузки
+        :return: Dict
+        """
+        categories = {data['category']['slug']: data['category']['name'] for data in batch if data.get('category')}
+        category_ids = dict(TagsCategory.objects.filter(slug__in=categories).values_list('slug', 'pk'))
+        missing = categories.keys() - category_ids.keys()
+        if missing:
+            TagsCategory.objects.bulk_create([TagsCategory(slug=slug, name=categories[slug]) for slug in missing],
+                                             ignore_conflicts=True)
+            category_ids.update(TagsCategory.objects.filter(slug__in=missing).values_list('slug', 'pk'))
+        return category_ids
+
+    @staticmethod
+    def get_tag_ids(batch: list) -> dict:
+        """
+        Метод возвращает {нормализованное название: id} для тегов пакета (см. tagging.resolve_tags),
+        поэтому разные написания одного продукта получают один тег.
+        :param batch: рецепты из выгрузки
+        :return: Dict
+        """
+        return resolve_tags({name for data in batch for name in data.get('tags', [])})
+
+    def import_batch(self, batch: list) -> None:
+        """
+        Метод загружает пакет рецептов: обновляет или создает рецепты по slug
+        и заменяет их шаги, теги, оценки и комментарии.
+        :param batch: рецепты из выгрузки
+        :return: None
+        """
+        # Рецептам без slug (выгрузки из других источников) slug подбирается по названию сразу для всего пакета
+        without_slug = [data for data in batch if not data.get('slug')]
+        for data, slug in zip(without_slug, allocate_slugs(Recipe, [data['name'] for data in without_slug])):
+            data['slug'] = slug
+        # Если slug повторяется в пакете, побеждает последняя строка, как при загрузке по одной
+        batch = list({data['slug']: data for data in batch}.values())
+        user_ids = self.get_user_ids(batch)
+        category_ids = self.get_category_ids(batch)
+        tag_ids = self.get_tag_ids(batch)
+
+        recipes = []
+        for data in batch:
+            scores = [rating['score'] for rating in data.get('ratings', [])]
+            recipe = Recipe(**{field: data.get(field) for field in RECIPE_FIELDS})
+            recipe.views = recipe.views or 0
+            recipe.image = data.get('image') or None
+            recipe.ingredients = parse_products(recipe.products)
+            recipe.user_id = user_ids.get(data.get('author'))
+            recipe.tags_category_id = category_ids.get((data.get('category') or {}).get('slug'))
+            recipe.rating_sum = sum(scores)
+            recipe.rating_count = len(scores)
+            recipe.rating_average = sum(scores) / len(scores) if scores else 0
+            recipe.comments_count = len(data.get('comments', []))
+            recipes.append(recipe)
+        Recipe.objects.bulk_create(recipes, update_conflicts=True, unique_fields=['slug'], update_fields=UPDATE_FIELDS)
+
+        # id обновленных рецептов bulk_create возвращает не на всех базах, поэтому берем их по slug
+        recipe_ids = dict(Recipe.objects.filter(slug__in=[data['slug'] for data in batch]).values_list('slug', 'pk'))
+        for recipe, data in zip(recipes, batch):
+            recipe.pk = recipe_ids[recipe.slug]
+            recipe.time_create = parse_time(data.get('time_create'))
+        # time_create заполняется при вставке (auto_now_add), поэтому даты создания выставляются отдельно
+        Recipe.objects.bulk_update(recipes, ['time_create'])
+        # bulk_create не вызывает сигналы, поэтому закэшированные страницы обновленных рецептов сбрасываются здесь
+        invalidate_recipe_pages(recipe_ids.values())
+
+        # Обработчики сигналов при удалении прежних связанных объектов отключены: счетчики рецептов
+        # уже посчитаны по выгрузке, а облако тегов и похожие рецепты пересчитываются в конце загрузки
+        ids = list(recipe_ids.values())
+        with suppress_signals():
+            RecipeStepPreparing.objects.filter(recipe_id__in=ids).delete()
+            Rating.objects.filter(recipe_id__in=ids).delete()
+            Comment.objects.filter(recipe_id__in=ids).delete()
+            TaggedItem.objects.filter(content_type=self.content_type, object_id__in=ids).delete()
+
+        steps, tagged_items, ratings, comments = [], [], [], []
+        for data in batch:
+            recipe_id = recipe_ids[data['slug']]
+            author_id = user_ids.get(data.get('author'))
+            if author_id:  # Шаг без автора сохранить нельзя
+                steps += [RecipeStepPreparing(recipe_id=recipe_id, users_id=author_id,
+                                              step_description=step.get('description'), step_image=step.get('image'))
+                          for step in data.get('steps', [])]
+            recipe_tag_ids = {tag_ids[key] for key in map(tag_key, data.get('tags', [])) if key in tag_ids}
+            tagged_items += [TaggedItem(tag_id=tag_id, content_type=self.content_type, object_id=recipe_id)
+                             for tag_id in recipe_tag_ids]
+            ratings += [Rating(recipe_id=recipe_id, user_id=user_ids[rating['user']], score=rating['score'])
+                        for rating in data.get('ratings', [])]
+            comments += [Comment(recipe_id=recipe_id, user_id=user_ids[comment['user']], content=comment['content'])
+                         for comment in data.get('comments', [])]
+        RecipeStepPreparing.objects.bulk_create(steps)
+        TaggedItem.objects.bulk_create(tagged_items)
+        Rating.objects.bulk_create(ratings)
+        Comment.objects.bulk_create(comments)
+        created = [comment for data in batch for comment in data.get('comments', [])]
+        for comment, data in zip(comments, created):
+            comment.time_create = parse_time(data.get('time_create'))
+        Comment.objects.bulk_update(comments, ['time_create'])
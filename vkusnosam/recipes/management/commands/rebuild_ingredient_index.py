@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.ingredient_index import rebuild_ingredient_index
+
+
+class Command(BaseCommand):
+    """
+    Команда для полной перестройки индекса продуктов (битовых карт рецептов для поиска по продуктам).
+    Индекс обновляется сигналами при сохранении рецептов, перестройка нужна после загрузки
+    рецептов через bulk_create или изменения правил нормализации названий.
+    """
+    help = 'Перестраивает индекс продуктов для поиска рецептов по продуктам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Сколько рецептов читать одним запросом')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        keys = rebuild_ingredient_index(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Индекс продуктов перестроен за {time.monotonic() - started:.1f} сек., продуктов: {keys}'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import Recipe
+from recipes.search import get_search_backend
+
+
+class Command(BaseCommand):
+    """
+    Команда для полной перестройки поискового индекса рецептов.
+    """
+    help = 'Перестраивает поисковый индекс рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Сколько рецептов индексировать в одной транзакции')
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.setup()
+        backend.clear()
+        recipes = Recipe.objects.only('name', 'description', 'products').order_by('pk')
+        last_pk = 0
+        indexed = 0
+        while True:
+            batch = list(recipes.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            with transaction.atomic():
+                backend.index(batch)
+            indexed += len(batch)
+            self.stdout.write(f'Проиндексировано рецептов: {indexed}')
+
+        self.stdout.write(self.style.SUCCESS(f'Поисковый индекс перестроен, рецептов: {indexed}'))
@@ -0,0 +1,94 @@
+import multiprocessing
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.conditional import bump_catalog_generation
+from recipes.minhash import MAX_BUCKET_SIZE, band_buckets, init_neighbours_worker, neighbours_chunk, signatures_chunk
+from recipes.models import Recipe, RecipeSignature, SignatureBucket, SimilarRecipe
+from recipes.page_cache import invalidate_recipe_pages
+from recipes.similar import recipe_features, save_similar, save_signatures, similar_count, similar_min_score
+
+
+class Command(BaseCommand):
+    """
+    Команда для полного пересчета похожих рецептов (см. recipes/similar.py).
+    Сигнатуры и соседи считаются в пуле процессов: сначала MinHash-сигнатуры всех рецептов,
+    затем процессы получают сигнатуры и корзины LSH и подбирают соседей для своих пакетов рецептов.
+    Процессы запускаются через spawn (как и в recipes/images.py) и не обращаются к базе.
+    """
+    help = 'Пересчитывает похожие рецепты для всех рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'RECIPE_SIMILAR_WORKERS', 2),
+                            help='Сколько процессов считают сигнатуры и соседей')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Сколько рецептов читать, записывать и отдавать процессу за раз')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers и --batch-size должны быть больше нуля')
+        started = time.monotonic()
+        batch_size = options['batch_size']
+        context = multiprocessing.get_context('spawn')
+
+        with ProcessPoolExecutor(max_workers=options['workers'], mp_context=context) as executor:
+            chunks = (list(recipe_features(ids).items()) for ids in self.iter_id_batches(batch_size))
+            signatures = {}
+            for chunk in executor.map(signatures_chunk, chunks):
+                signatures.update(chunk)
+                self.stdout.write(f'Сигнатуры: {len(signatures)}')
+
+        # Корзины из одного рецепта кандидатов не дают, а слишком большие пропускаются, поэтому в процессы не передаются
+        members = {}
+        for recipe_id, data in signatures.items():
+            for bucket in band_buckets(array('I', data)):
+                members.setdefault(bucket, []).append(recipe_id)
+        buckets = {bucket: ids for bucket, ids in members.items() if 1 < len(ids) <= MAX_BUCKET_SIZE}
+        del members
+
+        recipe_ids = sorted(signatures)
+        lists = {}
+        task = partial(neighbours_chunk, count=similar_count(), min_score=similar_min_score())
+        with ProcessPoolExecutor(max_workers=options['workers'], mp_context=context,
+                                 initializer=init_neighbours_worker, initargs=(signatures, buckets)) as executor:
+            batches = (recipe_ids[start:start + batch_size] for start in range(0, len(recipe_ids), batch_size))
+            for chunk in executor.map(task, batches):
+                lists.update(chunk)
+                self.stdout.write(f'Соседи: {len(lists)} из {len(recipe_ids)}')
+
+        with transaction.atomic():
+            RecipeSignature.objects.all().delete()
+            SignatureBucket.objects.all().delete()
+            SimilarRecipe.objects.all().delete()
+            for start in range(0, len(recipe_ids), batch_size):
+                batch = recipe_ids[start:start + batch_size]
+                save_signatures({pk: array('I', signatures[pk]) for pk in batch})
+                save_similar({pk: lists[pk] for pk in batch})
+            # Списки похожих выводятся на страницах рецептов, поэтому их ETag должны смениться
+            Recipe.objects.update(time_update=timezone.now())
+            bump_catalog_generation()
+            invalidate_recipe_pages(recipe_ids)
+        pairs = sum(len(neighbours) for neighbours in lists.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Похожие рецепты пересчитаны за {time.monotonic() - started:.1f} сек.: '
+            f'рецептов {len(recipe_ids)}, пар {pairs}'))
+
+    @staticmethod
+    def iter_id_batches(batch_size: int):
+        """
+        Метод возвращает id всех рецептов пакетами по возрастанию.
+        :param batch_size: Int
+        :return: Iterator
+        """
+        ids = Recipe.objects.order_by('pk').values_list('pk', flat=True)
+        last_pk = 0
+        while batch := list(ids.filter(pk__gt=last_pk)[:batch_size]):
+            last_pk = batch[-1]
+            yield batch
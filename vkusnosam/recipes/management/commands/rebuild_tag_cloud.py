@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from recipes.tag_cloud import rebuild_tag_usage
+
+
+class Command(BaseCommand):
+    """
+    Команда для полного пересчета облака тегов.
+    """
+    help = 'Пересчитывает кол-во использований и веса тегов по категориям'
+
+    def handle(self, *args, **options):
+        created = rebuild_tag_usage()
+        self.stdout.write(self.style.SUCCESS(f'Облако тегов пересчитано, строк: {created}'))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from recipes.models import Comment, Rating, Recipe
+
+
+class Command(BaseCommand):
+    """
+    Команда для пересчета сохраненных агрегатов рецептов по таблицам оценок и комментариев.
+    Используется для заполнения полей после их добавления и для исправления рассинхронизации.
+    """
+    help = 'Пересчитывает сумму и кол-во оценок, средний рейтинг и кол-во комментариев каждого рецепта'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Сколько рецептов обрабатывать в одной транзакции')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = 0
+        updated = 0
+        while True:
+            recipe_ids = list(Recipe.objects.filter(pk__gt=last_pk).order_by('pk')
+                              .values_list('pk', flat=True)[:batch_size])
+            if not recipe_ids:
+                break
+            last_pk = recipe_ids[-1]
+
+            stats = {
+                row['recipe_id']: row for row in
+                Rating.objects.filter(recipe_id__in=recipe_ids).values('recipe_id')
+                .annotate(total=Sum('score'), quantity=Count('id')).order_by()
+            }
+            comments = dict(Comment.objects.filter(recipe_id__in=recipe_ids).values('recipe_id')
+                            .annotate(quantity=Count('id')).order_by().values_list('recipe_id', 'quantity'))
+            recipes = []
+            for pk in recipe_ids:
+                row = stats.get(pk, {'total': 0, 'quantity': 0})
+                recipes.append(Recipe(pk=pk, rating_sum=row['total'], rating_count=row['quantity'],
+                                      rating_average=row['total'] / row['quantity'] if row['quantity'] else 0,
+                                      comments_count=comments.get(pk, 0)))
+            with transaction.atomic():
+                Recipe.objects.bulk_update(recipes, ['rating_sum', 'rating_count', 'rating_average', 'comments_count'])
+            updated += len(recipes)
+            self.stdout.write(f'Обработано рецептов: {updated}')
+
+        self.stdout.write(self.style.SUCCESS(f'Агрегаты пересчитаны для {updated} рецептов'))
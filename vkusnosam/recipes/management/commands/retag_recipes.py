@@ -0,0 +1,55 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from recipes.conditional import bump_catalog_generation
+from recipes.models import Recipe
+from recipes.tag_cloud import rebuild_tag_usage
+from recipes.tagging import delete_unused_tags, register_existing_tags, sync_recipe_tags
+
+
+class Command(BaseCommand):
+    """
+    Команда для перевода всего каталога на нормализованные теги продуктов (см. recipes/tagging.py).
+    Сначала существующим тегам записываются нормализованные названия (основным становится самый
+    используемый из написаний), затем теги рецептов пакетами приводятся к продуктам из поля ingredients.
+    Облако тегов и похожие рецепты пересчитываются один раз в конце, а теги, оставшиеся без рецептов, удаляются.
+    Команду можно запускать повторно: рецепты с актуальными тегами не изменяются.
+    """
+    help = 'Приводит теги всех рецептов к нормализованным названиям продуктов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Сколько рецептов обрабатывать в одной транзакции')
+        parser.add_argument('--keep-unused', action='store_true',
+                            help='Не удалять теги, которые остались без рецептов')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        registered = register_existing_tags()
+        self.stdout.write(f'Нормализованных названий для существующих тегов: {registered}')
+
+        recipes = Recipe.objects.only('ingredients', 'tags_category_id').order_by('pk')
+        last_pk = 0
+        processed = added = removed = 0
+        while True:
+            batch = list(recipes.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            batch_added, batch_removed = sync_recipe_tags(batch, update_usage=False, update_similar=False)
+            processed += len(batch)
+            added += batch_added
+            removed += batch_removed
+            self.stdout.write(f'Обработано рецептов: {processed} (добавлено связей: {added}, удалено: {removed}, '
+                              f'{processed / (time.monotonic() - started):.0f} в сек.)')
+
+        if not options['keep_unused']:
+            self.stdout.write(f'Удалено тегов без рецептов: {delete_unused_tags()}')
+        self.stdout.write('Пересчет облака тегов...')
+        rebuild_tag_usage()
+        call_command('rebuild_similar_recipes', stdout=self.stdout)
+        bump_catalog_generation()
+        self.stdout.write(self.style.SUCCESS(
+            f'Теги обновлены у {processed} рецептов за {time.monotonic() - started:.1f} сек.'))
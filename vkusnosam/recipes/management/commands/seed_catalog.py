@@ -0,0 +1,291 @@
+import datetime
+import random
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from taggit.models import TaggedItem
+
+from recipes.conditional import bump_catalog_generation
+from recipes.ingredient_index import rebuild_ingredient_index
+from recipes.ingredients import parse_products
+from recipes.models import Comment, Rating, Recipe, RecipeStepPreparing, TagsCategory
+from recipes.slugs import allocate_slugs
+from recipes.tag_cloud import rebuild_tag_usage
+from recipes.tagging import resolve_tags, tag_key
+from recipes.top_lists import most_viewed_recipes, top_rated_recipes
+
+# Категории тегов: (название, slug)
+CATEGORIES = [
+    ('Супы', 'soups'), ('Салаты', 'salads'), ('Горячие блюда', 'main-dishes'), ('Выпечка', 'bakery'),
+    ('Десерты', 'desserts'), ('Закуски', 'snacks'), ('Напитки', 'drinks'), ('Завтраки', 'breakfasts'),
+]
+
+# Продукты и варианты граммовок к ним
+PRODUCTS = {
+    'Мука пшеничная': ['200 гр.', '300 гр.', '500 гр.', '1 стакан'],
+    'Молоко': ['200 мл.', '500 мл.', '1 л.', '1 стакан'],
+    'Яйцо куриное': ['1 шт.', '2 шт.', '3 шт.', '4 шт.'],
+    'Сахар': ['1 ст.л.', '50 гр.', '100 гр.', '150 гр.'],
+    'Соль': ['по вкусу', '1 ч.л.', '0.5 ч.л.'],
+    'Перец черный': ['по вкусу', '1 щепотка'],
+    'Масло сливочное': ['20 гр.', '50 гр.', '100 гр.', '200 гр.'],
+    'Масло растительное': ['1 ст.л.', '2 ст.л.', '50 мл.'],
+    'Картофель': ['3 шт.', '500 гр.', '1 кг.'],
+    'Морковь': ['1 шт.', '2 шт.', '150 гр.'],
+    'Лук репчатый': ['1 шт.', '2 шт.', '100 гр.'],
+    'Чеснок': ['2 зубчика', '3 зубчика', '1 головка'],
+    'Свекла': ['1 шт.', '2 шт.', '300 гр.'],
+    'Капуста белокочанная': ['300 гр.', '500 гр.', '1/4 кочана'],
+    'Помидор': ['2 шт.', '3 шт.', '300 гр.'],
+    'Огурец': ['1 шт.', '2 шт.', '200 гр.'],
+    'Перец болгарский': ['1 шт.', '2 шт.'],
+    'Говядина': ['300 гр.', '500 гр.', '700 гр.'],
+    'Свинина': ['300 гр.', '500 гр.', '1 кг.'],
+    'Куриное филе': ['300 гр.', '400 гр.', '600 гр.'],
+    'Фарш мясной': ['300 гр.', '500 гр.'],
+    'Рыба': ['400 гр.', '600 гр.'],
+    'Рис': ['100 гр.', '200 гр.', '1 стакан'],
+    'Гречка': ['200 гр.', '1 стакан'],
+    'Макароны': ['200 гр.', '400 гр.'],
+    'Сметана': ['2 ст.л.', '100 гр.', '200 гр.'],
+    'Сыр твердый': ['100 гр.', '150 гр.', '200 гр.'],
+    'Творог': ['200 гр.', '400 гр.'],
+    'Сливки': ['100 мл.', '200 мл.'],
+    'Грибы шампиньоны': ['200 гр.', '300 гр.'],
+    'Зелень': ['по вкусу', '1 пучок'],
+    'Лавровый лист': ['1 шт.', '2 шт.'],
+    'Разрыхлитель': ['1 ч.л.', '10 гр.'],
+    'Ванилин': ['1 щепотка', '1 пакетик'],
+    'Какао': ['2 ст.л.', '30 гр.'],
+    'Яблоко': ['1 шт.', '2 шт.', '3 шт.'],
+    'Лимон': ['0.5 шт.', '1 шт.'],
+    'Мед': ['1 ст.л.', '2 ст.л.'],
+    'Орехи грецкие': ['50 гр.', '100 гр.'],
+    'Майонез': ['2 ст.л.', '100 гр.'],
+}
+
+DISHES = ['Борщ', 'Суп', 'Салат', 'Пирог', 'Запеканка', 'Рагу', 'Плов', 'Котлеты', 'Блины', 'Оладьи',
+          'Омлет', 'Каша', 'Шарлотка', 'Кекс', 'Печенье', 'Жаркое', 'Гуляш', 'Паста', 'Пицца', 'Морс']
+ADJECTIVES = ['Домашний', 'Быстрый', 'Праздничный', 'Бабушкин', 'Летний', 'Зимний', 'Простой', 'Нежный',
+              'Сытный', 'Легкий', 'Пышный', 'Ароматный']
+DESCRIPTIONS = ['Готовится быстро и без хлопот.', 'Рецепт проверен временем.', 'Подходит для всей семьи.',
+                'Отличный вариант для праздничного стола.', 'Можно подавать горячим и холодным.',
+                'Блюдо получается сочным и ароматным.', 'Понравится даже детям.']
+STEPS = ['Подготовьте все продукты.', 'Нарежьте овощи кубиками.', 'Обжарьте на среднем огне до золотистого цвета.',
+         'Перемешайте и доведите до кипения.', 'Тушите под крышкой 20 минут.', 'Выпекайте в духовке при 180 градусах.',
+         'Посолите и поперчите по вкусу.', 'Дайте настояться 10 минут.', 'Подавайте с зеленью.']
+COMMENTS = ['Очень вкусно, спасибо за рецепт!', 'Готовила по этому рецепту, всем понравилось.',
+            'Добавил немного больше чеснока - отлично.', 'Получилось суховато, в следующий раз добавлю сметаны.',
+            'Простой и понятный рецепт.', 'Теперь готовлю только так!', 'Семья в восторге.',
+            'А можно заменить муку на цельнозерновую?']
+# Вес каждой оценки 1..5 при случайном выборе (оценок 4 и 5 больше, как на реальном сайте)
+SCORE_WEIGHTS = [1, 2, 4, 8, 10]
+
+
+class Command(BaseCommand):
+    """
+    Команда для наполнения базы синтетическим каталогом для нагрузочного тестирования.
+    Все объекты создаются через bulk_create пакетами, каждый пакет - в отдельной транзакции.
+    При одинаковых --seed и --now на одной и той же базе создаются одинаковые данные.
+    Сигналы при bulk_create не вызываются, поэтому счетчики рецептов заполняются сразу,
+    а облако тегов и поисковый индекс пересчитываются в конце.
+    """
+    help = 'Создает пользователей, рецепты, шаги, теги, комментарии и оценки для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Сколько пользователей создать')
+        parser.add_argument('--recipes', type=int, default=10000, help='Сколько рецептов создать')
+        parser.add_argument('--comments', type=int, default=5, help='Среднее кол-во комментариев у рецепта')
+        parser.add_argument('--ratings', type=int, default=5, help='Среднее кол-во оценок у рецепта')
+        parser.add_argument('--steps', type=int, default=5, help='Среднее кол-во шагов приготовления у рецепта')
+        parser.add_argument('--days', type=int, default=365, help='За сколько дней распределить даты создания')
+        parser.add_argument('--seed', type=int, default=0, help='Начальное значение генератора случайных чисел')
+        parser.add_argument('--now', default='2025-01-01T00:00:00+00:00',
+                            help='Момент, от которого отсчитываются даты (ISO 8601): с постоянным значением '
+                                 'даты при одинаковом --seed тоже одинаковые')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Сколько рецептов создавать в одной транзакции')
+        parser.add_argument('--skip-search-index', action='store_true',
+                            help='Не перестраивать поисковый индекс после создания рецептов')
+        parser.add_argument('--skip-similar-recipes', action='store_true',
+                            help='Не пересчитывать похожие рецепты после создания рецептов')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.now = parse_datetime(options['now'])
+        if self.now is None or self.now.tzinfo is None:
+            raise CommandError('--now: нужны дата, время и часовой пояс, например 2025-01-01T00:00:00+00:00')
+        self.days = options['days']
+        started = time.monotonic()
+
+        user_ids = self.create_users(options['users'], options['batch_size'])
+        if not user_ids:
+            self.stderr.write('Нужен хотя бы один пользователь')
+            return
+        category_ids = self.create_categories()
+        tag_ids = self.create_tags()
+        content_type = ContentType.objects.get_for_model(Recipe)
+
+        created = 0
+        while created < options['recipes']:
+            size = min(options['batch_size'], options['recipes'] - created)
+            with transaction.atomic():
+                self.create_recipes_batch(size, user_ids, category_ids, tag_ids, content_type, options)
+            created += size
+            self.stdout.write(f'Создано рецептов: {created} ({created / (time.monotonic() - started):.0f} в сек.)')
+
+        self.stdout.write('Пересчет облака тегов...')
+        rebuild_tag_usage()
+        self.stdout.write('Перестройка индекса продуктов...')
+        rebuild_ingredient_index()
+        if not options['skip_search_index']:
+            call_command('rebuild_search_index', stdout=self.stdout)
+        if not options['skip_similar_recipes']:
+            call_command('rebuild_similar_recipes', stdout=self.stdout)
+        top_rated_recipes.expire()
+        most_viewed_recipes.expire()
+        bump_catalog_generation()
+        self.stdout.write(self.style.SUCCESS(
+            f'Каталог создан за {time.monotonic() - started:.1f} сек.: пользователей {len(user_ids)}, '
+            f'рецептов {created}'))
+
+    def random_time(self) -> datetime.datetime:
+        """
+        Метод возвращает случайный момент за --days дней до --now.
+        :return: Datetime
+        """
+        return self.now - datetime.timedelta(seconds=self.rng.randrange(max(self.days, 1) * 86400))
+
+    def random_count(self, average: int) -> int:
+        """
+        Метод возвращает случайное кол-во объектов со средним значением average.
+        :param average: Int
+        :return: Int
+        """
+        return self.rng.randint(0, 2 * average) if average > 0 else 0
+
+    def create_users(self, count: int, batch_size: int) -> list:
+        """
+        Метод создает пользователей seed_user_N и возвращает id всех таких пользователей.
+        Пароль у всех одинаковый (seed-password) и хешируется один раз.
+        :param count: Int
+        :param batch_size: Int
+        :return: List
+        """
+        user_model = get_user_model()
+        seeded = user_model.objects.filter(username__startswith='seed_user_')
+        start = seeded.count()
+        password = make_password('seed-password')
+        users = (user_model(username=f'seed_user_{start + i}', email=f'seed_user_{start + i}@example.com',
+                            password=password, date_joined=self.random_time()) for i in range(count))
+        while batch := list(islice(users, batch_size)):
+            with transaction.atomic():
+                user_model.objects.bulk_create(batch)
+        user_ids = list(seeded.order_by('pk').values_list('pk', flat=True))
+        self.stdout.write(f'Пользователей для каталога: {len(user_ids)}')
+        return user_ids
+
+    def create_categories(self) -> list:
+        """
+        Метод создает недостающие категории тегов и возвращает их id.
+        :return: List
+        """
+        TagsCategory.objects.bulk_create([TagsCategory(name=name, slug=slug) for name, slug in CATEGORIES],
+                                         ignore_conflicts=True)
+        return list(TagsCategory.objects.order_by('pk').values_list('pk', flat=True))
+
+    def create_tags(self) -> dict:
+        """
+        Метод создает теги для всех продуктов словаря и возвращает {нормализованное название: id тега}
+        (см. tagging.resolve_tags).
+        :return: Dict
+        """
+        return resolve_tags(ingredient['name'] for product in PRODUCTS
+                            for ingredient in parse_products(f'{product} - 1 шт.;'))
+
+    def make_products(self) -> str:
+        """
+        Метод составляет текст поля products в формате формы рецепта ("Мука - 150 гр.;" на каждой строке).
+        :return: Str
+        """
+        products = self.rng.sample(list(PRODUCTS), self.rng.randint(3, 10))
+        return ''.join(f'{product} - {self.rng.choice(PRODUCTS[product])};\n' for product in products)
+
+    def create_recipes_batch(self, size: int, user_ids: list, category_ids: list, tag_ids: dict,
+                             content_type: ContentType, options: dict) -> None:
+        """
+        Метод создает пакет рецептов вместе с шагами, тегами, комментариями и оценками.
+        :param size: кол-во рецептов в пакете
+        :param user_ids: id пользователей, из которых выбираются авторы, комментаторы и оценщики
+        :param category_ids: id категорий тегов
+        :param tag_ids: {нормализованное название: id тега}
+        :param content_type: тип содержимого Recipe для связей taggit
+        :param options: параметры команды
+        :return: None
+        """
+        rng = self.rng
+        recipes = []
+        ratings = []
+        comments = []
+        for _ in range(size):
+            products = self.make_products()
+            recipe_ratings = [(user_id, rng.choices(range(1, 6), SCORE_WEIGHTS)[0]) for user_id in
+                              rng.sample(user_ids, min(self.random_count(options['ratings']), len(user_ids)))]
+            recipe_comments = [(rng.choice(user_ids), rng.choice(COMMENTS))
+                               for _ in range(self.random_count(options['comments']))]
+            rating_sum = sum(score for _, score in recipe_ratings)
+            recipes.append(Recipe(
+                name=f'{rng.choice(ADJECTIVES)} {rng.choice(DISHES).lower()}',
+                description=' '.join(rng.sample(DESCRIPTIONS, 2)),
+                products=products,
+                ingredients=parse_products(products),
+                user_id=rng.choice(user_ids),
+                tags_category_id=rng.choice(category_ids),
+                views=int(rng.paretovariate(1.2) * 10),
+                number_servings=rng.randint(1, 8),
+                time_preparing=rng.choice([15, 20, 30, 45, 60, 90, 120]),
+                calorie=rng.randint(50, 900),
+                rating_sum=rating_sum,
+                rating_count=len(recipe_ratings),
+                rating_average=rating_sum / len(recipe_ratings) if recipe_ratings else 0,
+                comments_count=len(recipe_comments),
+            ))
+            ratings.append(recipe_ratings)
+            comments.append(recipe_comments)
+
+        for recipe, slug in zip(recipes, allocate_slugs(Recipe, [recipe.name for recipe in recipes])):
+            recipe.slug = slug
+        Recipe.objects.bulk_create(recipes)
+        # time_create и time_update заполняются при вставке (auto_now_add, auto_now), поэтому даты выставляются отдельно
+        for recipe in recipes:
+            recipe.time_create = recipe.time_update = self.random_time()
+        Recipe.objects.bulk_update(recipes, ['time_create', 'time_update'])
+
+        steps = []
+        tagged_items = []
+        new_comments = []
+        new_ratings = []
+        for recipe, recipe_ratings, recipe_comments in zip(recipes, ratings, comments):
+            steps += [RecipeStepPreparing(recipe=recipe, users_id=recipe.user_id, step_description=description)
+                      for description in rng.sample(STEPS, min(self.random_count(options['steps']), len(STEPS)))]
+            recipe_tag_ids = {tag_ids[key] for key in map(tag_key, recipe.ingredient_names) if key in tag_ids}
+            tagged_items += [TaggedItem(tag_id=tag_id, content_type=content_type, object_id=recipe.pk)
+                             for tag_id in recipe_tag_ids]
+            new_ratings += [Rating(recipe=recipe, user_id=user_id, score=score) for user_id, score in recipe_ratings]
+            new_comments += [Comment(recipe=recipe, user_id=user_id, content=content)
+                             for user_id, content in recipe_comments]
+
+        RecipeStepPreparing.objects.bulk_create(steps)
+        TaggedItem.objects.bulk_create(tagged_items)
+        Rating.objects.bulk_create(new_ratings)
+        Comment.objects.bulk_create(new_comments)
+        for comment in new_comments:
+            comment.time_create = comment.time_update = max(comment.recipe.time_create, self.random_time())
+        Comment.objects.bulk_update(new_comments, ['time_create', 'time_update'])
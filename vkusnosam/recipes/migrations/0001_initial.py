@@ -0,0 +1,101 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Comment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content', models.TextField(verbose_name='Комментарий')),
+                ('time_create', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('time_update', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Комментарий',
+                'verbose_name_plural': 'Комментарии',
+            },
+        ),
+        migrations.CreateModel(
+            name='Rating',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.IntegerField(choices=[(1, 1), (2, 2), (3, 3), (4, 4), (5, 5)], verbose_name='Счет')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг',
+                'verbose_name_plural': 'Рейтинги',
+            },
+        ),
+        migrations.CreateModel(
+            name='Recipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(db_index=True, max_length=255, verbose_name='Название блюда')),
+                ('slug', models.CharField(blank=True, db_index=True, max_length=255, unique=True, verbose_name='Slug')),
+                ('image', models.ImageField(blank=True, default=None, null=True, upload_to='recipe_image/%Y/%m/%d', verbose_name='Изображения рецепта')),
+                ('description', models.TextField(blank=True, verbose_name='Описание рецепта')),
+                ('products', models.TextField(blank=True, verbose_name='Какие продукты')),
+                ('ingredients', models.JSONField(blank=True, default=list, editable=False, verbose_name='Ингредиенты')),
+                ('views', models.PositiveIntegerField(default=0, verbose_name='Кол-во просмотров')),
+                ('number_servings', models.PositiveIntegerField(blank=True, null=True, verbose_name='Кол-во порций')),
+                ('time_preparing', models.PositiveIntegerField(blank=True, null=True, verbose_name='Время приготовления')),
+                ('calorie', models.PositiveIntegerField(blank=True, null=True, verbose_name='Калорийность')),
+                ('time_create', models.DateTimeField(auto_now_add=True, verbose_name='Время создания')),
+                ('rating_sum', models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')),
+                ('rating_count', models.PositiveIntegerField(default=0, verbose_name='Кол-во оценок')),
+                ('rating_average', models.FloatField(default=0, verbose_name='Средний рейтинг')),
+                ('comments_count', models.PositiveIntegerField(default=0, verbose_name='Кол-во комментариев')),
+            ],
+            options={
+                'verbose_name': 'Рецепт',
+                'verbose_name_plural': 'Рецепты',
+                'ordering': ['-time_create'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeStepPreparing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('step_image', models.ImageField(blank=True, default=None, null=True, upload_to='recipe_step_preparing/None/%Y/%m/%d', verbose_name='Изображения пошагового приготовления')),
+                ('step_description', models.TextField(blank=True, null=True, verbose_name='Описание шага приготовления')),
+            ],
+            options={
+                'verbose_name': 'Шаг приготовления рецепта',
+                'verbose_name_plural': 'Шаги приготовления рецепта',
+            },
+        ),
+        migrations.CreateModel(
+            name='TagsCategory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(db_index=True, max_length=100, verbose_name='Категория тега')),
+                ('slug', models.CharField(db_index=True, max_length=100, unique=True, verbose_name='Слаг')),
+            ],
+            options={
+                'verbose_name': 'Категории тега',
+                'verbose_name_plural': 'Категория тегов',
+            },
+        ),
+        migrations.CreateModel(
+            name='TagUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название тега')),
+                ('num_times', models.PositiveIntegerField(default=0, verbose_name='Кол-во использований')),
+                ('weight', models.PositiveSmallIntegerField(default=0, verbose_name='Вес тега')),
+            ],
+            options={
+                'verbose_name': 'Использование тега',
+                'verbose_name_plural': 'Использования тегов',
+            },
+        ),
+    ]
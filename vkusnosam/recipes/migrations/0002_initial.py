@@ -0,0 +1,107 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:03
+
+import django.db.models.deletion
+import taggit.managers
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddField(
+            model_name='rating',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tags',
+            field=taggit.managers.TaggableManager(blank=True, help_text='A comma-separated list of tags.', through='taggit.TaggedItem', to='taggit.Tag', verbose_name='Tags'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='user',
+            field=models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='recipes', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddField(
+            model_name='rating',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+        migrations.AddField(
+            model_name='recipesteppreparing',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipes_photo', to='recipes.recipe', verbose_name='Изображения пошагового рецепта'),
+        ),
+        migrations.AddField(
+            model_name='recipesteppreparing',
+            name='users',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_category',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='recipes_cat', to='recipes.tagscategory', verbose_name='Категория тегов'),
+        ),
+        migrations.AddField(
+            model_name='tagusage',
+            name='category',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tag_usages', to='recipes.tagscategory', verbose_name='Категория тегов'),
+        ),
+        migrations.AddField(
+            model_name='tagusage',
+            name='tag',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usages', to='taggit.tag', verbose_name='Тег'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='rating',
+            unique_together={('user', 'recipe')},
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-time_create'], name='recipes_rec_time_cr_b29e3c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-rating_average'], name='recipes_rec_rating__68da29_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-comments_count'], name='recipes_rec_comment_d85d54_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tagusage',
+            index=models.Index(fields=['category', 'name'], name='recipes_tag_categor_63bd25_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tagusage',
+            index=models.Index(fields=['category', 'num_times'], name='recipes_tag_categor_485688_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='tagusage',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', False)), fields=('tag', 'category'), name='unique_tag_usage_per_category'),
+        ),
+        migrations.AddConstraint(
+            model_name='tagusage',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('tag',), name='unique_tag_usage_global'),
+        ),
+    ]
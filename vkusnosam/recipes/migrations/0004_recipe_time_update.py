@@ -0,0 +1,20 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='time_update',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Время изменения'),
+            preserve_default=False,
+        ),
+    ]
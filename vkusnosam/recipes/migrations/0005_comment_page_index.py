@@ -0,0 +1,19 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_time_update'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['recipe', '-time_create', '-id'], name='recipes_com_recipe__e84a4a_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_comment_page_index'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['user', '-time_create', '-id'], name='recipes_com_user_id_2ae02f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', '-time_create', '-id'], name='recipes_rec_user_id_11fc24_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_profile_list_indexes'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True, verbose_name='Нормализованное название')),
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='normalized_key', to='taggit.tag', verbose_name='Тег')),
+            ],
+            options={
+                'verbose_name': 'Нормализованное название тега',
+                'verbose_name_plural': 'Нормализованные названия тегов',
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_tag_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngredientIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True, verbose_name='Нормализованное название продукта')),
+                ('bitmap', models.BinaryField(default=b'', verbose_name='Битовая карта рецептов')),
+                ('recipes_count', models.PositiveIntegerField(default=0, verbose_name='Кол-во рецептов')),
+                ('version', models.PositiveIntegerField(default=0, verbose_name='Версия')),
+            ],
+            options={
+                'verbose_name': 'Индекс продукта',
+                'verbose_name_plural': 'Индекс продуктов',
+            },
+        ),
+    ]
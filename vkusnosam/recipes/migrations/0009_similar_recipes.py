@@ -0,0 +1,53 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_ingredient_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSignature',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('signature', models.BinaryField(verbose_name='Сигнатура')),
+            ],
+            options={
+                'verbose_name': 'Сигнатура рецепта',
+                'verbose_name_plural': 'Сигнатуры рецептов',
+            },
+        ),
+        migrations.CreateModel(
+            name='SignatureBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.BigIntegerField(verbose_name='Корзина')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'Корзина сигнатуры',
+                'verbose_name_plural': 'Корзины сигнатур',
+                'indexes': [models.Index(fields=['bucket', 'recipe'], name='recipes_sig_bucket_270f3e_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SimilarRecipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Сходство')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_recipes', to='recipes.recipe', verbose_name='Рецепт')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.recipe', verbose_name='Похожий рецепт')),
+            ],
+            options={
+                'verbose_name': 'Похожий рецепт',
+                'verbose_name_plural': 'Похожие рецепты',
+                'indexes': [models.Index(fields=['recipe', '-score'], name='recipes_sim_recipe__f61591_idx')],
+                'constraints': [models.UniqueConstraint(fields=('recipe', 'similar'), name='unique_similar_recipe')],
+            },
+        ),
+    ]
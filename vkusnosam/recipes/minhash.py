@@ -0,0 +1,121 @@
+import hashlib
+import heapq
+import random
+import zlib
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Модуль не импортирует Django: его функции выполняются в процессах пула (см. rebuild_similar_recipes)
+
+# Сигнатура - 48 минимальных хэшей, разбитых на 16 полос по 3 хэша (LSH). Рецепты попадают в одну корзину полосы
+# с вероятностью J^3 (J - коэффициент Жаккара наборов продуктов), кандидатами становятся рецепты хотя бы с одной
+# общей корзиной: при J = 0.4 с вероятностью 0.65, при J = 0.6 - 0.97, при J = 0.2 - 0.12
+NUM_HASHES = 48
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+
+# Простое число больше 2^32 для хэш-функций вида (a * x + b) mod PRIME
+PRIME = 4294967311
+
+# Коэффициенты хэш-функций с фиксированным зерном: сигнатуры должны совпадать во всех процессах и запусках
+_random = random.Random(20240611)
+HASH_COEFFICIENTS = [(_random.randrange(1, PRIME), _random.randrange(0, PRIME)) for _ in range(NUM_HASHES)]
+
+# Корзины больше этого размера при подборе кандидатов пропускаются: в них попадают рецепты
+# с самыми частыми сочетаниями продуктов (соль, мука, яйца), и они не говорят о сходстве блюд
+MAX_BUCKET_SIZE = 200
+
+_signatures: Dict[int, array] = {}
+_buckets: Dict[int, Sequence[int]] = {}
+
+
+def minhash(features: Iterable[str]) -> Optional[array]:
+    """
+    Метод строит MinHash-сигнатуру набора признаков рецепта (нормализованных продуктов и тегов).
+    Доля совпадающих позиций двух сигнатур - оценка коэффициента Жаккара их наборов.
+    :param features: признаки рецепта
+    :return: array('I') из NUM_HASHES чисел или None для пустого набора
+    """
+    hashes = [zlib.crc32(feature.encode()) for feature in set(features)]
+    if not hashes:
+        return None
+    return array('I', [min((a * value + b) % PRIME for value in hashes) & 0xFFFFFFFF
+                       for a, b in HASH_COEFFICIENTS])
+
+
+def band_buckets(signature: array) -> List[int]:
+    """
+    Метод возвращает корзины LSH сигнатуры: по одной на полосу.
+    Номер полосы хранится в старших битах, поэтому корзины разных полос не совпадают.
+    :param signature: array('I')
+    :return: List (числа меньше 2^63)
+    """
+    return [band << 56 | int.from_bytes(hashlib.blake2b(signature[band * ROWS:(band + 1) * ROWS].tobytes(),
+                                                        digest_size=7).digest(), 'little')
+            for band in range(BANDS)]
+
+
+def similarity(first: array, second: array) -> float:
+    """
+    Метод оценивает сходство наборов признаков по сигнатурам (доля совпадающих минимальных хэшей).
+    :return: Float от 0 до 1
+    """
+    return sum(x == y for x, y in zip(first, second)) / NUM_HASHES
+
+
+def top_neighbours(signature: array, candidates: Dict[int, array], count: int,
+                   min_score: float) -> List[Tuple[int, float]]:
+    """
+    Метод выбирает самых похожих рецептов из кандидатов.
+    :param signature: сигнатура рецепта
+    :param candidates: {id рецепта: сигнатура}
+    :param count: сколько рецептов оставить
+    :param min_score: минимальное сходство
+    :return: List [(id рецепта, сходство)] по убыванию сходства (при равенстве - новые первыми)
+    """
+    scored = ((similarity(signature, other), recipe_id) for recipe_id, other in candidates.items())
+    best = heapq.nlargest(count, (item for item in scored if item[0] >= min_score))
+    return [(recipe_id, score) for score, recipe_id in best]
+
+
+def signatures_chunk(items: List[Tuple[int, List[str]]]) -> List[Tuple[int, bytes]]:
+    """
+    Задача пула: сигнатуры для пакета рецептов.
+    :param items: [(id рецепта, признаки)]
+    :return: List [(id рецепта, сигнатура в байтах)] (рецепты без признаков пропускаются)
+    """
+    result = []
+    for recipe_id, features in items:
+        signature = minhash(features)
+        if signature is not None:
+            result.append((recipe_id, signature.tobytes()))
+    return result
+
+
+def init_neighbours_worker(signatures: Dict[int, bytes], buckets: Dict[int, Sequence[int]]) -> None:
+    """
+    Инициализация процесса пула для подбора соседей: все сигнатуры и непустые корзины
+    (корзины из одного рецепта и слишком большие корзины не передаются).
+    """
+    _signatures.update((recipe_id, array('I', data)) for recipe_id, data in signatures.items())
+    _buckets.update(buckets)
+
+
+def neighbours_chunk(recipe_ids: List[int], count: int, min_score: float) -> List[Tuple[int, List[Tuple[int, float]]]]:
+    """
+    Задача пула: самые похожие рецепты для пакета рецептов (кандидаты - рецепты из общих корзин).
+    :param recipe_ids: id рецептов
+    :param count: сколько соседей оставить
+    :param min_score: минимальное сходство
+    :return: List [(id рецепта, [(id соседа, сходство)])]
+    """
+    result = []
+    for recipe_id in recipe_ids:
+        signature = _signatures[recipe_id]
+        candidates = {}
+        for bucket in band_buckets(signature):
+            for other in _buckets.get(bucket, ()):
+                if other != recipe_id:
+                    candidates[other] = _signatures[other]
+        result.append((recipe_id, top_neighbours(signature, candidates, count, min_score)))
+    return result
@@ -1,29 +1,14 @@
-import re
-import uuid
-
 from django.contrib.auth import get_user_model
-from django.db import models
-from django.db.models import F
-from django.utils.text import slugify
+from django.db import IntegrityError, models, transaction
 from django.urls import reverse
 from taggit.managers import TaggableManager
 
+from .ingredients import parse_products
+from .slugs import allocate_slug
+from .view_counter import view_counter
 
-
-
-def translit_to_eng(s: str) -> str:
-    """
-    Метод для перевода русских букв в литиницу.
-    :param s:
-    :return: Str
-    """
-    d = {'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd',
-         'е': 'e', 'ё': 'yo', 'ж': 'zh', 'з': 'z', 'и': 'i', 'к': 'k',
-         'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r',
-         'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'c', 'ч': 'ch',
-         'ш': 'sh', 'щ': 'shch', 'ь': '', 'ы': 'y', 'ъ': '', 'э': 'r', 'ю': 'yu', 'я': 'ya'}
-
-    return "".join(map(lambda x: d[x] if d.get(x, False) else x, s.lower()))
+# Сколько раз Recipe.save подбирает slug заново, если его одновременно занял другой рецепт
+SLUG_SAVE_ATTEMPTS = 3
 
 
 class Recipe(models.Model):
@@ -34,8 +19,12 @@ class Recipe(models.Model):
     slug = models.CharField(max_length=255, verbose_name="Slug", db_index=True, unique=True, blank=True)
     image = models.ImageField(blank=True, null=True, default=None,
                               upload_to='recipe_image/%Y/%m/%d', verbose_name='Изображения рецепта')
+    image_variants = models.JSONField(default=dict, blank=True, editable=False,
+                                      verbose_name='Варианты изображения')  # Уменьшенные копии (см. recipes/images.py)
     description = models.TextField(blank=True, verbose_name='Описание рецепта')
     products = models.TextField(blank=True, verbose_name='Какие продукты')
+    ingredients = models.JSONField(default=list, blank=True, editable=False,
+                                   verbose_name='Ингредиенты')  # Разобранное поле products (см. recipes/ingredients.py)
     user = models.ForeignKey(get_user_model(), on_delete=models.SET_NULL,
                              related_name='recipes', verbose_name='Пользователь', null=True, default=None)
     tags = TaggableManager(blank=True)
@@ -46,6 +35,13 @@ class Recipe(models.Model):
     time_preparing = models.PositiveIntegerField(blank=True, verbose_name="Время приготовления", null=True)
     calorie = models.PositiveIntegerField(blank=True, verbose_name="Калорийность", null=True)
     time_create = models.DateTimeField(auto_now_add=True, verbose_name="Время создания")
+    # Меняется при любом изменении рецепта, его шагов, тегов, оценок и комментариев (см. recipes/conditional.py)
+    time_update = models.DateTimeField(auto_now=True, verbose_name="Время изменения")
+    # Агрегаты оценок обновляются сигналами модели Rating (см. recipes/signals.py)
+    rating_sum = models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')
+    rating_count = models.PositiveIntegerField(default=0, verbose_name='Кол-во оценок')
+    rating_average = models.FloatField(default=0, verbose_name='Средний рейтинг')
+    comments_count = models.PositiveIntegerField(default=0, verbose_name='Кол-во комментариев')  # Обновляется сигналами Comment
 
     def __str__(self) -> str:
         """
@@ -55,11 +51,37 @@ class Recipe(models.Model):
         return self.name
 
     def save(self, *args, **kwargs):
-        if not self.slug:  # Если slug не указан
-            self.slug = slugify(translit_to_eng(self.name))  # Генерация slug на основе имени
-            while Recipe.objects.filter(slug=self.slug).exists():  # Проверка уникальности
-                self.slug = f'{self.slug}-{uuid.uuid4().hex[:4]}'  # Добавление уникального суффикса
-        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'products' in update_fields:  # Разбираем продукты один раз при сохранении
+            self.ingredients = parse_products(self.products)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'ingredients'}
+        if self.slug:
+            super().save(*args, **kwargs)
+            return
+        # slug из названия подбирается одним запросом, а уникальность гарантирует индекс:
+        # если параллельный запрос успел занять тот же slug, он подбирается заново
+        for attempt in range(SLUG_SAVE_ATTEMPTS):
+            self.slug = allocate_slug(Recipe, self.name)
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                if attempt == SLUG_SAVE_ATTEMPTS - 1 or not Recipe.objects.filter(slug=self.slug).exists():
+                    self.slug = ''
+                    raise
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Метод запоминает загруженные из базы категорию и ингредиенты: при смене категории переносятся счетчики тегов,
+        при смене ингредиентов обновляется индекс продуктов.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_tags_category_id = instance.__dict__.get('tags_category_id')
+        instance._loaded_ingredients = instance.__dict__.get('ingredients')
+        return instance
 
     def get_absolute_url(self):
         """
@@ -73,57 +95,46 @@ class Recipe(models.Model):
         Метод для отображения среднего рейтинга рецепта.
         :return:
         """
-        return self.ratings.aggregate(models.Avg('score'))['score__avg'] or 0
+        return self.rating_average
 
     def comments_quantity(self):
         """
         Метод для отображения кол-ва коменатриев.
         :return:
         """
-        return self.comments.Count('comments')
+        return self.comments_count
 
     def increment_views(self):
         """
         Метод увеличивает кол-во числа просмотров.
+        Просмотр записывается в буфер счетчика, в базу он попадет при следующем сбросе буфера.
         :return:
         """
-        Recipe.objects.filter(pk=self.pk).update(views=F('views') + 1)
-        self.refresh_from_db()  # Обновляем объект из базы данных
+        view_counter.increment(self.pk)
+
+    @property
+    def current_views(self) -> int:
+        """
+        Кол-во просмотров с учетом просмотров, которые еще не записаны в базу.
+        :return: Int
+        """
+        return self.views + view_counter.pending(self.pk)
+
+    @property
+    def ingredient_names(self) -> list:
+        """
+        Список названий продуктов рецепта из сохраненного поля ingredients.
+        :return: List
+        """
+        return [ingredient['name'] for ingredient in self.ingredients]
 
     def create_list_from_data_field_products(self) -> list:
         """
         Метод для создания списка из данных поля products.
+        Возвращает названия продуктов, разобранные при сохранении рецепта.
         :return: List
         """
-
-        if not self.products:
-            return []
-        result_names = []
-        # Нормализуем текст: заменяем все тире/дефисы на единый разделитель
-        normalized_text = re.sub(r'[–—]', '-', self.products)
-
-        # Обрабатываем каждую строку
-        for line in normalized_text.split(';'):
-            line = line.strip()
-            if not line or '-' not in line:
-                continue
-
-            # Разделяем по первому дефису
-            product_part = line.split('-', 1)[0].strip()
-
-            # Удаляем содержимое в скобках (если есть)
-            product_part = re.sub(r'\(.*?\)', '', product_part).strip()
-
-            # Берем первые два слова (игнорируя проценты и другие спецсимволы)
-            words = [word for word in product_part.split() if not word.startswith(('%',))]
-            first_two_words = ' '.join(words[:2]) if words else ''
-
-            if first_two_words:
-                result_names.append(first_two_words)
-
-        return list(set(result_names))  # Удаляем дубликаты
-
-
+        return self.ingredient_names
 
     class Meta:
         """
@@ -133,7 +144,10 @@ class Recipe(models.Model):
         verbose_name_plural = "Рецепты"
         ordering = ['-time_create']
         indexes = [
-            models.Index(fields=['-time_create'])
+            models.Index(fields=['-time_create']),
+            models.Index(fields=['-rating_average']),
+            models.Index(fields=['-comments_count']),
+            models.Index(fields=['user', '-time_create', '-id']),  # Рецепты пользователя в профиле
         ]
 
 
@@ -168,6 +182,143 @@ class TagsCategory(models.Model):
 
 
 
+class TagKey(models.Model):
+    """
+    Нормализованное название тега продукта (см. recipes/tagging.py).
+    По нему разные написания одного продукта ("Мука", "мука", "Яйца", "яйцо") получают один тег.
+    """
+    key = models.CharField(max_length=100, unique=True, verbose_name='Нормализованное название')
+    tag = models.OneToOneField('taggit.Tag', on_delete=models.CASCADE, related_name='normalized_key',
+                               verbose_name='Тег')
+
+    def __str__(self) -> str:
+        """
+        Метод для отображения объекта модели в строковом виде.
+        :return: Str
+        """
+        return self.key
+
+    class Meta:
+        verbose_name = 'Нормализованное название тега'
+        verbose_name_plural = 'Нормализованные названия тегов'
+
+
+class IngredientIndex(models.Model):
+    """
+    Строка инвертированного индекса продуктов: рецепты, в которых есть продукт, в виде сжатой битовой карты id
+    (бит N установлен - в рецепте с id N есть продукт). Ключ - нормализованное название продукта (см. tagging.tag_key).
+    Обновляется сигналами Recipe, поиск по продуктам выполняется в памяти (см. recipes/ingredient_index.py).
+    """
+    key = models.CharField(max_length=100, unique=True, verbose_name='Нормализованное название продукта')
+    bitmap = models.BinaryField(default=b'', verbose_name='Битовая карта рецептов')
+    recipes_count = models.PositiveIntegerField(default=0, verbose_name='Кол-во рецептов')
+    # Увеличивается при каждом изменении битовой карты: по нему процессы обновляют карты в памяти
+    version = models.PositiveIntegerField(default=0, verbose_name='Версия')
+
+    def __str__(self) -> str:
+        """
+        Метод для отображения объекта модели в строковом виде.
+        :return: Str
+        """
+        return f'Продукт {self.key} есть в {self.recipes_count} рецептах'
+
+    class Meta:
+        verbose_name = 'Индекс продукта'
+        verbose_name_plural = 'Индекс продуктов'
+
+
+class TagUsage(models.Model):
+    """
+    Материализованное кол-во использований тега рецептами категории.
+    Строка с category=None хранит кол-во использований тега во всех категориях.
+    Обновляется сигналами taggit (см. recipes/tag_cloud.py), поэтому облако тегов читается одним запросом.
+    """
+    tag = models.ForeignKey('taggit.Tag', on_delete=models.CASCADE, related_name='usages', verbose_name='Тег')
+    category = models.ForeignKey(TagsCategory, on_delete=models.CASCADE, related_name='tag_usages', null=True,
+                                 verbose_name='Категория тегов')
+    name = models.CharField(max_length=100, verbose_name='Название тега')  # Копия Tag.name для сортировки по индексу
+    num_times = models.PositiveIntegerField(default=0, verbose_name='Кол-во использований')
+    weight = models.PositiveSmallIntegerField(default=0, verbose_name='Вес тега')
+
+    def __str__(self) -> str:
+        """
+        Метод для отображения объекта модели в строковом виде.
+        :return: Str
+        """
+        return f'Тег {self.name} использован {self.num_times} раз'
+
+    class Meta:
+        verbose_name = 'Использование тега'
+        verbose_name_plural = 'Использования тегов'
+        constraints = [
+            models.UniqueConstraint(fields=['tag', 'category'], condition=models.Q(category__isnull=False),
+                                    name='unique_tag_usage_per_category'),
+            models.UniqueConstraint(fields=['tag'], condition=models.Q(category__isnull=True),
+                                    name='unique_tag_usage_global'),
+        ]
+        indexes = [
+            models.Index(fields=['category', 'name']),
+            models.Index(fields=['category', 'num_times']),
+        ]
+
+
+class RecipeSignature(models.Model):
+    """
+    MinHash-сигнатура набора продуктов и тегов рецепта (см. recipes/similar.py).
+    """
+    recipe = models.OneToOneField(Recipe, on_delete=models.CASCADE, primary_key=True, related_name='signature',
+                                  verbose_name='Рецепт')
+    signature = models.BinaryField(verbose_name='Сигнатура')
+
+    class Meta:
+        verbose_name = 'Сигнатура рецепта'
+        verbose_name_plural = 'Сигнатуры рецептов'
+
+
+class SignatureBucket(models.Model):
+    """
+    Корзина LSH, в которую попал рецепт: по одной на каждую полосу сигнатуры.
+    Рецепты из общих корзин - кандидаты в похожие.
+    """
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='+', verbose_name='Рецепт')
+    bucket = models.BigIntegerField(verbose_name='Корзина')
+
+    class Meta:
+        verbose_name = 'Корзина сигнатуры'
+        verbose_name_plural = 'Корзины сигнатур'
+        indexes = [
+            models.Index(fields=['bucket', 'recipe']),
+        ]
+
+
+class SimilarRecipe(models.Model):
+    """
+    Похожий рецепт: для каждого рецепта хранится до RECIPE_SIMILAR_COUNT соседей со сходством,
+    поэтому страница рецепта читает их одним запросом по индексу (recipe, -score).
+    """
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='similar_recipes',
+                               verbose_name='Рецепт')
+    similar = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='+', verbose_name='Похожий рецепт')
+    score = models.FloatField(verbose_name='Сходство')
+
+    def __str__(self) -> str:
+        """
+        Метод для отображения объекта модели в строковом виде.
+        :return: Str
+        """
+        return f'{self.recipe_id} похож на {self.similar_id} ({self.score:.2f})'
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'similar'], name='unique_similar_recipe'),
+        ]
+        indexes = [
+            models.Index(fields=['recipe', '-score']),
+        ]
+
+
 class Comment(models.Model):
     """
     Модель для комментариев пользователей к рецепту.
@@ -181,6 +332,10 @@ class Comment(models.Model):
     class Meta:
         verbose_name = 'Комментарий'
         verbose_name_plural = "Комментарии"
+        indexes = [
+            models.Index(fields=['recipe', '-time_create', '-id']),  # Страницы комментариев рецепта
+            models.Index(fields=['user', '-time_create', '-id']),  # Комментарии пользователя в профиле
+        ]
 
     def __str__(self) -> str:
         """
@@ -207,6 +362,16 @@ class Rating(models.Model):
         """
         return f'Пользователь {self.user} поставил оценку {self.score} рецепту {self.recipe}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Метод запоминает загруженную из базы оценку, чтобы при изменении
+        обновить агрегаты рецепта на разницу оценок.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_score = instance.__dict__.get('score')
+        return instance
+
     class Meta:
         """
         Клас отображающий метаданные модели.
@@ -225,6 +390,8 @@ class RecipeStepPreparing(models.Model):
     step_image = models.ImageField(blank=True, null=True, default=None,
                                    verbose_name='Изображения пошагового приготовления',
                                    upload_to=f'recipe_step_preparing/{recipe.name}/%Y/%m/%d')
+    step_image_variants = models.JSONField(default=dict, blank=True, editable=False,
+                                           verbose_name='Варианты изображения шага')
     users = models.ForeignKey(get_user_model(), verbose_name='Пользователь', on_delete=models.CASCADE)
     # step = models.PositiveIntegerField(default=1, verbose_name='Шаг')
     step_description = models.TextField(verbose_name="Описание шага приготовления", blank=True, null=True)
@@ -0,0 +1,174 @@
+import hashlib
+import time
+from typing import Iterable, Optional
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from .conditional import catalog_state, has_pending_messages
+from .db_router import replica_lag, request_replica
+
+
+def _slug_key(slug: str) -> str:
+    return f'recipes:page:slug:{hashlib.md5(slug.encode()).hexdigest()}'
+
+
+def _version_key(recipe_id: int) -> str:
+    return f'recipes:page:version:{recipe_id}'
+
+
+def remember_recipe_slug(slug: str, recipe_id: int) -> None:
+    """
+    Метод запоминает id рецепта по slug, чтобы находить кэш страницы рецепта без запроса к базе.
+    :param slug: Str
+    :param recipe_id: Int
+    :return: None
+    """
+    cache.set(_slug_key(slug), recipe_id, None)
+
+
+def recipe_page_version(slug: str) -> Optional[str]:
+    """
+    Метод возвращает версию закэшированных страниц рецепта: id рецепта и номер,
+    который меняется при каждом изменении рецепта, его шагов, оценок и комментариев.
+    Если номера в кэше нет, он создается из текущего времени в наносекундах, чтобы не совпасть с прежними.
+    :param slug: Str
+    :return: Str или None, если id рецепта по slug еще не известен
+    """
+    recipe_id = cache.get(_slug_key(slug))
+    if recipe_id is None:
+        return None
+    key = _version_key(recipe_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return f'{recipe_id}:{version}'
+
+
+def invalidate_recipe_pages(recipe_ids: Iterable[int]) -> None:
+    """
+    Метод после фиксации транзакции сбрасывает версии страниц рецептов.
+    Старые страницы остаются в кэше под прежними ключами и удаляются по истечении срока.
+    :param recipe_ids: id рецептов
+    :return: None
+    """
+    keys = [_version_key(recipe_id) for recipe_id in recipe_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class AnonymousPageCacheMixin:
+    """
+    Миксин, который кэширует страницу целиком для анонимных посетителей.
+    Ключ - путь, параметры из page_cache_params (остальные параметры запроса не влияют на страницу)
+    и версия содержимого из get_page_cache_version, поэтому при изменении данных ключ меняется
+    и устаревшая страница больше не отдается.
+    Кэш не используется для авторизованных пользователей, при непоказанных сообщениях
+    и для страниц, при рендеринге которых понадобился CSRF-токен или были выставлены cookie.
+    """
+    page_cache_params = ()
+    page_cache_used = False  # Страница отдана из кэша
+
+    def get_page_cache_version(self) -> Optional[str]:
+        """
+        Метод возвращает версию содержимого страницы (None - страницу не кэшировать).
+        Версия читается до рендеринга, поэтому страница, отрисованная по старым данным,
+        не попадет в кэш под новой версией.
+        :return: Str или None
+        """
+        raise NotImplementedError
+
+    def page_cache_hit(self) -> None:
+        """
+        Метод вызывается, когда страница отдана из кэша.
+        :return: None
+        """
+
+    def get_page_cache_changed(self) -> Optional[float]:
+        """
+        Метод возвращает время (timestamp), с которого действует версия страницы.
+        Страница, прочитанная с реплики, пока реплика может отставать от этого времени, в кэш не сохраняется:
+        иначе под новой версией оказались бы старые данные (см. recipes/db_router.py).
+        :return: Float или None (время неизвестно - страницу с реплики не кэшировать)
+        """
+        return None
+
+    def use_page_cache(self, request: HttpRequest) -> bool:
+        if not getattr(settings, 'RECIPE_PAGE_CACHE_TTL', 0):
+            return False
+        # Без cookie сессии посетитель точно аноним и сообщений у него нет - сессию не загружаем
+        if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+            return True
+        return not request.user.is_authenticated and not has_pending_messages(request)
+
+    def get_page_cache_key(self, version: str) -> str:
+        params = sorted((name, self.request.GET.get(name, '').strip()) for name in self.page_cache_params
+                        if self.request.GET.get(name, '').strip())
+        url = f'{self.request.path}?{urlencode(params)}'
+        return f'recipes:page:{hashlib.md5(url.encode()).hexdigest()}:{version}'
+
+    def get_cached_page(self, request: HttpRequest) -> Optional[HttpResponse]:
+        """
+        Метод возвращает страницу из кэша (или ответ 304 по ее ETag).
+        Если страницы в кэше нет - None; ключ для сохранения запоминается в page_cache_key.
+        :param request: HttpRequest
+        :return: HttpResponse или None
+        """
+        self.page_cache_key = None
+        if not self.use_page_cache(request):
+            return None
+        version = self.page_cache_version = self.get_page_cache_version()
+        if version is None:
+            return None
+        self.page_cache_key = self.get_page_cache_key(version)
+        response = cache.get(self.page_cache_key)
+        if response is None:
+            return None
+        self.page_cache_used = True
+        self.page_cache_hit()
+        return get_conditional_response(
+            request, etag=response.get('ETag'),
+            last_modified=parse_http_date_safe(response.get('Last-Modified', '')), response=response) or response
+
+    def cache_page_on_render(self, response: HttpResponse) -> HttpResponse:
+        """
+        Метод сохраняет страницу в кэш после рендеринга, если ее можно кэшировать.
+        :param response: HttpResponse
+        :return: HttpResponse
+        """
+        key = self.page_cache_key
+        if key and response.status_code == 200 and hasattr(response, 'add_post_render_callback'):
+            response.add_post_render_callback(lambda rendered: self.store_page(key, rendered))
+        return response
+
+    def get(self, request, *args, **kwargs) -> HttpResponse:
+        response = self.get_cached_page(request)
+        if response is not None:
+            return response
+        return self.cache_page_on_render(super().get(request, *args, **kwargs))
+
+    def store_page(self, key: str, response: HttpResponse) -> None:
+        if response.cookies or self.request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+            return  # В странице данные конкретного посетителя
+        if request_replica() is not None:
+            changed = self.get_page_cache_changed()
+            if changed is None or time.time() - changed < replica_lag():
+                return  # Реплика могла еще не получить последние изменения
+        cache.set(key, response, settings.RECIPE_PAGE_CACHE_TTL)
+
+
+class CatalogPageCacheMixin(AnonymousPageCacheMixin):
+    """
+    Миксин кэша страниц для списков рецептов: версия страницы - номер поколения каталога.
+    """
+
+    def get_page_cache_version(self) -> Optional[str]:
+        return str(catalog_state()[0])
+
+    def get_page_cache_changed(self) -> Optional[float]:
+        return catalog_state()[1].timestamp()
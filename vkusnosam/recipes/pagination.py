@@ -0,0 +1,288 @@
+import base64
+import binascii
+import datetime
+import hashlib
+import json
+from typing import Any, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Model, Q, QuerySet
+from django.http import Http404
+
+
+def _json_default(value: Any) -> Any:
+    # Дата сохраняется полностью (с микросекундами), иначе сравнение по ключу пропустит объекты
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f'Значение {value!r} нельзя сохранить в курсоре')
+
+
+def encode_cursor(values: Sequence[Any], direction: str) -> str:
+    """
+    Метод упаковывает значения ключа сортировки в непрозрачный токен для URL.
+    :param values: значения полей сортировки у крайнего объекта страницы
+    :param direction: 'n' - следующая страница, 'p' - предыдущая
+    :return: Str
+    """
+    data = json.dumps({'v': list(values), 'd': direction}, default=_json_default, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str) -> Tuple[List[Any], str]:
+    """
+    Метод распаковывает токен курсора. Для испорченного токена возвращает ошибку 404.
+    :param token: Str
+    :return: Tuple (значения ключа, направление)
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        values, direction = data['v'], data['d']
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise Http404('Неверный курсор страницы')
+    if not isinstance(values, list) or direction not in ('n', 'p'):
+        raise Http404('Неверный курсор страницы')
+    return values, direction
+
+
+def approximate_count(queryset: QuerySet) -> int:
+    """
+    Метод возвращает кол-во объектов запроса, закэшированное на RECIPE_APPROXIMATE_COUNT_TTL секунд.
+    Точный COUNT(*) выполняется не чаще одного раза за это время для каждого запроса.
+    :param queryset: QuerySet
+    :return: Int
+    """
+    key = 'recipes:count:' + hashlib.md5(str(queryset.order_by().query).encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.order_by().count()
+        cache.set(key, count, getattr(settings, 'RECIPE_APPROXIMATE_COUNT_TTL', 60))
+    return count
+
+
+async def aapproximate_count(queryset: QuerySet) -> int:
+    """
+    Асинхронный вариант approximate_count.
+    :param queryset: QuerySet
+    :return: Int
+    """
+    key = 'recipes:count:' + hashlib.md5(str(queryset.order_by().query).encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = await queryset.order_by().acount()
+        cache.set(key, count, getattr(settings, 'RECIPE_APPROXIMATE_COUNT_TTL', 60))
+    return count
+
+
+class CursorPage:
+    """
+    Страница курсорной пагинации.
+    Вместо номеров страниц содержит токены следующей и предыдущей страниц.
+    """
+
+    def __init__(self, object_list: list, next_cursor: Optional[str], previous_cursor: Optional[str],
+                 total_count: Optional[int] = None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.total_count = total_count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def has_other_pages(self) -> bool:
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Курсорная (keyset) пагинация.
+    Следующая страница выбирается условием по ключу сортировки (WHERE key < последний ключ страницы)
+    вместо OFFSET, поэтому время запроса не зависит от номера страницы.
+    Последним полем ключа должен быть уникальный pk, чтобы порядок был однозначным.
+    """
+
+    def __init__(self, queryset: QuerySet, ordering: Sequence[str], per_page: int, with_total: bool = False):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.with_total = with_total
+
+    @staticmethod
+    def _field(key: str) -> Tuple[str, bool]:
+        return key.lstrip('-'), key.startswith('-')
+
+    def _key_values(self, obj: Model) -> list:
+        values = []
+        for key in self.ordering:
+            name, _ = self._field(key)
+            values.append(obj.pk if name == 'pk' else getattr(obj, name))
+        return values
+
+    def _output_field(self, name: str):
+        model = self.queryset.model
+        if name == 'pk':
+            return model._meta.pk
+        annotation = self.queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        try:
+            return model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+    def _parse_values(self, values: Sequence[Any]) -> list:
+        """
+        Метод приводит значения из курсора к типам полей сортировки.
+        Токен приходит от клиента, поэтому значение не того типа дает ошибку 404, а не 500.
+        :param values: значения ключа из токена
+        :return: List
+        """
+        if len(values) != len(self.ordering):
+            raise Http404('Неверный курсор страницы')
+        parsed = []
+        for key, value in zip(self.ordering, values):
+            field = self._output_field(self._field(key)[0])
+            try:
+                value = field.to_python(value) if field is not None else value
+            except (ValidationError, ValueError, TypeError):
+                raise Http404('Неверный курсор страницы')
+            if value is None or isinstance(value, (dict, list)):
+                raise Http404('Неверный курсор страницы')
+            parsed.append(value)
+        return parsed
+
+    def next_cursor(self, obj: Model) -> str:
+        """
+        Метод возвращает токен страницы, которая начинается после объекта.
+        :param obj: последний объект текущей страницы
+        :return: Str
+        """
+        return encode_cursor(self._key_values(obj), 'n')
+
+    def _after(self, values: Sequence[Any], reverse: bool) -> Q:
+        """
+        Метод строит условие "объект стоит после курсора" для составного ключа:
+        (a < va) OR (a = va AND b < vb) OR ...
+        """
+        condition = Q()
+        equal = Q()
+        for key, value in zip(self.ordering, values):
+            name, descending = self._field(key)
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def page(self, cursor: Optional[str]) -> CursorPage:
+        """
+        Метод возвращает страницу, начинающуюся после курсора (или первую страницу).
+        :param cursor: токен курсора или None
+        :return: CursorPage
+        """
+        queryset, direction = self._page_queryset(cursor)
+        total_count = approximate_count(self.queryset) if self.with_total else None
+        return self._make_page(list(queryset), cursor, direction, total_count)
+
+    async def apage(self, cursor: Optional[str]) -> CursorPage:
+        """
+        Асинхронный вариант page (через асинхронный ORM).
+        :param cursor: токен курсора или None
+        :return: CursorPage
+        """
+        queryset, direction = self._page_queryset(cursor)
+        total_count = await aapproximate_count(self.queryset) if self.with_total else None
+        return self._make_page([obj async for obj in queryset], cursor, direction, total_count)
+
+    def _page_queryset(self, cursor: Optional[str]) -> Tuple[QuerySet, str]:
+        queryset = self.queryset
+        direction = 'n'
+        if cursor:
+            values, direction = decode_cursor(cursor)
+            values = self._parse_values(values)
+            queryset = queryset.filter(self._after(values, reverse=direction == 'p'))
+
+        if direction == 'p':  # Идем назад: сортируем в обратном порядке и переворачиваем результат
+            ordering = [key[1:] if key.startswith('-') else f'-{key}' for key in self.ordering]
+        else:
+            ordering = self.ordering
+        return queryset.order_by(*ordering)[:self.per_page + 1], direction
+
+    def _make_page(self, objects: list, cursor: Optional[str], direction: str,
+                   total_count: Optional[int]) -> CursorPage:
+        has_more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+        if direction == 'p':
+            objects.reverse()
+
+        next_cursor = previous_cursor = None
+        if objects:
+            has_next = has_more if direction == 'n' else True
+            has_previous = bool(cursor) if direction == 'n' else has_more
+            if has_next:
+                next_cursor = self.next_cursor(objects[-1])
+            if has_previous:
+                previous_cursor = encode_cursor(self._key_values(objects[0]), 'p')
+
+        return CursorPage(objects, next_cursor, previous_cursor, total_count)
+
+
+class KeysetPaginationMixin:
+    """
+    Миксин для ListView, включающий курсорную пагинацию (настройка RECIPE_LISTING_PAGINATION = 'cursor').
+    Ключ сортировки задается атрибутом ordering_keys. Старые ссылки вида ?page=N работают через обычную пагинацию.
+    """
+    cursor_kwarg = 'cursor'
+    ordering_keys = ('-time_create', '-pk')
+
+    def use_keyset_pagination(self) -> bool:
+        if getattr(settings, 'RECIPE_LISTING_PAGINATION', 'cursor') != 'cursor':
+            return False
+        return self.page_kwarg not in self.request.GET or self.cursor_kwarg in self.request.GET
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Метод возвращает страницу в формате ListView: (paginator, page, object_list, is_paginated).
+        """
+        if not self.use_keyset_pagination():
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(queryset, self.ordering_keys, page_size,
+                                    with_total=getattr(settings, 'RECIPE_LISTING_SHOW_TOTAL', False))
+        page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    async def apaginate_queryset(self, queryset, page_size):
+        """
+        Асинхронный вариант paginate_queryset. Для ссылок ?page=N кол-во объектов считается через acount.
+        """
+        if not self.use_keyset_pagination():
+            paginator = self.get_paginator(queryset, page_size, orphans=self.get_paginate_orphans(),
+                                           allow_empty_first_page=self.get_allow_empty())
+            paginator.count = await queryset.acount()  # Иначе Paginator выполнит COUNT(*) синхронно
+            page_number = self.request.GET.get(self.page_kwarg) or 1
+            try:
+                page = paginator.page(paginator.num_pages if page_number == 'last' else page_number)
+            except InvalidPage as error:
+                raise Http404(f'Неверная страница ({page_number}): {error}')
+            page.object_list = [obj async for obj in page.object_list]
+            return paginator, page, page.object_list, page.has_other_pages()
+        paginator = KeysetPaginator(queryset, self.ordering_keys, page_size,
+                                    with_total=getattr(settings, 'RECIPE_LISTING_SHOW_TOTAL', False))
+        page = await paginator.apage(self.request.GET.get(self.cursor_kwarg))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['cursor_pagination'] = isinstance(context.get('paginator'), KeysetPaginator)
+        return context
@@ -0,0 +1,77 @@
+from typing import NamedTuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import Rating, Recipe
+
+
+class RatingResult(NamedTuple):
+    """
+    Результат оценки рецепта: оценка пользователя и новые агрегаты рецепта.
+    """
+    score: int
+    average: float
+    count: int
+    created: bool  # False - пользователь изменил свою прежнюю оценку
+
+
+def apply_rating_delta(recipe_id: int, score_delta: int, count_delta: int) -> None:
+    """
+    Метод атомарно изменяет сохраненные агрегаты оценок рецепта одним UPDATE.
+    Средний рейтинг пересчитывается из новых суммы и кол-ва оценок без агрегации по таблице оценок,
+    время изменения рецепта обновляется в том же запросе.
+    :param recipe_id: id рецепта
+    :param score_delta: на сколько изменилась сумма оценок
+    :param count_delta: на сколько изменилось кол-во оценок
+    :return: None
+    """
+    if not score_delta and not count_delta:
+        return
+    new_sum = F('rating_sum') + score_delta
+    new_count = F('rating_count') + count_delta
+    Recipe.objects.filter(pk=recipe_id).update(
+        rating_sum=new_sum,
+        rating_count=new_count,
+        # В одном UPDATE все F() ссылаются на старые значения полей
+        rating_average=Case(
+            When(rating_count__gt=-count_delta, then=Cast(new_sum, FloatField()) / new_count),
+            default=Value(0.0),
+            output_field=FloatField(),
+        ),
+        time_update=timezone.now(),
+    )
+
+
+def rate_recipe(recipe_id: int, user_id: int, score: int) -> RatingResult:
+    """
+    Метод ставит или изменяет оценку пользователя (одна оценка на пару пользователь - рецепт).
+    Строка оценки блокируется до конца транзакции, поэтому повторные и одновременные отправки
+    не задваивают оценку. Если оценку одновременно создал другой запрос, уникальный индекс
+    отклоняет вставку и оценка изменяется повторным проходом.
+    Агрегаты рецепта изменяются на разницу оценок сигналами Rating (см. apply_rating_delta),
+    новый средний рейтинг читается из рецепта без агрегации по таблице оценок.
+    :param recipe_id: id рецепта
+    :param user_id: id пользователя
+    :param score: оценка от 1 до 5
+    :return: RatingResult
+    """
+    for attempt in range(2):
+        with transaction.atomic():
+            rating = Rating.objects.select_for_update().filter(recipe_id=recipe_id, user_id=user_id).first()
+            created = rating is None
+            try:
+                if created:
+                    with transaction.atomic():
+                        Rating.objects.create(recipe_id=recipe_id, user_id=user_id, score=score)
+                elif rating.score != score:
+                    rating.score = score
+                    rating.save(update_fields=['score'])
+            except IntegrityError:
+                if attempt:
+                    raise
+                continue
+            average, count = Recipe.objects.filter(pk=recipe_id).values_list('rating_average', 'rating_count').get()
+        return RatingResult(score, average, count, created)
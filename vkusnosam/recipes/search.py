@@ -0,0 +1,222 @@
+import re
+from functools import lru_cache
+from typing import Iterable, List, NamedTuple
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+
+from .models import Recipe
+from .slugs import translit_to_eng
+
+WORD_RE = re.compile(r'\w+')
+
+# Окончания русских слов, которые отбрасываются перед префиксным поиском (самые длинные первыми)
+RUSSIAN_ENDINGS = (
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие',
+    'ий', 'ый', 'ой', 'ей', 'ом', 'ем', 'ам', 'ям', 'ах', 'ях', 'ов', 'ев', 'ию', 'ья', 'ье',
+    'а', 'я', 'ы', 'и', 'о', 'е', 'у', 'ю', 'ь', 'й',
+)
+
+# Маркеры подсветки, которые не встречаются в тексте рецептов. После экранирования HTML заменяются на <mark>
+HIGHLIGHT_START, HIGHLIGHT_END = '\x02', '\x03'
+
+
+class SearchHit(NamedTuple):
+    """
+    Результат поиска: id рецепта, ранг (меньше - лучше) и фрагменты с подсветкой совпадений.
+    """
+    recipe_id: int
+    rank: float
+    name_highlighted: str = ''
+    snippet: str = ''
+
+
+def normalize_search_text(text: str) -> str:
+    """
+    Метод заменяет ё на е. Регистр букв FTS5 не учитывает, поэтому он сохраняется для подсветки.
+    :param text: Str
+    :return: Str
+    """
+    return text.replace('ё', 'е').replace('Ё', 'Е')
+
+
+@lru_cache(maxsize=4096)
+def stem_word(word: str) -> str:
+    """
+    Упрощенный стеммер для русских слов: отбрасывает окончание, если основа остается не короче 3 букв.
+    "Мукой" и "мука" превращаются в "мук", поэтому префиксный поиск находит разные формы слова.
+    :param word: Str
+    :return: Str
+    """
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def highlight_to_html(text: str) -> str:
+    """
+    Метод экранирует текст фрагмента и заменяет маркеры подсветки на теги <mark>.
+    :param text: Str
+    :return: Str
+    """
+    return escape(text or '').replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
+
+
+class BaseSearchBackend:
+    """
+    Базовый класс бэкенда поиска рецептов.
+    Бэкенд выбирается настройкой RECIPE_SEARCH_BACKEND.
+    """
+
+    def setup(self) -> None:
+        """
+        Метод создает хранилище индекса (если оно нужно бэкенду).
+        """
+
+    def index(self, recipes: Iterable[Recipe]) -> None:
+        """
+        Метод добавляет или обновляет рецепты в индексе.
+        """
+
+    def remove(self, recipe_ids: Iterable[int]) -> None:
+        """
+        Метод удаляет рецепты из индекса.
+        """
+
+    def clear(self) -> None:
+        """
+        Метод очищает индекс.
+        """
+
+    def search(self, query: str, limit: int) -> List[SearchHit]:
+        """
+        Метод возвращает найденные рецепты, отсортированные по релевантности.
+        """
+        raise NotImplementedError
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """
+    Бэкенд без индекса: ищет подстроку в названии и продуктах.
+    Подходит для баз без полнотекстового поиска.
+    """
+
+    def search(self, query: str, limit: int) -> List[SearchHit]:
+        words = WORD_RE.findall(query)[:8]
+        if not words:
+            return []
+        condition = Q()
+        for word in words:
+            condition &= Q(name__icontains=word) | Q(products__icontains=word)
+        recipe_ids = Recipe.objects.filter(condition).values_list('pk', flat=True)[:limit]
+        return [SearchHit(recipe_id=pk, rank=position) for position, pk in enumerate(recipe_ids)]
+
+
+class SqliteFTSBackend(BaseSearchBackend):
+    """
+    Бэкенд на виртуальной таблице SQLite FTS5.
+    В индексе хранятся название, описание, продукты и их транслит, поэтому запрос "borshch" находит "Борщ".
+    Слова запроса обрезаются до основы и ищутся по префиксу, что заменяет морфологию.
+    """
+    table = 'recipes_recipe_search'
+    # Веса колонок для bm25: название важнее продуктов, продукты важнее описания
+    weights = (10.0, 1.0, 4.0, 2.0)
+    max_query_words = 8
+    # Сколько рецептов записывать в индекс одним запросом
+    batch_size = 100
+
+    def setup(self) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} '
+                f'USING fts5(name, description, products, translit, '
+                f'tokenize="unicode61 remove_diacritics 2", prefix="2 3")'
+            )
+
+    def index(self, recipes: Iterable[Recipe]) -> None:
+        rows = []
+        for recipe in recipes:
+            rows.append((
+                recipe.pk,
+                normalize_search_text(recipe.name),
+                normalize_search_text(recipe.description),
+                normalize_search_text(recipe.products),
+                translit_to_eng(f'{recipe.name} {recipe.products}'),
+            ))
+        if not rows:
+            return
+        self.remove([row[0] for row in rows])
+        # Несколько строк в одном INSERT вместо executemany: debug_toolbar не умеет логировать executemany в SQLite
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), self.batch_size):
+                batch = rows[start:start + self.batch_size]
+                cursor.execute(
+                    f'INSERT INTO {self.table} (rowid, name, description, products, translit) VALUES '
+                    + ', '.join(['(%s, %s, %s, %s, %s)'] * len(batch)),
+                    [value for row in batch for value in row]
+                )
+
+    def remove(self, recipe_ids: Iterable[int]) -> None:
+        recipe_ids = list(recipe_ids)
+        with connection.cursor() as cursor:
+            for start in range(0, len(recipe_ids), self.batch_size):
+                batch = recipe_ids[start:start + self.batch_size]
+                cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({", ".join(["%s"] * len(batch))})', batch)
+
+    def clear(self) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+    def build_match_expression(self, query: str) -> str:
+        """
+        Метод строит выражение MATCH из слов запроса.
+        Каждое слово ищется по основе в тексте рецепта или по транслиту в колонке translit.
+        Слова экранируются как строки FTS5, поэтому спецсимволы запроса не влияют на синтаксис.
+        :param query: Str
+        :return: Str
+        """
+        terms = []
+        for word in WORD_RE.findall(normalize_search_text(query).lower())[:self.max_query_words]:
+            stem = stem_word(word)
+            translit = translit_to_eng(stem)
+            terms.append(f'({{name description products}} : "{stem}"* OR translit : "{translit}"*)')
+        return ' AND '.join(terms)
+
+    def search(self, query: str, limit: int) -> List[SearchHit]:
+        match = self.build_match_expression(query)
+        if not match:
+            return []
+        marks = (HIGHLIGHT_START, HIGHLIGHT_END)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, bm25({self.table}, %s, %s, %s, %s) AS rank, '
+                f'highlight({self.table}, 0, %s, %s), '
+                f'snippet({self.table}, 2, %s, %s, %s, 12), '
+                f'snippet({self.table}, 1, %s, %s, %s, 12) '
+                f'FROM {self.table} WHERE {self.table} MATCH %s ORDER BY rank LIMIT %s',
+                [*self.weights, *marks, *marks, '…', *marks, '…', match, limit]
+            )
+            rows = cursor.fetchall()
+        hits = []
+        for recipe_id, rank, name, products_snippet, description_snippet in rows:
+            # Показываем фрагмент продуктов, если совпадение нашлось в них, иначе фрагмент описания
+            snippet = products_snippet if HIGHLIGHT_START in products_snippet else description_snippet
+            if HIGHLIGHT_START not in snippet:
+                snippet = ''
+            hits.append(SearchHit(recipe_id=recipe_id, rank=rank,
+                                  name_highlighted=highlight_to_html(name), snippet=highlight_to_html(snippet)))
+        return hits
+
+
+@lru_cache(maxsize=None)
+def get_search_backend() -> BaseSearchBackend:
+    """
+    Метод возвращает экземпляр бэкенда поиска из настройки RECIPE_SEARCH_BACKEND.
+    :return: BaseSearchBackend
+    """
+    backend_path = getattr(settings, 'RECIPE_SEARCH_BACKEND', 'recipes.search.SqliteFTSBackend')
+    return import_string(backend_path)()
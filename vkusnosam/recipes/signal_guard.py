@@ -0,0 +1,28 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Внутри suppress_signals обработчики сигналов связанных объектов рецептов ничего не делают
+_suppressed: ContextVar[bool] = ContextVar('recipes_signals_suppressed', default=False)
+
+
+@contextmanager
+def suppress_signals():
+    """
+    Блок, в котором обработчики сигналов оценок, комментариев, шагов и тегов рецептов не обновляют
+    счетчики рецептов, облако тегов, похожие рецепты и кэш страниц. Нужен при массовых изменениях,
+    после которых вызывающий код пересчитывает все это сам (иначе изменения учлись бы дважды).
+    Пример: with suppress_signals(): Rating.objects.filter(recipe_id__in=ids).delete()
+    """
+    token = _suppressed.set(True)
+    try:
+        yield
+    finally:
+        _suppressed.reset(token)
+
+
+def signals_suppressed() -> bool:
+    """
+    Метод проверяет, выполняется ли код внутри suppress_signals.
+    :return: Bool
+    """
+    return _suppressed.get()
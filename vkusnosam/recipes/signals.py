@@ -0,0 +1,282 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from taggit.models import Tag, TaggedItem
+
+from .conditional import bump_catalog_generation, touch_recipes
+from .images import schedule_variants
+from .ingredient_index import ingredient_keys, update_recipe_index
+from .page_cache import invalidate_recipe_pages
+from .models import Comment, Rating, Recipe, RecipeStepPreparing, TagUsage
+from .ratings import apply_rating_delta
+from .search import get_search_backend
+from .signal_guard import signals_suppressed
+from .similar import SIMILAR_RENDERED_FIELDS, schedule_similar_update, touch_similar_lists
+from .tag_cloud import apply_tag_usage_delta, recipe_content_type_id
+from .top_lists import field_values, most_viewed_recipes, top_rated_recipes
+
+
+@receiver(pre_save, sender=Rating)
+def remember_loaded_score(sender, instance: Rating, **kwargs) -> None:
+    """
+    Запоминает старую оценку, если объект оценки был создан не из базы (например Rating(pk=...)).
+    """
+    if instance.pk and not hasattr(instance, '_loaded_score'):
+        instance._loaded_score = Rating.objects.filter(pk=instance.pk).values_list('score', flat=True).first()
+
+
+@receiver(post_save, sender=Rating)
+def update_rating_aggregates_on_save(sender, instance: Rating, created: bool, **kwargs) -> None:
+    """
+    Обновляет агрегаты оценок рецепта при добавлении или изменении оценки.
+    """
+    if created:
+        apply_rating_delta(instance.recipe_id, instance.score, 1)
+    elif instance._loaded_score is not None:
+        apply_rating_delta(instance.recipe_id, instance.score - instance._loaded_score, 0)
+    instance._loaded_score = instance.score
+    bump_catalog_generation()
+    top_rated_recipes.notify_changed([instance.recipe_id], field_values('rating_average'))
+
+
+@receiver(post_delete, sender=Rating)
+def update_rating_aggregates_on_delete(sender, instance: Rating, origin=None, **kwargs) -> None:
+    """
+    Обновляет агрегаты оценок рецепта при удалении оценки.
+    При удалении самого рецепта агрегаты не обновляются.
+    """
+    if signals_suppressed() or isinstance(origin, Recipe):
+        return
+    score = getattr(instance, '_loaded_score', None)
+    if score is None:
+        score = instance.score
+    apply_rating_delta(instance.recipe_id, -score, -1)
+    bump_catalog_generation()
+    top_rated_recipes.notify_changed([instance.recipe_id], field_values('rating_average'))
+
+
+@receiver(post_save, sender=Comment)
+def increment_comments_count(sender, instance: Comment, created: bool, **kwargs) -> None:
+    """
+    Увеличивает счетчик комментариев рецепта при добавлении комментария
+    (при изменении комментария только отмечает рецепт измененным).
+    """
+    if created:
+        Recipe.objects.filter(pk=instance.recipe_id).update(comments_count=F('comments_count') + 1,
+                                                            time_update=timezone.now())
+        bump_catalog_generation()
+    else:
+        touch_recipes([instance.recipe_id])
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_comments_count(sender, instance: Comment, origin=None, **kwargs) -> None:
+    """
+    Уменьшает счетчик комментариев рецепта при удалении комментария (кроме удаления самого рецепта).
+    """
+    if not signals_suppressed() and not isinstance(origin, Recipe):
+        Recipe.objects.filter(pk=instance.recipe_id, comments_count__gt=0).update(
+            comments_count=F('comments_count') - 1, time_update=timezone.now())
+        bump_catalog_generation()
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_index_on_save(sender, instance: Recipe, **kwargs) -> None:
+    """
+    Обновляет рецепт в поисковом индексе после сохранения.
+    """
+    transaction.on_commit(lambda: get_search_backend().index([instance]))
+
+
+@receiver(post_delete, sender=Recipe)
+def update_search_index_on_delete(sender, instance: Recipe, **kwargs) -> None:
+    """
+    Удаляет рецепт из поискового индекса.
+    """
+    recipe_id = instance.pk
+    transaction.on_commit(lambda: get_search_backend().remove([recipe_id]))
+
+
+def create_search_index(sender, **kwargs) -> None:
+    """
+    Создает хранилище поискового индекса после миграций.
+    """
+    get_search_backend().setup()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def update_top_lists(sender, instance: Recipe, **kwargs) -> None:
+    """
+    Помечает устаревшими списки популярных рецептов, если рецепт в них входит или может войти.
+    """
+    top_rated_recipes.notify_changed([instance.pk], field_values('rating_average'))
+    most_viewed_recipes.notify_changed([instance.pk], field_values('views'))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def update_catalog_generation(sender, instance: Recipe, **kwargs) -> None:
+    """
+    Увеличивает номер поколения каталога при сохранении или удалении рецепта
+    (time_update рецепта обновляет auto_now).
+    """
+    bump_catalog_generation()
+
+
+@receiver(post_save, sender=RecipeStepPreparing)
+@receiver(post_delete, sender=RecipeStepPreparing)
+def touch_recipe_on_step_change(sender, instance: RecipeStepPreparing, origin=None, **kwargs) -> None:
+    """
+    Отмечает рецепт измененным при добавлении, изменении или удалении шага (кроме удаления самого рецепта).
+    """
+    if not signals_suppressed() and not isinstance(origin, Recipe):
+        touch_recipes([instance.recipe_id])
+
+
+@receiver(post_save, sender=TaggedItem)
+def update_tag_usage_on_tag_added(sender, instance: TaggedItem, created: bool, **kwargs) -> None:
+    """
+    Увеличивает счетчики облака тегов при добавлении тега к рецепту и ставит пересчет похожих рецептов.
+    """
+    if not created or instance.content_type_id != recipe_content_type_id():
+        return
+    category_id = Recipe.objects.filter(pk=instance.object_id).values_list('tags_category_id', flat=True).first()
+    apply_tag_usage_delta([instance.tag_id], category_id, 1)
+    touch_recipes([instance.object_id])
+    schedule_similar_update([instance.object_id])
+
+
+@receiver(post_delete, sender=TaggedItem)
+def update_tag_usage_on_tag_removed(sender, instance: TaggedItem, origin=None, **kwargs) -> None:
+    """
+    Уменьшает счетчики облака тегов при удалении тега у рецепта (в том числе при удалении рецепта)
+    и ставит пересчет похожих рецептов (кроме удаления самого рецепта).
+    """
+    if signals_suppressed() or instance.content_type_id != recipe_content_type_id():
+        return
+    if isinstance(origin, Recipe):
+        category_id = origin.tags_category_id
+    else:
+        category_id = Recipe.objects.filter(pk=instance.object_id).values_list('tags_category_id', flat=True).first()
+        touch_recipes([instance.object_id])
+        schedule_similar_update([instance.object_id])
+    apply_tag_usage_delta([instance.tag_id], category_id, -1)
+
+
+@receiver(post_save, sender=Recipe)
+def move_tag_usage_on_category_change(sender, instance: Recipe, created: bool, **kwargs) -> None:
+    """
+    Переносит счетчики тегов рецепта в новую категорию при смене категории.
+    """
+    tracked = hasattr(instance, '_loaded_tags_category_id')
+    old_category_id = getattr(instance, '_loaded_tags_category_id', None)
+    instance._loaded_tags_category_id = instance.tags_category_id
+    if created or not tracked or old_category_id == instance.tags_category_id:
+        return
+    tag_ids = list(TaggedItem.objects.filter(content_type_id=recipe_content_type_id(), object_id=instance.pk)
+                   .values_list('tag_id', flat=True))
+    apply_tag_usage_delta(tag_ids, old_category_id, -1, include_global=False)
+    apply_tag_usage_delta(tag_ids, instance.tags_category_id, 1, include_global=False)
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_loaded_ingredients(sender, instance: Recipe, update_fields=None, **kwargs) -> None:
+    """
+    Запоминает старые ингредиенты, если рецепт был создан не из базы или загружен без поля ingredients.
+    """
+    if update_fields is not None and 'ingredients' not in update_fields:
+        return
+    if instance.pk and getattr(instance, '_loaded_ingredients', None) is None:
+        instance._loaded_ingredients = Recipe.objects.filter(pk=instance.pk).values_list(
+            'ingredients', flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+def update_ingredient_index_on_save(sender, instance: Recipe, update_fields=None, **kwargs) -> None:
+    """
+    Переносит рецепт между битовыми картами индекса продуктов при изменении ингредиентов
+    и ставит пересчет похожих рецептов.
+    """
+    if update_fields is not None and 'ingredients' not in update_fields:
+        return
+    old_keys = ingredient_keys(getattr(instance, '_loaded_ingredients', None))
+    new_keys = ingredient_keys(instance.ingredients)
+    instance._loaded_ingredients = instance.ingredients
+    if old_keys != new_keys:
+        update_recipe_index(instance.pk, old_keys, new_keys)
+        schedule_similar_update([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def update_ingredient_index_on_delete(sender, instance: Recipe, **kwargs) -> None:
+    """
+    Удаляет рецепт из битовых карт индекса продуктов.
+    """
+    update_recipe_index(instance.pk, ingredient_keys(instance.ingredients), set())
+
+
+@receiver(post_save, sender=Recipe)
+def touch_similar_lists_on_save(sender, instance: Recipe, created: bool, update_fields=None, **kwargs) -> None:
+    """
+    Отмечает измененными рецепты, в списках похожих которых выводится переименованный рецепт.
+    """
+    if created or update_fields is not None and not SIMILAR_RENDERED_FIELDS & set(update_fields):
+        return
+    touch_similar_lists(instance.pk)
+
+
+@receiver(pre_delete, sender=Recipe)
+def touch_similar_lists_on_delete(sender, instance: Recipe, **kwargs) -> None:
+    """
+    Отмечает измененными рецепты, из списков похожих которых пропадет удаляемый рецепт
+    (строки списков удаляются каскадом до post_delete).
+    """
+    touch_similar_lists(instance.pk)
+
+
+@receiver(post_save, sender=Tag)
+def rename_tag_usage(sender, instance: Tag, created: bool, **kwargs) -> None:
+    """
+    Обновляет копию названия тега в таблице облака тегов.
+    """
+    if not created:
+        TagUsage.objects.filter(tag=instance).exclude(name=instance.name).update(name=instance.name)
+        bump_catalog_generation()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=RecipeStepPreparing)
+@receiver(post_save, sender=get_user_model())
+def build_image_variants(sender, instance, update_fields=None, **kwargs) -> None:
+    """
+    Ставит в очередь построение уменьшенных вариантов нового изображения (рецепта, шага или аватара).
+    """
+    schedule_variants(instance, update_fields)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe_page(sender, instance: Recipe, **kwargs) -> None:
+    """
+    Сбрасывает закэшированную страницу рецепта при его изменении или удалении
+    (страницы списков сбрасываются номером поколения каталога).
+    """
+    invalidate_recipe_pages([instance.pk])
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+@receiver(post_save, sender=RecipeStepPreparing)
+@receiver(post_delete, sender=RecipeStepPreparing)
+def invalidate_recipe_page_on_child_change(sender, instance, origin=None, **kwargs) -> None:
+    """
+    Сбрасывает закэшированную страницу рецепта при изменении его комментариев, оценок или шагов.
+    """
+    if not signals_suppressed() and not isinstance(origin, Recipe):
+        invalidate_recipe_pages([instance.recipe_id])
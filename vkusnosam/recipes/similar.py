@@ -0,0 +1,183 @@
+from array import array
+from typing import Dict, Iterable, List, Set, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, QuerySet
+from taggit.models import TaggedItem
+
+from .conditional import touch_recipes
+from .ingredient_index import ingredient_keys
+from .minhash import MAX_BUCKET_SIZE, band_buckets, minhash, top_neighbours
+from .models import Recipe, RecipeSignature, SignatureBucket, SimilarRecipe
+from .page_cache import invalidate_recipe_pages
+from .tag_cloud import recipe_content_type_id
+from .tagging import tag_key
+
+# Поля похожего рецепта, которые выводятся на странице рецепта
+SIMILAR_FIELDS = ('score', 'recipe_id', 'similar__name', 'similar__slug', 'similar__image', 'similar__image_variants')
+# Поля рецепта, при изменении которых устаревают страницы рецептов, где он выводится похожим
+SIMILAR_RENDERED_FIELDS = {field.split('__', 1)[1] for field in SIMILAR_FIELDS if field.startswith('similar__')}
+
+
+def similar_count() -> int:
+    return getattr(settings, 'RECIPE_SIMILAR_COUNT', 6)
+
+
+def similar_min_score() -> float:
+    return getattr(settings, 'RECIPE_SIMILAR_MIN_SCORE', 0.2)
+
+
+def similar_queryset(recipe_id: int) -> QuerySet:
+    """
+    Метод возвращает похожие рецепты для страницы рецепта: один запрос по индексу (recipe, -score).
+    :param recipe_id: Int
+    :return: QuerySet (SimilarRecipe с загруженным похожим рецептом)
+    """
+    return SimilarRecipe.objects.filter(recipe_id=recipe_id).select_related('similar').only(
+        *SIMILAR_FIELDS).order_by('-score', '-similar_id')[:similar_count()]
+
+
+def recipe_features(recipe_ids: Iterable[int]) -> Dict[int, Set[str]]:
+    """
+    Метод возвращает признаки рецептов для сигнатур: нормализованные продукты и теги (двумя запросами).
+    :param recipe_ids: id рецептов
+    :return: Dict {id рецепта: признаки} (удаленных рецептов в словаре нет)
+    """
+    features = {pk: ingredient_keys(ingredients) for pk, ingredients in
+                Recipe.objects.filter(pk__in=list(recipe_ids)).values_list('pk', 'ingredients')}
+    tags = TaggedItem.objects.filter(content_type_id=recipe_content_type_id(), object_id__in=list(features))
+    for object_id, name in tags.values_list('object_id', 'tag__name'):
+        key = tag_key(name)
+        if key:
+            features[object_id].add(key)
+    return features
+
+
+def save_signatures(signatures: Dict[int, array]) -> None:
+    """
+    Метод сохраняет сигнатуры рецептов и их корзины LSH (старые должны быть удалены).
+    :param signatures: {id рецепта: сигнатура}
+    :return: None
+    """
+    RecipeSignature.objects.bulk_create([RecipeSignature(recipe_id=recipe_id, signature=signature.tobytes())
+                                         for recipe_id, signature in signatures.items()], batch_size=1000)
+    SignatureBucket.objects.bulk_create([SignatureBucket(recipe_id=recipe_id, bucket=bucket)
+                                         for recipe_id, signature in signatures.items()
+                                         for bucket in band_buckets(signature)], batch_size=1000)
+
+
+def save_similar(lists: Dict[int, List[Tuple[int, float]]]) -> None:
+    """
+    Метод сохраняет списки похожих рецептов (старые списки должны быть удалены).
+    :param lists: {id рецепта: [(id похожего рецепта, сходство)]}
+    :return: None
+    """
+    SimilarRecipe.objects.bulk_create([SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id, score=score)
+                                       for recipe_id, neighbours in lists.items()
+                                       for similar_id, score in neighbours], batch_size=1000)
+
+
+def update_similar_recipes(recipe_ids: Iterable[int]) -> None:
+    """
+    Метод пересчитывает похожие рецепты после изменения продуктов или тегов рецептов.
+    Кандидаты - рецепты из общих корзин LSH (размеры корзин и их участники - два запроса по индексу корзин),
+    сходство оценивается по сигнатурам. Списки соседей-кандидатов тоже обновляются: измененный рецепт добавляется в них,
+    если стал похожим, и убирается, если перестал (освободившееся место заполнит rebuild_similar_recipes).
+    :param recipe_ids: id рецептов (удаленные рецепты пропускаются)
+    :return: None
+    """
+    recipe_ids = set(recipe_ids)
+    count, min_score = similar_count(), similar_min_score()
+    features = recipe_features(recipe_ids)
+    signatures = {recipe_id: signature for recipe_id, signature in
+                  ((recipe_id, minhash(items)) for recipe_id, items in features.items()) if signature is not None}
+    buckets = {recipe_id: band_buckets(signature) for recipe_id, signature in signatures.items()}
+
+    with transaction.atomic():
+        RecipeSignature.objects.filter(recipe_id__in=list(features)).delete()
+        SignatureBucket.objects.filter(recipe_id__in=list(features)).delete()
+        save_signatures(signatures)
+        # Размеры корзин считаются по индексу, участники загружаются только у корзин не больше MAX_BUCKET_SIZE
+        sizes = SignatureBucket.objects.filter(bucket__in={bucket for items in buckets.values() for bucket in items})
+        small = [bucket for bucket, size in sizes.values_list('bucket').annotate(size=Count('*')).order_by()
+                 if size <= MAX_BUCKET_SIZE]
+        members: Dict[int, List[int]] = {}  # {корзина: id рецептов}
+        for bucket, recipe_id in SignatureBucket.objects.filter(bucket__in=small).values_list('bucket', 'recipe_id'):
+            members.setdefault(bucket, []).append(recipe_id)
+        candidates = {recipe_id: {other for bucket in items for other in members.get(bucket, ()) if other != recipe_id}
+                      for recipe_id, items in buckets.items()}
+        candidate_ids = set().union(*candidates.values()) - signatures.keys()
+        others = {recipe_id: array('I', data) for recipe_id, data in
+                  RecipeSignature.objects.filter(recipe_id__in=candidate_ids).values_list('recipe_id', 'signature')}
+        others.update(signatures)
+
+        lists = {recipe_id: top_neighbours(signatures[recipe_id], {other: others[other] for other in items
+                                                                   if other in others}, count, min_score)
+                 for recipe_id, items in candidates.items()}
+        for recipe_id in features.keys() - signatures.keys():
+            lists[recipe_id] = []
+
+        # Списки соседей: кандидаты и рецепты, в списках которых уже есть измененные рецепты
+        neighbour_ids = (candidate_ids | set(SimilarRecipe.objects.filter(similar_id__in=recipe_ids)
+                                             .values_list('recipe_id', flat=True))) - lists.keys()
+        current: Dict[int, Dict[int, float]] = {recipe_id: {} for recipe_id in neighbour_ids}
+        for recipe_id, similar_id, score in SimilarRecipe.objects.filter(recipe_id__in=neighbour_ids).values_list(
+                'recipe_id', 'similar_id', 'score'):
+            current[recipe_id][similar_id] = score
+        for recipe_id, neighbours in current.items():
+            updated = {similar_id: score for similar_id, score in neighbours.items() if similar_id not in recipe_ids}
+            for changed_id, signature in signatures.items():
+                if recipe_id in candidates[changed_id] and recipe_id in others:
+                    updated.update(top_neighbours(others[recipe_id], {changed_id: signature}, 1, min_score))
+            updated = dict(sorted(updated.items(), key=lambda item: (item[1], item[0]), reverse=True)[:count])
+            if updated != neighbours:
+                lists[recipe_id] = list(updated.items())
+        SimilarRecipe.objects.filter(recipe_id__in=list(lists)).delete()
+        save_similar(lists)
+        # Список похожих выводится на странице рецепта, поэтому ее ETag должен смениться
+        touch_recipes(lists)
+    invalidate_recipe_pages(lists)
+
+
+def touch_similar_lists(similar_id: int) -> None:
+    """
+    Метод отмечает измененными рецепты, в списках похожих которых выводится рецепт
+    (после его переименования, смены изображения или удаления).
+    :param similar_id: id похожего рецепта
+    :return: None
+    """
+    recipe_ids = list(SimilarRecipe.objects.filter(similar_id=similar_id).values_list('recipe_id', flat=True))
+    if recipe_ids:
+        touch_recipes(recipe_ids)
+        invalidate_recipe_pages(recipe_ids)
+
+
+class _PendingUpdate:
+    """
+    Пересчет похожих рецептов после фиксации транзакции. Рецепты, измененные в одной транзакции
+    (например, продукты и теги при сохранении формы), пересчитываются одним вызовом.
+    """
+
+    def __init__(self, recipe_ids: Iterable[int]):
+        self.recipe_ids = set(recipe_ids)
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        update_similar_recipes(self.recipe_ids)
+
+
+def schedule_similar_update(recipe_ids: Iterable[int]) -> None:
+    """
+    Метод ставит пересчет похожих рецептов после фиксации текущей транзакции.
+    :param recipe_ids: id рецептов
+    :return: None
+    """
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        for _, callback, _ in connection.run_on_commit:
+            if isinstance(callback, _PendingUpdate) and not callback.done:
+                callback.recipe_ids.update(recipe_ids)
+                return
+    transaction.on_commit(_PendingUpdate(recipe_ids))
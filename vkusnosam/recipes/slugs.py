@@ -0,0 +1,106 @@
+import re
+import uuid
+from typing import Dict, Iterable, List, Set, Type
+
+from django.db import models
+from django.db.models import Q
+from django.utils.text import slugify
+
+# Русский алфавит в латиницу; заглавные буквы переводятся так же, как строчные
+_TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo', 'ж': 'zh', 'з': 'z', 'и': 'i',
+    'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't',
+    'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'c', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '',
+    'э': 'e', 'ю': 'yu', 'я': 'ya',
+}
+TRANSLIT_TABLE = str.maketrans({**_TRANSLIT, **{letter.upper(): latin for letter, latin in _TRANSLIT.items()}})
+
+# Сколько slug проверяется одним запросом в allocate_slugs (по 3 параметра запроса на slug)
+SLUG_QUERY_BATCH = 250
+
+# Запас длины под суффикс "-<номер>"
+SUFFIX_RESERVE = 10
+
+
+def translit_to_eng(s: str) -> str:
+    """
+    Метод для перевода русских букв в латиницу (результат в нижнем регистре).
+    :param s: Str
+    :return: Str
+    """
+    return s.translate(TRANSLIT_TABLE).lower()
+
+
+def base_slug(text: str, max_length: int = 255) -> str:
+    """
+    Метод формирует slug из текста без проверки уникальности.
+    Если в тексте нет ни букв, ни цифр, slug составляется из случайных символов.
+    :param text: Str
+    :param max_length: максимальная длина поля slug
+    :return: Str
+    """
+    slug = slugify(translit_to_eng(text))[:max_length - SUFFIX_RESERVE].strip('-')
+    return slug or uuid.uuid4().hex[:8]
+
+
+def _taken_suffixes(model: Type[models.Model], field: str, bases: List[str]) -> Dict[str, Set[int]]:
+    """
+    Метод одним запросом находит занятые варианты slug: сам slug (номер 1) и slug-<номер>.
+    Варианты с суффиксом выбираются диапазоном по индексу slug: от "slug-0" до "slug-:" (":" идет после цифр).
+    :return: Dict {slug: номера занятых вариантов}
+    """
+    condition = Q()
+    for base in bases:
+        condition |= Q(**{field: base}) | Q(**{f'{field}__gte': f'{base}-0', f'{field}__lt': f'{base}-:'})
+    taken = {base: set() for base in bases}
+    for slug in model._default_manager.filter(condition).order_by().values_list(field, flat=True).iterator():
+        if slug in taken:
+            taken[slug].add(1)
+        base, _, number = slug.rpartition('-')  # "picca-2" - и slug, и вариант "picca"
+        if base in taken and re.fullmatch(r'[1-9][0-9]*', number):
+            taken[base].add(int(number))
+    return taken
+
+
+def allocate_slugs(model: Type[models.Model], texts: Iterable[str], field: str = 'slug') -> List[str]:
+    """
+    Метод подбирает уникальные slug для пакета объектов (например, при загрузке каталога).
+    Занятые варианты проверяются одним запросом на SLUG_QUERY_BATCH разных slug, свободный вариант -
+    slug без суффикса или slug-2, slug-3 и т.д. Одинаковые названия в пакете получают разные номера.
+    Между подбором и сохранением slug может занять параллельный запрос, поэтому сохранение
+    должно полагаться на уникальный индекс (см. Recipe.save).
+    :param model: модель с уникальным полем slug
+    :param texts: названия объектов
+    :param field: имя поля slug
+    :return: List (slug в порядке названий)
+    """
+    max_length = model._meta.get_field(field).max_length
+    bases = [base_slug(text, max_length) for text in texts]
+    unique_bases = list(dict.fromkeys(bases))
+    taken = {}
+    for start in range(0, len(unique_bases), SLUG_QUERY_BATCH):
+        taken.update(_taken_suffixes(model, field, unique_bases[start:start + SLUG_QUERY_BATCH]))
+
+    slugs = []
+    allocated = set()  # slug пакета: "picca-2" может быть и вариантом "picca", и названием другого рецепта
+    for base in bases:
+        numbers = taken[base]
+        number = 1
+        while number in numbers or (base if number == 1 else f'{base}-{number}') in allocated:
+            number += 1
+        numbers.add(number)
+        slug = base if number == 1 else f'{base}-{number}'
+        allocated.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+def allocate_slug(model: Type[models.Model], text: str, field: str = 'slug') -> str:
+    """
+    Метод подбирает уникальный slug для одного объекта одним запросом.
+    :param model: модель с уникальным полем slug
+    :param text: название объекта
+    :param field: имя поля slug
+    :return: Str
+    """
+    return allocate_slugs(model, [text], field)[0]
@@ -4,7 +4,23 @@ let stepCounter = 1;
 let addStep = document.getElementById('addStep');
 let formsContainer = document.getElementById('formsContainer');
 
-addStep.addEventListener('click', () => {createOneMoreForm()});
+// Файловое поле шага получает номер шага: браузер не отправляет пустые файловые поля,
+// и по номеру сервер сопоставляет фото с описанием своего шага
+function numberStepImage(formGroup, index) {
+    let fileInput = formGroup.querySelector('input[type="file"]');
+    if (fileInput) {
+        fileInput.name = `step_image_${index}`;
+    }
+}
+
+if (formsContainer) {
+    numberStepImage(formsContainer.querySelector('.form-group'), 0);
+}
+
+// Кнопка добавления шага есть только на страницах создания и изменения рецепта
+if (addStep) {
+    addStep.addEventListener('click', () => {createOneMoreForm()});
+}
 
 function createOneMoreForm() {
         let currentAddButton = document.querySelector('#addStep, #addStepNew');
@@ -38,6 +54,7 @@ function createOneMoreForm() {
                     input.value = ''; // Очищаем значение остальных полей
                 }
             });
+        numberStepImage(newFormGroup, stepCounter - 1);
         // Добавляем новую группу полей в контейнер
         formsContainer.appendChild(newFormGroup);
 
@@ -51,3 +68,68 @@ function createOneMoreForm() {
         newButton.addEventListener('click', () => {createOneMoreForm()});
     }
 
+// Подгрузка списков страницами (комментарии рецепта, рецепты и комментарии в профиле):
+// когда ссылка "Показать еще" появляется на экране, следующая страница загружается HTML-фрагментом
+// и заменяет ссылку (в конце фрагмента - ссылка на следующую страницу)
+function loadMore(link, observer) {
+    observer.unobserve(link);
+    fetch(link.href)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`Ошибка загрузки страницы: ${response.status}`);
+            }
+            return response.text();
+        })
+        .then(html => {
+            let fragment = document.createRange().createContextualFragment(html);
+            let nextLink = fragment.querySelector('.load-more');
+            link.replaceWith(fragment);
+            if (nextLink) {
+                observer.observe(nextLink);
+            }
+        })
+        .catch(error => console.error(error));  // Ссылка остается, по ней можно перейти вручную
+}
+
+let loadMoreLinks = document.querySelectorAll('.load-more');
+if (loadMoreLinks.length && 'IntersectionObserver' in window) {
+    let loadMoreObserver = new IntersectionObserver((entries, observer) => {
+        entries.forEach(entry => {
+            if (entry.isIntersecting) {
+                loadMore(entry.target, observer);
+            }
+        });
+    }, {rootMargin: '200px'});
+    loadMoreLinks.forEach(link => loadMoreObserver.observe(link));
+}
+
+// Оценка рецепта без перезагрузки страницы: форма отправляется на rate_recipe, в ответе - новый средний рейтинг.
+// Без скрипта форма отправляется обычным запросом, и сервер возвращает на страницу рецепта
+let ratingForm = document.querySelector('.rating-form');
+if (ratingForm) {
+    ratingForm.addEventListener('submit', event => {
+        event.preventDefault();
+        fetch(ratingForm.action, {
+            method: 'POST',
+            body: new FormData(ratingForm),
+            headers: {'Accept': 'application/json'},
+        })
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`Ошибка оценки рецепта: ${response.status}`);
+                }
+                return response.json();
+            })
+            .then(data => {
+                let average = document.getElementById('average-rating');
+                if (average) {
+                    average.textContent = data.average.toFixed(1);
+                }
+                let message = document.createElement('span');
+                message.classList.add('has-rate');
+                message.textContent = 'Вы уже оценили этот рецепт!';
+                ratingForm.replaceWith(message);
+            })
+            .catch(error => console.error(error));  // Форма остается, оценку можно отправить еще раз
+    });
+}
@@ -0,0 +1,116 @@
+from typing import Iterable, Optional
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from taggit.models import Tag, TaggedItem
+
+from .models import Recipe, TagUsage
+
+# Максимальный вес тега (классы tag-0 ... tag-5 в шаблоне облака)
+MAX_WEIGHT = 5
+
+
+def recipe_content_type_id() -> int:
+    """
+    Метод возвращает id типа содержимого модели Recipe (значение кэшируется Django).
+    :return: Int
+    """
+    return ContentType.objects.get_for_model(Recipe).pk
+
+
+def _max_num_times(category_id: Optional[int]) -> int:
+    return TagUsage.objects.filter(category_id=category_id).aggregate(m=Max('num_times'))['m'] or 0
+
+
+def refresh_weights(category_id: Optional[int], tag_ids: Optional[Iterable[int]] = None,
+                    max_count: Optional[int] = None) -> None:
+    """
+    Метод пересчитывает веса тегов категории: вес = кол-во использований / максимум * MAX_WEIGHT.
+    Если переданы tag_ids, пересчитываются только эти теги. Перезаписываются только изменившиеся веса.
+    :param category_id: id категории (None - глобальное облако)
+    :param tag_ids: id тегов
+    :param max_count: максимум использований в категории, если он уже известен
+    :return: None
+    """
+    if max_count is None:
+        max_count = _max_num_times(category_id)
+    if not max_count:
+        return
+    weight = F('num_times') * MAX_WEIGHT / max_count
+    usages = TagUsage.objects.filter(category_id=category_id).exclude(weight=weight)
+    if tag_ids is not None:
+        usages = usages.filter(tag_id__in=tag_ids)
+    usages.update(weight=weight)
+
+
+def apply_tag_usage_delta(tag_ids: Iterable[int], category_id: Optional[int], delta: int,
+                          include_global: bool = True) -> None:
+    """
+    Метод изменяет счетчики использований тегов в категории рецепта и в глобальном облаке.
+    Новый максимум категории считается по измененным строкам: он растет только за счет них,
+    а запрашивается заново, только если уменьшилась строка с прежним максимумом.
+    Веса всей категории пересчитываются только если изменился максимум, иначе - только у измененных тегов.
+    :param tag_ids: id тегов
+    :param category_id: id категории рецепта
+    :param delta: на сколько изменилось кол-во использований (+1 / -1)
+    :param include_global: обновлять ли глобальное облако
+    :return: None
+    """
+    tag_ids = set(tag_ids)
+    if not tag_ids or not delta:
+        return
+    categories = {category_id} if category_id is not None else set()
+    if include_global:
+        categories.add(None)
+    names = dict(Tag.objects.filter(pk__in=tag_ids).values_list('pk', 'name')) if delta > 0 else {}
+
+    with transaction.atomic():
+        for category in categories:
+            old_max = _max_num_times(category)
+            if delta > 0:
+                TagUsage.objects.bulk_create(
+                    [TagUsage(tag_id=pk, category_id=category, name=names[pk]) for pk in tag_ids if pk in names],
+                    ignore_conflicts=True,
+                )
+            usages = TagUsage.objects.filter(category_id=category, tag_id__in=tag_ids)
+            usages.update(num_times=F('num_times') + delta)
+            counts = dict(usages.values_list('tag_id', 'num_times'))
+            remaining = {tag_id for tag_id, count in counts.items() if count > 0}
+            if len(remaining) < len(counts):
+                usages.filter(num_times__lte=0).delete()
+            if delta > 0:
+                new_max = max([old_max, *counts.values()])
+            elif old_max in {count - delta for count in counts.values()}:
+                new_max = _max_num_times(category)
+            else:
+                new_max = old_max
+            if new_max != old_max:
+                refresh_weights(category, max_count=new_max)
+            elif remaining:
+                refresh_weights(category, remaining, new_max)
+
+
+def rebuild_tag_usage() -> int:
+    """
+    Метод полностью пересчитывает таблицу использований тегов по связям taggit.
+    Возвращает кол-во созданных строк.
+    :return: Int
+    """
+    tagged_items = TaggedItem.objects.filter(content_type_id=recipe_content_type_id())
+    category = Subquery(Recipe.objects.filter(pk=OuterRef('object_id')).values('tags_category_id')[:1])
+    per_category = (tagged_items.annotate(category_id=category).exclude(category_id=None)
+                    .values('tag_id', 'tag__name', 'category_id').annotate(num_times=Count('id')).order_by())
+    global_counts = tagged_items.values('tag_id', 'tag__name').annotate(num_times=Count('id')).order_by()
+
+    usages = [TagUsage(tag_id=row['tag_id'], name=row['tag__name'], category_id=row['category_id'],
+                       num_times=row['num_times']) for row in per_category]
+    usages += [TagUsage(tag_id=row['tag_id'], name=row['tag__name'], category_id=None,
+                        num_times=row['num_times']) for row in global_counts]
+
+    with transaction.atomic():
+        TagUsage.objects.all().delete()
+        TagUsage.objects.bulk_create(usages, batch_size=1000)
+        for category_id in {usage.category_id for usage in usages}:
+            refresh_weights(category_id)
+    return len(usages)
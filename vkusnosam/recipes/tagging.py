@@ -0,0 +1,148 @@
+import re
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, Set, Tuple
+
+from django.db import transaction
+from django.db.models import Count
+from taggit.models import Tag, TaggedItem
+
+from .conditional import touch_recipes
+from .models import Recipe, TagKey
+from .page_cache import invalidate_recipe_pages
+from .search import stem_word
+from .signal_guard import suppress_signals
+from .tag_cloud import apply_tag_usage_delta, recipe_content_type_id
+
+WORD_RE = re.compile(r'[\w-]+')
+
+# Длина поля Tag.name в taggit
+MAX_TAG_LENGTH = 100
+
+
+def display_name(name: str) -> str:
+    """
+    Метод приводит название продукта к виду, в котором создается новый тег:
+    ё заменяется на е, лишние пробелы убираются, первая буква заглавная, остальные строчные.
+    "  МУКА   пшеничная" -> "Мука пшеничная"
+    :param name: Str
+    :return: Str
+    """
+    name = ' '.join(name.replace('ё', 'е').replace('Ё', 'Е').split()).lower()
+    return name[:1].upper() + name[1:MAX_TAG_LENGTH]
+
+
+@lru_cache(maxsize=8192)
+def tag_key(name: str) -> str:
+    """
+    Метод возвращает нормализованное название тега: слова в нижнем регистре, ё -> е,
+    каждое слово без окончания (упрощенная лемматизация стеммером поиска).
+    "Яйца куриные" и "яйцо куриное" дают одно название "яйц курин".
+    Названия повторяются от рецепта к рецепту, поэтому результат кэшируется.
+    :param name: Str
+    :return: Str
+    """
+    words = WORD_RE.findall(name.replace('ё', 'е').replace('Ё', 'Е').lower())
+    return ' '.join(stem_word(word) for word in words)[:MAX_TAG_LENGTH]
+
+
+def resolve_tags(names: Iterable[str]) -> Dict[str, int]:
+    """
+    Метод возвращает id тегов для названий продуктов: {нормализованное название: id тега}.
+    Теги ищутся одним запросом по нормализованным названиям. Для нового названия берется тег
+    с тем же видом названия (теги, созданные до нормализации) или создается новый.
+    :param names: названия продуктов
+    :return: Dict
+    """
+    names_by_key = {}
+    for name in names:
+        key = tag_key(name)
+        if key:
+            names_by_key.setdefault(key, display_name(name))
+    tag_ids = dict(TagKey.objects.filter(key__in=names_by_key).values_list('key', 'tag_id'))
+    for key in names_by_key.keys() - tag_ids.keys():
+        tag = Tag.objects.get_or_create(name=names_by_key[key])[0]
+        # Если ключ успел создать параллельный запрос, используется его тег
+        tag_ids[key] = TagKey.objects.get_or_create(key=key, defaults={'tag': tag})[0].tag_id
+    return tag_ids
+
+
+def register_existing_tags() -> int:
+    """
+    Метод записывает нормализованные названия тегов, созданных до нормализации.
+    Из нескольких написаний одного продукта основным становится самый используемый тег,
+    остальные после перевода рецептов (retag_recipes) остаются без связей и удаляются.
+    :return: Int (кол-во записанных названий)
+    """
+    best: Dict[str, int] = {}  # {нормализованное название: id тега}
+    tags = Tag.objects.filter(normalized_key=None).annotate(uses=Count('taggit_taggeditem_items'))
+    for pk, name in tags.order_by('-uses', 'pk').values_list('pk', 'name').iterator():
+        key = tag_key(name)
+        if key:
+            best.setdefault(key, pk)
+    keys = TagKey.objects.bulk_create([TagKey(key=key, tag_id=pk) for key, pk in best.items()],
+                                      ignore_conflicts=True, batch_size=1000)
+    return len(keys)
+
+
+def sync_recipe_tags(recipes: Iterable[Recipe], update_usage: bool = True,
+                     update_similar: bool = True) -> Tuple[int, int]:
+    """
+    Метод приводит теги рецептов к продуктам из поля ingredients.
+    Текущие теги читаются одним запросом, недостающие добавляются одним bulk_create,
+    лишние удаляются одним delete с отключенными обработчиками сигналов, поэтому счетчики облака тегов
+    обновляются здесь (update_usage=False - вызывающий код пересчитает облако сам, см. retag_recipes).
+    :param recipes: рецепты с заполненными pk, ingredients и tags_category_id
+    :param update_usage: обновлять ли счетчики облака тегов
+    :param update_similar: пересчитывать ли похожие рецепты (см. recipes/similar.py)
+    :return: Tuple (кол-во добавленных связей, кол-во удаленных связей)
+    """
+    recipes = list(recipes)
+    tag_ids = resolve_tags(ingredient['name'] for recipe in recipes for ingredient in recipe.ingredients)
+    wanted = {recipe.pk: {tag_ids[tag_key(ingredient['name'])] for ingredient in recipe.ingredients
+                          if tag_key(ingredient['name'])} for recipe in recipes}
+
+    content_type_id = recipe_content_type_id()
+    current: Dict[int, Dict[int, int]] = defaultdict(dict)  # {id рецепта: {id тега: id связи}}
+    for pk, object_id, tag_id in TaggedItem.objects.filter(
+            content_type_id=content_type_id, object_id__in=wanted).values_list('pk', 'object_id', 'tag_id'):
+        current[object_id][tag_id] = pk
+
+    added: Dict[int, Set[int]] = {}
+    removed: Dict[int, Set[int]] = {}
+    for recipe_id, tags in wanted.items():
+        added[recipe_id] = tags - current[recipe_id].keys()
+        removed[recipe_id] = current[recipe_id].keys() - tags
+    changed = [recipe_id for recipe_id in wanted if added[recipe_id] or removed[recipe_id]]
+    if not changed:
+        return 0, 0
+
+    with transaction.atomic():
+        TaggedItem.objects.bulk_create([
+            TaggedItem(content_type_id=content_type_id, object_id=recipe_id, tag_id=tag_id)
+            for recipe_id in changed for tag_id in added[recipe_id]], ignore_conflicts=True)
+        with suppress_signals():  # Счетчики облака, похожие рецепты и кэш страниц обновляются ниже
+            TaggedItem.objects.filter(pk__in=[current[recipe_id][tag_id] for recipe_id in changed
+                                              for tag_id in removed[recipe_id]]).delete()
+        if update_usage:
+            categories = {recipe.pk: recipe.tags_category_id for recipe in recipes}
+            for recipe_id in changed:
+                apply_tag_usage_delta(added[recipe_id], categories[recipe_id], 1)
+                apply_tag_usage_delta(removed[recipe_id], categories[recipe_id], -1)
+        touch_recipes(changed)
+        invalidate_recipe_pages(changed)
+        if update_similar:
+            from .similar import schedule_similar_update  # similar.py сам использует tag_key
+            schedule_similar_update(changed)
+    return sum(len(added[pk]) for pk in changed), sum(len(removed[pk]) for pk in changed)
+
+
+def delete_unused_tags() -> int:
+    """
+    Метод удаляет теги, которые не привязаны ни к одному объекту (например, старые варианты названий
+    после перевода рецептов на нормализованные теги).
+    :return: Int (кол-во удаленных тегов)
+    """
+    unused = Tag.objects.exclude(pk__in=TaggedItem.objects.values('tag_id'))
+    return unused.delete()[1].get(Tag._meta.label, 0)
+
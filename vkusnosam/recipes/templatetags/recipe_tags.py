@@ -1,42 +1,87 @@
 import re
 
 from django import template
-from django.db.models import Avg, Value, QuerySet
-from django.db.models.functions import Coalesce
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
 
-from recipes.models import Rating, Recipe
+from recipes.images import get_variants, variant_url
+from recipes.top_lists import most_viewed_recipes, top_rated_recipes
+from recipes.viewer_state import RecipeViewerState, get_viewer_state
 
 register = template.Library()
 
-@register.simple_tag
-def user_has_rated(user, recipe):
+@register.simple_tag(takes_context=True)
+def prefetch_viewer_state(context, recipes) -> str:
     """
-    Проверяет, поставил ли пользователь оценку для рецепта.
+    Тег загружает для пользователя состояние всех рецептов списка одним пакетом (см. recipes/viewer_state.py),
+    чтобы viewer_state в карточках обходился без запросов.
+    Пример: {% prefetch_viewer_state recipes %} перед циклом по рецептам.
+    :param recipes: рецепты или их id
+    :return: Str (пустая строка)
     """
-    return Rating.objects.filter(user=user, recipe=recipe).exists()
+    get_viewer_state(context['request']).load(recipes)
+    return ''
+
+
+@register.simple_tag(takes_context=True)
+def viewer_state(context, recipe) -> RecipeViewerState:
+    """
+    Тег возвращает отношение пользователя к рецепту: оценку, авторство и комментарии.
+    Пример: {% viewer_state recipe as viewer %}{% if viewer.rated %}...{% endif %}
+    :param recipe: рецепт или его id
+    :return: RecipeViewerState
+    """
+    return get_viewer_state(context['request']).get(recipe)
 
 
 @register.simple_tag
-def rating_recipes_list() -> QuerySet :
+def rating_recipes_list() -> list:
     """
     Метод для создания списка популярных рецептов.
-    Возвращает первые четыре позиции.
-    :return: QuerySet
+    Возвращает первые четыре позиции из кэша (см. recipes/top_lists.py).
+    :return: List
     """
-    queryset = Recipe.objects.all().annotate(average_rating=Coalesce(Avg('ratings__score'), Value(0.0)))
-    rating_list = queryset.filter(average_rating__gte=4).order_by('-average_rating')[:4]
-    return rating_list
+    return top_rated_recipes.get()
 
 
 @register.simple_tag
-def viewing_quantity_recipes() -> QuerySet :
+def viewing_quantity_recipes() -> list:
     """
     Метод для создания списка рецептов с наибольшим количеством просмотров.
-    Возвращает первые четыре позиции.
-    :return: QuerySet
+    Возвращает первые четыре позиции из кэша (см. recipes/top_lists.py).
+    :return: List
     """
-    queryset = Recipe.objects.all().order_by('-views')[:4]
-    return queryset
+    return most_viewed_recipes.get()
+
+
+@register.simple_tag
+def responsive_image(file, sizes: str, **attrs) -> str:
+    """
+    Тег выводит изображение с уменьшенными вариантами (см. recipes/images.py):
+    <picture> с WebP-вариантами и JPEG-вариантами в srcset, из которых браузер выбирает
+    подходящий по ширине sizes. Пока варианты не готовы, выводится исходный файл.
+    Пример: {% responsive_image rec.image '175px' alt=rec.name width=175 height=175 %}
+    :param file: поле с изображением (FieldFile)
+    :param sizes: ширина изображения на странице (атрибут sizes)
+    :param attrs: атрибуты тега <img>
+    :return: Str
+    """
+    attributes = format_html_join('', ' {}="{}"', attrs.items())
+    variants = get_variants(file)
+    if not variants.get('jpeg'):
+        return format_html('<img src="{}"{}>', file.url, attributes)
+
+    def srcset(image_format: str) -> str:
+        widths = sorted(variants.get(image_format, {}).items(), key=lambda item: int(item[0]))
+        return ', '.join(f'{default_storage.url(name)} {width}w' for width, name in widths)
+
+    # Для src (браузеры без srcset) берем вариант под ширину из sizes, а если она не в пикселях - самый большой
+    display_width = int(sizes[:-2]) if sizes.endswith('px') and sizes[:-2].isdigit() else float('inf')
+    src = variant_url(file, display_width)
+    webp = format_html('<source type="image/webp" srcset="{}" sizes="{}">', srcset('webp'), sizes) \
+        if variants.get('webp') else ''
+    return format_html('<picture>{}<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+                       webp, src, srcset('jpeg'), sizes, attributes)
 
 
 @register.filter
@@ -1,3 +1,1255 @@
-from django.test import TestCase
+import base64
+import datetime
+import json
+import os
+import tempfile
+import traceback
+from contextlib import contextmanager
+from io import BytesIO, StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY, get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count, QuerySet
+from django.db.backends.utils import CursorWrapper
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.urls import include, path, reverse
+from PIL import Image
+from taggit.models import Tag, TaggedItem
+
+from recipes.conditional import catalog_state
+from recipes.db_router import ReplicaRouter, RoutingState, _state
+from recipes.images import build_variants, store_variants
+from recipes.ingredient_index import clear_bitmap_cache, search_by_ingredients
+from recipes.minhash import minhash, similarity
+from recipes.models import (Comment, IngredientIndex, Rating, Recipe, RecipeStepPreparing, SimilarRecipe, TagKey,
+                            TagsCategory, TagUsage)
+from recipes.pagination import encode_cursor
+from recipes.search import HIGHLIGHT_END, HIGHLIGHT_START, SqliteFTSBackend, highlight_to_html
+from recipes.slugs import allocate_slugs, translit_to_eng
+from recipes.tagging import sync_recipe_tags, tag_key
+from recipes.tag_cloud import apply_tag_usage_delta, rebuild_tag_usage
+from recipes.top_lists import most_viewed_recipes, top_rated_recipes
+from recipes.transfer import export_queryset, serialize_recipe
+from recipes.urls import get_urlpatterns
+from recipes.view_counter import ViewCounter, view_counter
+from recipes.viewer_state import ViewerState
+
+# Продукты, из которых собираются рецепты и теги тестового каталога
+PRODUCTS = ['Мука', 'Молоко', 'Яйцо', 'Сахар', 'Соль', 'Масло сливочное', 'Картофель', 'Морковь',
+            'Лук репчатый', 'Свекла', 'Капуста', 'Говядина', 'Курица', 'Рис', 'Сметана', 'Чеснок']
+
+
+def seed_catalog(scale: int) -> dict:
+    """
+    Метод наполняет базу тестовым каталогом.
+    scale - кол-во объектов в каждой растущей связи: рецептов у автора, в категории и с тегом,
+    комментариев и оценок у рецепта, комментариев у пользователя.
+    Шагов приготовления в рецепте не бывает больше нескольких десятков, поэтому их не больше 30.
+    Объекты создаются через bulk_create, поэтому счетчики рецепта заполняются сразу.
+    :param scale: Int
+    :return: Dict (главные объекты каталога)
+    """
+    user_model = get_user_model()
+    author = user_model.objects.create_user('author', 'author@example.com', 'author-password')
+    reader = user_model.objects.create_user('reader', 'reader@example.com', 'reader-password')
+    users = user_model.objects.bulk_create(
+        [user_model(username=f'user{i}', password='!') for i in range(scale)], batch_size=1000)
+    category = TagsCategory.objects.create(name='Супы', slug='soups')
+    TagsCategory.objects.create(name='Выпечка', slug='bakery')
+
+    recipes = []
+    for i in range(scale):
+        products = PRODUCTS[i % len(PRODUCTS):] + PRODUCTS[:i % len(PRODUCTS)]
+        recipe = Recipe(name=f'Рецепт {i}', slug=f'recipe-{i}', user=author, tags_category=category,
+                        description=f'Описание рецепта {i}', products=''.join(f'{p} - 100 гр.;\n' for p in products[:4]),
+                        time_preparing=30, calorie=200 + i, views=i,
+                        rating_sum=4 * (i % 5 + 1), rating_count=4, rating_average=i % 5 + 1)
+        recipe.ingredients = [{'name': p, 'quantity': '100', 'unit': 'гр'} for p in products[:4]]
+        recipes.append(recipe)
+    recipes = Recipe.objects.bulk_create(recipes, batch_size=1000)
+    main_recipe = recipes[0]
+
+    tags = Tag.objects.bulk_create([Tag(name=p.lower(), slug=f'tag-{i}') for i, p in enumerate(PRODUCTS)])
+    content_type = ContentType.objects.get_for_model(Recipe)
+    TaggedItem.objects.bulk_create(
+        [TaggedItem(tag=tags[(i + k) % len(tags)], content_type=content_type, object_id=recipe.pk)
+         for i, recipe in enumerate(recipes) for k in range(3)] +
+        [TaggedItem(tag=tags[0], content_type=content_type, object_id=recipe.pk)
+         for i, recipe in enumerate(recipes) if i % len(tags) not in (0, len(tags) - 1, len(tags) - 2)],
+        batch_size=1000)
+    rebuild_tag_usage()
+
+    Comment.objects.bulk_create(
+        [Comment(user=users[i], recipe=main_recipe, content=f'Комментарий {i}') for i in range(scale)] +
+        [Comment(user=reader, recipe=recipes[i], content=f'Комментарий читателя {i}') for i in range(scale)],
+        batch_size=1000)
+    Rating.objects.bulk_create([Rating(user=users[i], recipe=main_recipe, score=i % 5 + 1) for i in range(scale)],
+                               batch_size=1000)
+    Recipe.objects.filter(pk=main_recipe.pk).update(
+        comments_count=scale + 1, rating_count=scale, rating_sum=sum(i % 5 + 1 for i in range(scale)),
+        rating_average=sum(i % 5 + 1 for i in range(scale)) / scale)
+    RecipeStepPreparing.objects.bulk_create(
+        [RecipeStepPreparing(recipe=main_recipe, users=author, step_description=f'Шаг {i}')
+         for i in range(min(scale, 30))])
+    return {'author': author, 'reader': reader, 'category': category, 'recipe': main_recipe, 'tag': tags[0]}
+
+
+class QueryBudget:
+    """
+    Счетчик SQL-запросов и строк, выбранных из базы, внутри блока with.
+    Для каждого запроса запоминает стек вызовов в коде проекта, чтобы показать, откуда он выполнен.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.rows = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')):
+            # Точки сохранения появляются из-за транзакции теста, на сайте вместо них обычная транзакция
+            return execute(sql, params, many, context)
+        stack = [frame for frame in traceback.extract_stack()[:-1]
+                 if frame.filename.startswith(str(settings.BASE_DIR))
+                 and not frame.filename.endswith(('tests.py', 'manage.py'))]
+        self.queries.append((sql, traceback.format_list(stack)))
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def capture(self):
+        # CursorWrapper передает fetch* курсору базы через __getattr__, поэтому методы добавляются на время теста
+        budget = self
+
+        def fetchone(cursor):
+            row = cursor.cursor.fetchone()
+            budget.rows += row is not None
+            return row
+
+        def fetchmany(cursor, *args):
+            rows = cursor.cursor.fetchmany(*args)
+            budget.rows += len(rows)
+            return rows
+
+        def fetchall(cursor):
+            rows = cursor.cursor.fetchall()
+            budget.rows += len(rows)
+            return rows
+
+        with patch.object(CursorWrapper, 'fetchone', fetchone, create=True), \
+                patch.object(CursorWrapper, 'fetchmany', fetchmany, create=True), \
+                patch.object(CursorWrapper, 'fetchall', fetchall, create=True), \
+                connection.execute_wrapper(self):
+            yield self
+
+    def report(self) -> str:
+        """
+        Метод возвращает список выполненных запросов вместе со стеками вызовов.
+        :return: Str
+        """
+        lines = [f'Запросов: {len(self.queries)}, строк: {self.rows}']
+        for number, (sql, stack) in enumerate(self.queries, 1):
+            lines.append(f'\n{number}. {sql}')
+            lines.extend(f'    {line.rstrip()}' for line in stack)
+        return '\n'.join(lines)
+
+
+class QueryBudgetMixin:
+    """
+    Миксин для тестов с проверкой кол-ва запросов и выбранных строк на страницу.
+    """
+    scale = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.catalog = seed_catalog(cls.scale)
+
+    def setUp(self):
+        cache.clear()  # Блоки сайдбаров пересчитываются в каждом тесте, чтобы бюджет не зависел от порядка тестов
+        # Просмотры не записываются в базу посреди запроса, а буфер сбрасывается до отката транзакции теста
+        settings_override = override_settings(RECIPE_VIEWS_FLUSH_INTERVAL=3600)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(view_counter.flush)
+
+    def assertWithinBudget(self, url: str, max_queries: int, max_rows: int, user=None, status_code: int = 200,
+                           headers=None):
+        """
+        Метод запрашивает страницу и проверяет, что кол-во запросов и выбранных строк не превышает бюджет.
+        :param url: адрес страницы
+        :param max_queries: максимальное кол-во запросов
+        :param max_rows: максимальное кол-во выбранных строк
+        :param user: пользователь, от имени которого запрашивается страница (None - аноним)
+        :param status_code: ожидаемый код ответа
+        :param headers: заголовки запроса
+        """
+        if user is not None:
+            self.client.force_login(user)
+        elif settings.SESSION_COOKIE_NAME in self.client.cookies and SESSION_KEY in self.client.session:
+            self.client.logout()  # Сессия анонима (например, с токеном сброса пароля) сохраняется
+        budget = QueryBudget()
+        with budget.capture():
+            response = self.client.get(url, headers=headers)
+        self.assertEqual(response.status_code, status_code)
+        self.assertLessEqual(len(budget.queries), max_queries,
+                             f'Превышен бюджет запросов для {url}\n{budget.report()}')
+        self.assertLessEqual(budget.rows, max_rows,
+                             f'Превышен бюджет выбранных строк для {url}\n{budget.report()}')
+        return response
+
+
+# Авторизованный пользователь добавляет 2 запроса (сессия и пользователь) и 2 строки
+SESSION_QUERIES = SESSION_ROWS = 2
+
+
+class RecipesQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Бюджет запросов для страниц приложения recipes на каталоге, где в каждой связи 10 объектов.
+    """
+
+    def users(self):
+        return [(None, 0), (self.catalog['reader'], SESSION_QUERIES)]
+
+    def test_home(self):
+        for user, extra in self.users():
+            for query in ('', '?sort_by=time_create', '?sort_by=-comments_quantity', '?sort_by_ratings=-ratings',
+                          '?search=мука', '?page=2'):
+                with self.subTest(user=user, query=query):
+                    # Список рецептов, два блока сайдбара, COUNT(*) только при пагинации по номерам страниц;
+                    # авторизованному - его оценки и комментарии рецептов страницы
+                    viewer = 2 if user else 0
+                    self.assertWithinBudget(reverse('home') + query, 4 + viewer + extra,
+                                            5 + 4 + 4 + 1 + 4 * viewer + extra, user)
+
+    def test_home_next_page(self):
+        response = self.client.get(reverse('home'))
+        cursor = response.context['page_obj'].next_cursor
+        self.assertWithinBudget(f"{reverse('home')}?cursor={cursor}", 3, 5 + 4 + 4)
+
+    def test_recipe_detail(self):
+        url = self.catalog['recipe'].get_absolute_url()
+        # Рецепт с автором, шаги, первая страница комментариев с авторами, похожие рецепты;
+        # авторизованному - его оценка и комментарии рецепта
+        similar = settings.RECIPE_SIMILAR_COUNT
+        self.assertWithinBudget(url, 4, 1 + 30 + 20 + similar)
+        self.assertWithinBudget(url, 6 + SESSION_QUERIES, 1 + 30 + 20 + similar + 2 + SESSION_ROWS,
+                                self.catalog['reader'])
+
+    def test_recipe_comments(self):
+        url = reverse('recipe_comments', args=[self.catalog['recipe'].slug])
+        # Рецепт по slug и страница комментариев с авторами (на один комментарий больше, чтобы узнать о следующей)
+        self.assertWithinBudget(url, 2, 1 + 21)
+        self.assertWithinBudget(url + '?format=json', 2, 1 + 21)
+
+    def test_tag_cloud(self):
+        for user, extra in self.users():
+            with self.subTest(user=user):
+                tags = len(PRODUCTS)
+                self.assertWithinBudget(reverse('tag_cloud_by_category'), 2 + extra, tags + 2 + extra, user)
+                self.assertWithinBudget(reverse('tag_cloud_by_category', args=['soups']),
+                                        3 + extra, 1 + tags + 2 + extra, user)
+
+    def test_tagged_recipes(self):
+        url = reverse('tagged_recipes', args=[self.catalog['tag'].slug])
+        for user, extra in self.users():
+            with self.subTest(user=user):
+                self.assertWithinBudget(url, 2 + extra, 1 + 21 + extra, user)
+
+    def test_create_recipe(self):
+        self.assertWithinBudget(reverse('create_recipe'), 0, 0, status_code=302)
+        self.assertWithinBudget(reverse('create_recipe'), 1 + SESSION_QUERIES, 2 + SESSION_ROWS,
+                                self.catalog['author'])
+
+    def test_update_and_delete_recipe(self):
+        for name in ('update_recipe', 'delete_recipe'):
+            url = reverse(name, args=[self.catalog['recipe'].slug])
+            with self.subTest(page=name):
+                self.assertWithinBudget(url, 1, 1, status_code=302)
+                self.assertWithinBudget(url, 1 + SESSION_QUERIES, 1 + SESSION_ROWS, self.catalog['reader'],
+                                        status_code=403)
+                # Рецепт загружается один раз; на странице изменения еще список категорий
+                self.assertWithinBudget(url, 2 + SESSION_QUERIES, 1 + 2 + SESSION_ROWS, self.catalog['author'])
+
+
+# Маршруты с асинхронными вариантами страниц (для AsyncRecipesQueryBudgetTests)
+urlpatterns = [
+    path('', include(get_urlpatterns(async_views=True))),
+    path('users/', include('users.urls')),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncRecipesQueryBudgetTests(RecipesQueryBudgetTests):
+    """
+    Те же бюджеты для асинхронных вариантов страниц (recipes/async_views.py).
+    """
+
+
+class LargeCatalogRecipesQueryBudgetTests(RecipesQueryBudgetTests):
+    """
+    Те же бюджеты на каталоге, где в каждой связи 10 000 объектов.
+    """
+    scale = 10_000
+
+
+@override_settings(RECIPE_COMMENTS_PAGE_SIZE=4)
+class RecipeCommentsTests(QueryBudgetMixin, TestCase):
+    """
+    Постраничная подгрузка комментариев рецепта.
+    """
+
+    def expected_ids(self) -> list:
+        return list(Comment.objects.filter(recipe=self.catalog['recipe']).order_by('-time_create', '-pk')
+                    .values_list('pk', flat=True))
+
+    def next_url(self, page) -> str:
+        return page.has_next() and \
+            f"{reverse('recipe_comments', args=[self.catalog['recipe'].slug])}?cursor={page.next_cursor}"
+
+    def test_invalid_cursor_values(self):
+        # Токен правильного формата, но значения ключа не того типа - 404, а не 500
+        tokens = [base64.urlsafe_b64encode(json.dumps(data).encode()).decode() for data in (
+            {'v': ['abc', 1], 'd': 'n'}, {'v': [None, None], 'd': 'n'}, {'v': [{'a': 1}, 1], 'd': 'n'},
+            {'v': ['2020-01-01T00:00:00', 'x'], 'd': 'n'})]
+        self.client.force_login(self.catalog['author'])
+        for url in (reverse('home'), reverse('recipe_comments', args=[self.catalog['recipe'].slug]),
+                    reverse('tagged_recipes', args=[self.catalog['tag'].slug]), reverse('users:profile_recipes')):
+            for token in tokens:
+                with self.subTest(url=url, token=token):
+                    self.assertEqual(self.client.get(url, {'cursor': token}).status_code, 404)
+
+    def test_fragments(self):
+        response = self.client.get(self.catalog['recipe'].get_absolute_url())
+        self.assertContains(response, 'class="load-more"', count=1)
+        ids = [comment.pk for comment in response.context['comments_page']]
+        url = self.next_url(response.context['comments_page'])
+        while url:
+            page = self.client.get(url).context['comments_page']
+            ids += [comment.pk for comment in page]
+            url = self.next_url(page)
+        self.assertEqual(ids, self.expected_ids())
+
+    def test_json(self):
+        url = reverse('recipe_comments', args=[self.catalog['recipe'].slug]) + '?format=json'
+        ids = []
+        while url:
+            data = self.client.get(url).json()
+            ids += [comment['id'] for comment in data['comments']]
+            url = data['next'] and data['next'] + '&format=json'
+        self.assertEqual(ids, self.expected_ids())
+
+    def test_last_page_has_no_link(self):
+        recipe = self.catalog['recipe']
+        Comment.objects.filter(recipe=recipe).exclude(pk__in=self.expected_ids()[:4]).delete()
+        Recipe.objects.filter(pk=recipe.pk).update(comments_count=4)
+        response = self.client.get(recipe.get_absolute_url())
+        self.assertEqual(len(response.context['comments_page']), 4)
+        self.assertNotContains(response, 'class="load-more"')
+
+    def test_unknown_recipe(self):
+        self.assertEqual(self.client.get(reverse('recipe_comments', args=['no-such-recipe'])).status_code, 404)
+
+
+class ConditionalGetTests(QueryBudgetMixin, TestCase):
+    """
+    Ответы 304 на повторные запросы страниц рецептов с актуальным ETag.
+    """
+
+    def test_recipe_detail(self):
+        recipe = self.catalog['recipe']
+        url = recipe.get_absolute_url()
+        etag = self.client.get(url)['ETag']
+        # Только запрос рецепта, шаблон не рендерится
+        response = self.assertWithinBudget(url, 1, 1, status_code=304, headers={'If-None-Match': etag})
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(response.templates)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(user=self.catalog['reader'], recipe=recipe, content='Новый комментарий')
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_listings(self):
+        for url in (reverse('home'), reverse('tagged_recipes', args=[self.catalog['tag'].slug])):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                self.assertWithinBudget(url, 0, 0, status_code=304, headers={'If-None-Match': etag})
+
+                with self.captureOnCommitCallbacks(execute=True):
+                    Rating.objects.create(user=self.catalog['reader'], recipe=self.catalog['recipe'], score=5)
+                self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+                Rating.objects.filter(user=self.catalog['reader']).delete()
+
+    def test_etag_depends_on_user(self):
+        url = self.catalog['recipe'].get_absolute_url()
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.catalog['reader'])
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+
+
+class PageCacheTests(QueryBudgetMixin, TestCase):
+    """
+    Кэш страниц для анонимных посетителей.
+    """
+
+    def test_recipe_detail(self):
+        recipe = self.catalog['recipe']
+        url = recipe.get_absolute_url()
+        self.client.get(url)
+        self.client.get(url)
+        views = view_counter.pending(recipe.pk)
+        response = self.assertWithinBudget(url, 0, 0)
+        self.assertEqual(view_counter.pending(recipe.pk), views + 1)
+        self.assertNotIn('csrfmiddlewaretoken', response.content.decode())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(user=self.catalog['reader'], recipe=recipe, content='Свежий комментарий')
+        self.assertContains(self.client.get(url), 'Свежий комментарий')
+
+    def test_listing_query_is_normalized(self):
+        url = reverse('home')
+        self.client.get(f'{url}?sort_by=time_create&search=')
+        self.assertWithinBudget(f'{url}?utm_source=mail&sort_by=time_create', 0, 0)
+        self.assertWithinBudget(f'{url}?sort_by=-time_create', 4, 5 + 4 + 4 + 1)
+
+    def test_authenticated_user_bypasses_cache(self):
+        url = self.catalog['recipe'].get_absolute_url()
+        for _ in range(3):
+            self.client.get(url)
+        response = self.assertWithinBudget(url, 6 + SESSION_QUERIES,
+                                           1 + 30 + 20 + settings.RECIPE_SIMILAR_COUNT + 2 + SESSION_ROWS,
+                                           self.catalog['reader'])
+        self.assertTrue(response.templates)  # Страница отрисована, а не взята из кэша
+        self.assertIn('csrfmiddlewaretoken', response.content.decode())
+
+
+class TopListsTests(TestCase):
+    """
+    Списки популярных рецептов в сайдбарах.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='rater', password='password')
+        self.recipe = Recipe.objects.create(name='Блины')
+
+    def test_expire_after_commit(self):
+        top_rated_recipes.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            Rating.objects.create(user=self.user, recipe=self.recipe, score=5)
+            # До фиксации список не устаревает: пересчет прочитал бы данные без новой оценки
+            self.assertTrue(cache.get(top_rated_recipes.cache_key)[0])
+        self.assertFalse(cache.get(top_rated_recipes.cache_key)[0])
+        self.assertEqual(top_rated_recipes.get(), [self.recipe])
+
+    def test_value_change_keeps_catalog_generation(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            most_viewed_recipes.get()
+        generation = catalog_state()[0]
+        Recipe.objects.filter(pk=self.recipe.pk).update(views=100)
+        with self.captureOnCommitCallbacks(execute=True):
+            most_viewed_recipes.expire()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(most_viewed_recipes.get()[0].views, 100)
+        # Просмотры в сайдбаре не выводятся - страницы списков перерисовывать не нужно
+        self.assertEqual(catalog_state()[0], generation)
+
+        Recipe.objects.filter(pk=self.recipe.pk).update(name='Блинчики')
+        with self.captureOnCommitCallbacks(execute=True):
+            most_viewed_recipes.expire()
+        with self.captureOnCommitCallbacks(execute=True):
+            most_viewed_recipes.get()
+        self.assertGreater(catalog_state()[0], generation)
+
+
+@override_settings(RECIPE_VIEWS_FLUSH_INTERVAL=3600)
+class ViewCounterTests(TestCase):
+    """
+    Буферизованный счетчик просмотров рецептов.
+    """
+
+    def setUp(self):
+        self.counter = ViewCounter()
+        self.recipes = [Recipe.objects.create(name=f'Рецепт {i}', views=10 * i) for i in range(3)]
+
+    def views(self) -> list:
+        return list(Recipe.objects.order_by('pk').values_list('views', flat=True))
+
+    def test_batched_flush(self):
+        self.counter.batch_size = 2
+        for recipe, count in zip(self.recipes, (3, 1, 2)):
+            for _ in range(count):
+                self.counter.increment(recipe.pk)
+        self.assertEqual(self.views(), [0, 10, 20])  # До сброса в базу ничего не пишется
+        with self.assertNumQueries(2):  # Один UPDATE с CASE на пакет из batch_size рецептов
+            self.assertEqual(self.counter.flush(), 6)
+        self.assertEqual(self.views(), [3, 11, 22])
+        self.assertEqual(self.counter.pending(self.recipes[0].pk), 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.counter.flush(), 0)
+
+    def test_current_views_includes_pending(self):
+        self.addCleanup(view_counter.flush)
+        recipe = self.recipes[1]
+        view_counter.flush()
+        recipe.increment_views()
+        view_counter.increment(recipe.pk, 2)
+        self.assertEqual((recipe.views, recipe.current_views), (10, 13))
+        view_counter.flush()
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.views, recipe.current_views), (13, 13))
+
+    def test_increments_during_flush(self):
+        recipe = self.recipes[0]
+        self.counter.increment(recipe.pk, 2)
+        update = QuerySet.update
+
+        def update_with_concurrent_view(queryset, **kwargs):
+            # Просмотр, пришедший во время сброса, попадает в новый буфер, а второй сброс ничего не делает
+            self.counter.increment(recipe.pk)
+            self.assertEqual(self.counter.pending(recipe.pk), 3)
+            self.assertEqual(self.counter.flush(), 0)
+            return update(queryset, **kwargs)
+
+        with patch.object(QuerySet, 'update', update_with_concurrent_view):
+            self.assertEqual(self.counter.flush(), 2)
+        self.assertEqual(self.counter.pending(recipe.pk), 1)
+        self.assertEqual(self.counter.flush(), 1)
+        self.assertEqual(self.views()[0], 3)
+
+    def test_failed_flush_keeps_views(self):
+        self.counter.increment(self.recipes[0].pk, 4)
+        with patch.object(QuerySet, 'update', side_effect=DatabaseError), \
+                self.assertLogs('recipes.view_counter', 'ERROR'):
+            self.assertEqual(self.counter.flush(), 0)
+        self.assertEqual(self.counter.pending(self.recipes[0].pk), 4)
+        self.assertEqual(self.counter.flush(), 4)
+        self.assertEqual(self.views()[0], 4)
+
+
+class SeedCatalogTests(TestCase):
+    """
+    Команда seed_catalog: при одинаковом --seed создаются одинаковые данные.
+    """
+
+    def seed(self) -> tuple:
+        with transaction.atomic():
+            call_command('seed_catalog', users=3, recipes=5, seed=7, skip_search_index=True,
+                         skip_similar_recipes=True, stdout=StringIO())
+            recipes = list(Recipe.objects.order_by('pk').values_list('name', 'slug', 'time_create', 'time_update'))
+            comments = list(Comment.objects.order_by('pk').values_list('content', 'time_create'))
+            tags = list(Tag.objects.order_by('name').annotate(recipes=Count('taggit_taggeditem_items'))
+                        .values_list('name', 'recipes'))
+            self.assertEqual(TagKey.objects.count(), len(tags))  # Теги созданы через tagging.resolve_tags
+            transaction.set_rollback(True)
+        return recipes + comments, tags
+
+    def test_deterministic(self):
+        first = self.seed()
+        self.assertEqual(self.seed(), first)
+        self.assertTrue(all(row[-1].year == 2024 for row in first[0]))  # Даты отсчитываются от --now, а не от часов
+        self.assertTrue(any(count for _, count in first[1]))
+
+
+class ImportRecipesTests(TestCase):
+    """
+    Загрузка рецептов командой import_recipes.
+    """
+
+    def test_update_existing_recipe(self):
+        recipe = Recipe.objects.create(name='Блины', slug='bliny')
+        Recipe.objects.filter(pk=recipe.pk).update(time_update=recipe.time_update - datetime.timedelta(days=1))
+        time_update = Recipe.objects.get(pk=recipe.pk).time_update
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'recipes.jsonl')
+            with open(path, 'w', encoding='utf-8') as dump:
+                data = serialize_recipe(export_queryset().get(pk=recipe.pk))
+                dump.write(json.dumps({**data, 'name': 'Блины на молоке'}) + '\n')
+            call_command('import_recipes', path, skip_search_index=True, skip_similar_recipes=True, stdout=StringIO())
+        recipe = Recipe.objects.get(pk=recipe.pk)
+        self.assertEqual(recipe.name, 'Блины на молоке')
+        self.assertGreater(recipe.time_update, time_update)  # Иначе страница рецепта отдавала бы старый ETag
+
+    def test_cached_page_is_refreshed(self):
+        recipe = Recipe.objects.create(name='Блины', slug='bliny')
+        self.addCleanup(view_counter.flush)
+        for _ in range(2):
+            self.assertContains(self.client.get(recipe.get_absolute_url()), 'Блины')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'recipes.jsonl')
+            with open(path, 'w', encoding='utf-8') as dump:
+                data = serialize_recipe(export_queryset().get(pk=recipe.pk))
+                dump.write(json.dumps({**data, 'name': 'Блины на молоке'}) + '\n')
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('import_recipes', path, skip_search_index=True, skip_similar_recipes=True,
+                             stdout=StringIO())
+        self.assertContains(self.client.get(recipe.get_absolute_url()), 'Блины на молоке')
+
+    def test_reimport_keeps_counters(self):
+        users = [get_user_model().objects.create_user(username=f'user{i}', password='password') for i in range(2)]
+        recipe = Recipe.objects.create(name='Блины', slug='bliny', user=users[0])
+        for user, score in zip(users, (4, 5)):
+            Rating.objects.create(user=user, recipe=recipe, score=score)
+        Comment.objects.create(user=users[1], recipe=recipe, content='Вкусно')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'recipes.jsonl')
+            with open(path, 'w', encoding='utf-8') as dump:
+                dump.write(json.dumps(serialize_recipe(export_queryset().get(pk=recipe.pk))) + '\n')
+            call_command('import_recipes', path, skip_search_index=True, skip_similar_recipes=True, stdout=StringIO())
+        recipe = Recipe.objects.get(pk=recipe.pk)
+        # Прежние оценки и комментарий удалены без обработчиков сигналов, счетчики взяты из выгрузки
+        self.assertEqual((recipe.rating_count, recipe.rating_sum, recipe.comments_count), (2, 9, 1))
+        self.assertEqual((recipe.ratings.count(), recipe.comments.count()), (2, 1))
+
+
+    def test_tags_are_normalized(self):
+        tag = Tag.objects.create(name='Яйцо куриное', slug='yajco-kurinoe')
+        TagKey.objects.create(key=tag_key(tag.name), tag=tag)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'recipes.jsonl')
+            with open(path, 'w', encoding='utf-8') as dump:
+                recipe = {field: '' for field in ('description', 'products')}
+                recipe.update(slug='omlet', name='Омлет', views=0, number_servings=1, time_preparing=10, calorie=100,
+                              tags=['яйца куриные', 'Яйцо куриное', 'Молоко'])
+                dump.write(json.dumps(recipe) + '\n')
+            call_command('import_recipes', path, skip_search_index=True, skip_similar_recipes=True, stdout=StringIO())
+        recipe = Recipe.objects.get(slug='omlet')
+        self.assertEqual(sorted(recipe.tags.values_list('name', flat=True)), ['Молоко', 'Яйцо куриное'])
+        self.assertEqual(TagKey.objects.get(key=tag_key('молоко')).tag.name, 'Молоко')
+
+def make_image(width: int = 400, height: int = 300, name: str = 'photo.jpg') -> SimpleUploadedFile:
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), 'orange').save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class ImageVariantsTests(TestCase):
+    """
+    Уменьшенные варианты изображений: построение, сохранение и вывод на страницах.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name, IMAGE_VARIANTS_ASYNC=False,
+                                  IMAGE_VARIANT_WIDTHS=(100, 200, 1000), IMAGE_VARIANT_FORMATS=('webp', 'jpeg'))
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(view_counter.flush)
+
+    def create_recipe(self) -> Recipe:
+        with self.captureOnCommitCallbacks():  # Варианты не строятся: задача ставится после фиксации
+            return Recipe.objects.create(name='Блины', image=make_image())
+
+    def test_detail_etag_changes_when_variants_stored(self):
+        recipe = self.create_recipe()
+        url = recipe.get_absolute_url()
+        response = self.client.get(url)
+        self.assertNotContains(response, '<picture>')
+        with self.captureOnCommitCallbacks(execute=True):
+            store_variants('recipes.Recipe', recipe.pk, 'image',
+                           build_variants(recipe.image.name, (100, 200), ('webp', 'jpeg'), 80))
+        response = self.client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<picture>')
+
+    def test_build_variants(self):
+        recipe = self.create_recipe()
+        stem = os.path.splitext(recipe.image.name)[0]
+        variants = build_variants(recipe.image.name, (100, 200, 1000), ('webp', 'jpeg'), 80)
+        # Варианта шире исходного файла нет, вместо него - вариант исходной ширины
+        self.assertEqual(variants, {
+            'source': recipe.image.name,
+            'webp': {str(width): f'variants/{stem}-{width}.webp' for width in (100, 200, 400)},
+            'jpeg': {str(width): f'variants/{stem}-{width}.jpg' for width in (100, 200, 400)},
+        })
+        with default_storage.open(variants['jpeg']['100']) as file:
+            self.assertEqual(Image.open(file).size, (100, 75))
+        with default_storage.open(variants['webp']['200']) as file:
+            self.assertEqual(Image.open(file).format, 'WEBP')
+
+    def test_store_variants_of_replaced_image(self):
+        recipe = self.create_recipe()
+        variants = build_variants(recipe.image.name, (100,), ('jpeg',), 80)
+        # Пока строились варианты, изображение сменили: варианты прежнего файла не сохраняются и удаляются
+        Recipe.objects.filter(pk=recipe.pk).update(image='recipe_image/other.jpg')
+        store_variants('recipes.Recipe', recipe.pk, 'image', variants)
+        self.assertEqual(Recipe.objects.get(pk=recipe.pk).image_variants, {})
+        self.assertFalse(default_storage.exists(variants['jpeg']['100']))
+
+    def test_schedule_variants_removes_variants_of_cleared_image(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(name='Блины', image=make_image())
+        recipe.refresh_from_db()
+        names = list(recipe.image_variants['jpeg'].values()) + list(recipe.image_variants['webp'].values())
+        self.assertTrue(all(default_storage.exists(name) for name in names))
+
+        recipe.image = None
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.save()
+        self.assertEqual(Recipe.objects.get(pk=recipe.pk).image_variants, {})
+        self.assertFalse(any(default_storage.exists(name) for name in names))
+
+    def test_responsive_image(self):
+        recipe = self.create_recipe()
+        template = Template("{% load recipe_tags %}{% responsive_image recipe.image '175px' alt=recipe.name %}")
+        self.assertHTMLEqual(template.render(Context({'recipe': recipe})),
+                             f'<img src="{recipe.image.url}" alt="Блины">')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            store_variants('recipes.Recipe', recipe.pk, 'image',
+                           build_variants(recipe.image.name, (100, 200), ('webp', 'jpeg'), 80))
+        recipe.refresh_from_db()
+        stem = f'{settings.MEDIA_URL}variants/{os.path.splitext(recipe.image.name)[0]}'
+        self.assertHTMLEqual(template.render(Context({'recipe': recipe})), f'''
+            <picture>
+                <source type="image/webp" srcset="{stem}-100.webp 100w, {stem}-200.webp 200w" sizes="175px">
+                <img src="{stem}-200.jpg" srcset="{stem}-100.jpg 100w, {stem}-200.jpg 200w" sizes="175px"
+                     alt="Блины">
+            </picture>''')
+
+
+class SearchTests(TestCase):
+    """
+    Полнотекстовый поиск рецептов (SqliteFTSBackend) и подсветка совпадений.
+    """
+
+    def setUp(self):
+        self.backend = SqliteFTSBackend()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.borscht = Recipe.objects.create(name='<script>alert(1)</script> Борщ украинский',
+                                                 products='Свекла - 1 шт.;\n<b>Капуста</b> - 300 гр.;')
+            self.pancakes = Recipe.objects.create(name='Блины', products='Мука - 200 гр.;\nМолоко - 500 мл.;')
+
+    def test_highlight_to_html(self):
+        self.assertEqual(highlight_to_html(f'<i>{HIGHLIGHT_START}a & b{HIGHLIGHT_END}</i>'),
+                         '&lt;i&gt;<mark>a &amp; b</mark>&lt;/i&gt;')
+        self.assertEqual(highlight_to_html(None), '')
+
+    def test_recipe_text_is_escaped(self):
+        hits = self.backend.search('борща капусту', limit=10)
+        self.assertEqual([hit.recipe_id for hit in hits], [self.borscht.pk])
+        self.assertEqual(hits[0].name_highlighted,
+                         '&lt;script&gt;alert(1)&lt;/script&gt; <mark>Борщ</mark> украинский')
+        self.assertIn('&lt;b&gt;<mark>Капуста</mark>&lt;/b&gt;', hits[0].snippet)
+
+        self.addCleanup(view_counter.flush)
+        response = self.client.get(reverse('home') + '?search=борщ')
+        self.assertContains(response, '&lt;script&gt;alert(1)&lt;/script&gt; <mark>Борщ</mark>')
+        self.assertNotContains(response, '<script>alert(1)')
+
+    def test_stemmed_and_transliterated_query(self):
+        for query, recipe in (('борщи', self.borscht), ('БОРЩ', self.borscht), ('borshch', self.borscht),
+                              ('блинами', self.pancakes), ('bliny', self.pancakes), ('муки молока', self.pancakes)):
+            with self.subTest(query=query):
+                self.assertEqual([hit.recipe_id for hit in self.backend.search(query, limit=10)], [recipe.pk])
+
+    def test_fts_syntax_in_query(self):
+        for query in ('"', 'борщ"', 'NEAR(борщ', 'name : борщ', 'борщ* OR', '-борщ', '(((', '^борщ', '*', 'AND'):
+            with self.subTest(query=query):
+                self.assertIsInstance(self.backend.search(query, limit=10), list)
+
+
+class RecipeStepsTests(TestCase):
+    """
+    Сохранение рецепта вместе с шагами приготовления (RecipeStepsMixin).
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name, IMAGE_VARIANTS_ASYNC=False)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.author = get_user_model().objects.create_user(username='author', password='password')
+        self.client.force_login(self.author)
+        self.category = TagsCategory.objects.create(name='Выпечка', slug='bakery')
+
+    def recipe_data(self, **data) -> dict:
+        return {'name': 'Блины', 'description': 'Тонкие блины', 'products': 'Мука - 200 гр.;\nМолоко - 500 мл.;',
+                'number_servings': 4, 'time_preparing': 30, 'tags_category': self.category.pk, 'calorie': 200,
+                **data}
+
+    def steps(self, recipe: Recipe) -> list:
+        return [(step.step_description, bool(step.step_image)) for step in recipe.recipes_photo.order_by('pk')]
+
+    def test_steps_are_saved_in_order(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('create_recipe'), self.recipe_data(
+                step_description=['Смешать муку и молоко', 'Дать постоять', 'Жарить'],
+                step_image_1=make_image(name='step.jpg')))
+        recipe = Recipe.objects.get(name='Блины')
+        self.assertRedirects(response, recipe.get_absolute_url(), fetch_redirect_response=False)
+        self.assertEqual(self.steps(recipe), [('Смешать муку и молоко', False), ('Дать постоять', True),
+                                              ('Жарить', False)])
+        self.assertTrue(recipe.recipes_photo.get(step_description='Дать постоять').step_image_variants)
+
+    def test_invalid_step_saves_nothing(self):
+        broken = SimpleUploadedFile('step.jpg', b'not an image', content_type='image/jpeg')
+        response = self.client.post(reverse('create_recipe'), self.recipe_data(
+            step_description=['Смешать', 'Жарить'], step_image_1=broken))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any(error.startswith('Шаг 2:') for error in response.context['form'].non_field_errors()))
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(RecipeStepPreparing.objects.exists())
+
+        recipe = Recipe.objects.create(name='Оладьи', user=self.author)
+        response = self.client.post(reverse('update_recipe', args=[recipe.slug]), self.recipe_data(
+            name='Пышные оладьи', step_description=['Жарить'], step_image_0=broken))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Recipe.objects.get(pk=recipe.pk).name, 'Оладьи')
+        self.assertFalse(recipe.recipes_photo.exists())
+
+    def test_update_keeps_existing_steps(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('create_recipe'), self.recipe_data(
+                step_description=['Смешать', 'Жарить'], step_image_0=make_image(name='step.jpg')))
+        recipe = Recipe.objects.get(name='Блины')
+        image = recipe.recipes_photo.order_by('pk').first().step_image.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('update_recipe', args=[recipe.slug]), self.recipe_data(
+                name='Блины на молоке', step_description=['Подавать со сметаной']))
+        self.assertEqual(response.status_code, 302)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Блины на молоке')
+        # Прежние шаги и их фото не меняются, новый шаг без фото добавляется в конец
+        self.assertEqual(self.steps(recipe), [('Смешать', True), ('Жарить', False), ('Подавать со сметаной', False)])
+        self.assertEqual(recipe.recipes_photo.order_by('pk').first().step_image.name, image)
+
+
+class SlugTests(TestCase):
+    """
+    Транслитерация и подбор уникальных slug.
+    """
+
+    def test_translit(self):
+        self.assertEqual(translit_to_eng('Йогурт'), 'yogurt')
+        self.assertEqual(translit_to_eng('ЭКЛЕР Щи Объём'), 'ekler shchi obyom')
+        self.assertEqual(translit_to_eng('Salt 5%'), 'salt 5%')
+
+    def test_save_allocates_next_free_slug(self):
+        Recipe.objects.create(name='Пицца', slug='picca-3')
+        with self.assertNumQueries(4):  # Занятые варианты slug и вставка в точке сохранения
+            first = Recipe.objects.create(name='Пицца')
+        self.assertEqual(first.slug, 'picca')
+        self.assertEqual(Recipe.objects.create(name='ПИЦЦА').slug, 'picca-2')
+        self.assertEqual(Recipe.objects.create(name='пицца!').slug, 'picca-4')
+
+    def test_save_retries_taken_slug(self):
+        Recipe.objects.create(name='Борщ')
+        # Имитация параллельного запроса: slug подобран до того, как другой рецепт его занял
+        with patch('recipes.models.allocate_slug', side_effect=['borshch', 'borshch-2']):
+            recipe = Recipe.objects.create(name='Борщ')
+        self.assertEqual(recipe.slug, 'borshch-2')
+
+    def test_allocate_slugs(self):
+        Recipe.objects.create(name='Суп', slug='sup')
+        Recipe.objects.create(name='Суп', slug='sup-2')
+        Recipe.objects.create(name='Суп', slug='sup-abcd')  # Старый суффикс - не номер
+        names = ['Суп', 'Суп 2', 'Суп', 'Салат', 'Салат', '???']
+        with self.assertNumQueries(1):
+            slugs = allocate_slugs(Recipe, names)
+        self.assertEqual(slugs[:5], ['sup-3', 'sup-2-2', 'sup-4', 'salat', 'salat-2'])
+        self.assertEqual(len(slugs[5]), 8)
+        self.assertEqual(len(set(slugs)), len(slugs))
+
+
+class TaggingTests(TestCase):
+    """
+    Нормализация тегов продуктов и перевод каталога на нормализованные теги.
+    """
+
+    def create_recipe(self, products: str, category=None) -> Recipe:
+        return Recipe.objects.create(name='Блины', products=products, tags_category=category)
+
+    def usages(self, category=None) -> dict:
+        return dict(TagUsage.objects.filter(category=category).values_list('name', 'num_times'))
+
+    def test_tag_key(self):
+        self.assertEqual(tag_key('Яйца куриные'), tag_key('яйцо  КУРИНОЕ'))
+        self.assertEqual(tag_key('Перец чёрный'), tag_key('перец черный'))
+        self.assertNotEqual(tag_key('Масло сливочное'), tag_key('Масло растительное'))
+
+    def test_sync_adds_and_removes_tags(self):
+        category = TagsCategory.objects.create(name='Выпечка', slug='bakery')
+        recipe = self.create_recipe('МУКА - 200 гр.;\nМолоко - 500 мл.;', category)
+        other = self.create_recipe('мука - 1 стакан;\nЯйца - 2 шт.;', category)
+        self.assertEqual(sync_recipe_tags([recipe, other]), (4, 0))
+        self.assertEqual(sorted(recipe.tags.names()), ['Молоко', 'Мука'])
+        self.assertEqual(sorted(other.tags.names()), ['Мука', 'Яйца'])
+        self.assertEqual(self.usages(category), {'Молоко': 1, 'Мука': 2, 'Яйца': 1})
+
+        recipe.products = 'Яйцо - 1 шт.;\nМука - 100 гр.;'
+        recipe.save()
+        self.assertEqual(sync_recipe_tags([recipe]), (1, 1))
+        self.assertEqual(sorted(recipe.tags.names()), ['Мука', 'Яйца'])
+        self.assertEqual(self.usages(category), {'Мука': 2, 'Яйца': 2})
+        self.assertEqual(self.usages(), {'Мука': 2, 'Яйца': 2})
+        self.assertEqual(sync_recipe_tags([recipe, other]), (0, 0))
+
+    def test_sync_counts_removed_tag_once(self):
+        recipe = self.create_recipe('Мука - 200 гр.;\nМолоко - 500 мл.;')
+        other = self.create_recipe('Мука - 300 гр.;')
+        sync_recipe_tags([recipe, other])
+        recipe.products = 'Молоко - 500 мл.;'
+        recipe.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(sync_recipe_tags([recipe]), (0, 1))
+        # Обработчик удаления связи не уменьшает счетчик второй раз
+        self.assertEqual(self.usages(), {'Молоко': 1, 'Мука': 1})
+
+    def test_retag_command(self):
+        recipes = [self.create_recipe(products) for products in
+                   ('мука - 1 стакан;', 'Мука - 200 гр.;', 'Мука - 300 гр.;', 'Молоко - 1 л.;')]
+        # Теги, созданные до нормализации: разные написания одного продукта
+        recipes[0].tags.add('мука')
+        recipes[1].tags.add('Мука', 'Кефир')
+        recipes[2].tags.add('Мука')
+        call_command('retag_recipes', batch_size=2, stdout=StringIO())
+        self.assertEqual(sorted(Tag.objects.values_list('name', flat=True)), ['Молоко', 'Мука'])
+        self.assertEqual([sorted(recipe.tags.names()) for recipe in recipes],
+                         [['Мука'], ['Мука'], ['Мука'], ['Молоко']])
+        self.assertEqual(self.usages(), {'Молоко': 1, 'Мука': 3})
+
+
+class TagCloudTests(TestCase):
+    """
+    Счетчики и веса облака тегов, которые обновляются сигналами при изменении тегов рецептов.
+    """
+
+    def setUp(self):
+        self.soups = TagsCategory.objects.create(name='Супы', slug='soups')
+        self.bakery = TagsCategory.objects.create(name='Выпечка', slug='bakery')
+
+    def cloud(self) -> dict:
+        return {(usage.category_id, usage.name): (usage.num_times, usage.weight) for usage in TagUsage.objects.all()}
+
+    def assertCloud(self, expected: dict):
+        cloud = self.cloud()
+        self.assertEqual(cloud, {(category.pk if category else None, name): value
+                                 for (category, name), value in expected.items()})
+        rebuild_tag_usage()
+        self.assertEqual(self.cloud(), cloud)  # Счетчики совпадают с полным пересчетом
+
+    def create_recipe(self, category: TagsCategory, *tags: str) -> Recipe:
+        recipe = Recipe.objects.create(name='Рецепт', tags_category=category)
+        recipe.tags.add(*tags)
+        return recipe
+
+    def test_counters(self):
+        first = self.create_recipe(self.soups, 'Мука', 'Молоко')
+        second = self.create_recipe(self.soups, 'Мука')
+        third = self.create_recipe(self.bakery, 'Мука')
+        self.assertCloud({(self.soups, 'Мука'): (2, 5), (self.soups, 'Молоко'): (1, 2),
+                          (self.bakery, 'Мука'): (1, 5), (None, 'Мука'): (3, 5), (None, 'Молоко'): (1, 1)})
+
+        second.tags.remove('Мука')  # Максимум категории уменьшается - пересчитываются веса всей категории
+        self.assertCloud({(self.soups, 'Мука'): (1, 5), (self.soups, 'Молоко'): (1, 5),
+                          (self.bakery, 'Мука'): (1, 5), (None, 'Мука'): (2, 5), (None, 'Молоко'): (1, 2)})
+
+        first.tags_category = self.bakery
+        first.save()
+        self.assertCloud({(self.bakery, 'Мука'): (2, 5), (self.bakery, 'Молоко'): (1, 2),
+                          (None, 'Мука'): (2, 5), (None, 'Молоко'): (1, 2)})
+
+        third.delete()
+        self.assertCloud({(self.bakery, 'Мука'): (1, 5), (self.bakery, 'Молоко'): (1, 5),
+                          (None, 'Мука'): (1, 5), (None, 'Молоко'): (1, 5)})
+
+    def test_delta_queries(self):
+        tags = [Tag.objects.create(name=name, slug=name) for name in ('flour', 'milk', 'eggs')]
+        apply_tag_usage_delta([tags[0].pk], self.soups.pk, 1)
+        apply_tag_usage_delta([tags[0].pk], self.soups.pk, 1)
+        # Названия тегов; на каждое облако: максимум, вставка, изменение счетчиков, новые счетчики, веса тегов;
+        # точки сохранения транзакции
+        with self.assertNumQueries(1 + 2 * 5 + 2):
+            apply_tag_usage_delta([tags[1].pk], self.soups.pk, 1)
+        # Максимум не уменьшился: без повторного запроса максимума; веса удаленных строк не пересчитываются
+        with self.assertNumQueries(2 * 4 + 2):
+            apply_tag_usage_delta([tags[1].pk], self.soups.pk, -1)
+        # Максимум вырос: веса всей категории пересчитываются с известным максимумом
+        with self.assertNumQueries(1 + 2 * 5 + 2):
+            apply_tag_usage_delta([tags[0].pk], self.soups.pk, 1)
+        self.assertEqual(self.cloud(), {(self.soups.pk, 'flour'): (3, 5), (None, 'flour'): (3, 5)})
+
+
+class IngredientIndexTests(TestCase):
+    """
+    Индекс продуктов и поиск рецептов "Приготовить из того, что есть".
+    """
+
+    def setUp(self):
+        clear_bitmap_cache()
+        self.pancakes = Recipe.objects.create(name='Блины', products='Мука - 200 гр.;\nМолоко - 500 мл.;\nЯйца - 2 шт.;')
+        self.omelette = Recipe.objects.create(name='Омлет', products='Яйцо - 3 шт.;\nМолоко - 100 мл.;')
+        self.bread = Recipe.objects.create(name='Хлеб', products='мука - 500 гр.;\nДрожжи - 10 гр.;')
+
+    def search(self, *names, cursor=None, limit=20):
+        return search_by_ingredients(names, cursor, limit)
+
+    def test_ranking(self):
+        result = self.search('яйца', 'МОЛОКО', 'мука')
+        self.assertEqual(result.matches, [(self.pancakes.pk, 3), (self.omelette.pk, 2), (self.bread.pk, 1)])
+        self.assertEqual((result.total, result.complete), (3, 1))
+        self.assertEqual(self.search('сыр').matches, [])
+
+    def test_pagination(self):
+        first = self.search('мука', 'молоко', limit=2)
+        self.assertEqual(first.matches, [(self.pancakes.pk, 2), (self.bread.pk, 1)])
+        second = self.search('мука', 'молоко', cursor=first.next_cursor, limit=2)
+        self.assertEqual(second.matches, [(self.omelette.pk, 1)])
+        self.assertIsNone(second.next_cursor)
+
+    def test_huge_cursor_id(self):
+        result = self.search('мука', 'молоко', cursor=(1, 10 ** 18))
+        self.assertEqual(result.matches, [(self.bread.pk, 1), (self.omelette.pk, 1)])
+        url = reverse('cook') + '?products=мука, молоко&cursor=' + encode_cursor((1, 10 ** 18), 'n')
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_index_follows_recipe_changes(self):
+        self.search('мука')  # Карта попадает в память процесса и должна обновиться по версии
+        self.bread.products = 'Мука ржаная - 500 гр.;'
+        self.bread.save()
+        self.assertEqual(self.search('мука').matches, [(self.pancakes.pk, 1)])
+        self.pancakes.delete()
+        self.assertEqual(self.search('мука').matches, [])
+        self.assertEqual(self.search('мука ржаная').matches, [(self.bread.pk, 1)])
+
+    def test_rebuild(self):
+        Recipe.objects.filter(pk__in=[self.omelette.pk, self.bread.pk]).update(ingredients=[{'name': 'Мука'}])  # Без сигналов
+        self.assertEqual(call_command('rebuild_ingredient_index', stdout=StringIO()), None)
+        self.assertEqual(IngredientIndex.objects.get(key=tag_key('Мука')).recipes_count, 3)
+        self.assertEqual([match.recipe_id for match in self.search('мука').matches],
+                         sorted([self.pancakes.pk, self.omelette.pk, self.bread.pk], reverse=True))
+        self.assertFalse(IngredientIndex.objects.filter(key=tag_key('Дрожжи')).exists())
+
+    def test_cook_view(self):
+        url = reverse('cook')
+        with self.assertNumQueries(3):  # Поколение каталога, версии битовых карт, битовые карты
+            self.client.get(url + '?products=яйца, мука')
+        with self.assertNumQueries(2):  # Карты уже в памяти: версии и рецепты страницы
+            response = self.client.get(url + '?products=яйца, мука, хлеб')
+        self.assertEqual([recipe.pk for recipe in response.context['recipes']],
+                         [self.pancakes.pk, self.bread.pk, self.omelette.pk])
+        self.assertContains(response, 'есть продуктов: 2 из 3')
+        self.assertEqual(self.client.get(url + '?products=молоко&cursor=bad').status_code, 404)
+
+
+class SimilarRecipesTests(TestCase):
+    """
+    Похожие рецепты: MinHash-сигнатуры, пересчет при изменении рецепта и полный пересчет.
+    """
+    base = 'Мука - 200 гр.;\nМолоко - 500 мл.;\nЯйца - 2 шт.;\nСахар - 1 ст.л.;\nСоль - щепотка;\n'
+
+    def create_recipe(self, name: str, products: str) -> Recipe:
+        with self.captureOnCommitCallbacks(execute=True):
+            return Recipe.objects.create(name=name, products=products)
+
+    def similar(self, recipe: Recipe) -> list:
+        return list(SimilarRecipe.objects.filter(recipe=recipe).order_by('-score').values_list('similar_id', flat=True))
+
+    def test_minhash(self):
+        first = minhash(['мук', 'молок', 'яйц', 'сахар'])
+        self.assertEqual(similarity(first, minhash(['сахар', 'яйц', 'молок', 'мук'])), 1)
+        self.assertLess(similarity(first, minhash(['говядин', 'лук', 'морков', 'свекл'])), 0.2)
+        self.assertIsNone(minhash([]))
+
+    def test_incremental_update(self):
+        pancakes = self.create_recipe('Блины', self.base)
+        fritters = self.create_recipe('Оладьи', self.base + 'Кефир - 300 мл.;')
+        borscht = self.create_recipe('Борщ', 'Свекла - 1 шт.;\nКапуста - 300 гр.;\nГовядина - 500 гр.;')
+        self.assertEqual(self.similar(pancakes), [fritters.pk])
+        self.assertEqual(self.similar(fritters), [pancakes.pk])
+        self.assertEqual(self.similar(borscht), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            fritters.products = borscht.products + 'Лук - 1 шт.;'
+            fritters.save()
+        self.assertEqual(self.similar(pancakes), [])
+        self.assertEqual(self.similar(borscht), [fritters.pk])
+
+        self.addCleanup(view_counter.flush)  # Просмотр страницы записывается в базу до отката транзакции теста
+        response = self.client.get(borscht.get_absolute_url())
+        self.assertEqual([link.similar for link in response.context['similar_recipes']], [fritters])
+        self.assertContains(response, 'Похожие рецепты')
+
+    def test_rebuild_command(self):
+        recipes = [Recipe.objects.create(name=f'Блины {number}', products=self.base + f'Начинка {number} - 1 шт.;')
+                   for number in range(3)]
+        Recipe.objects.create(name='Борщ', products='Свекла - 1 шт.;')
+        self.assertFalse(SimilarRecipe.objects.exists())  # Без фиксации транзакции пересчет не запускался
+        call_command('rebuild_similar_recipes', workers=1, batch_size=2, stdout=StringIO())
+        self.assertEqual(set(self.similar(recipes[0])), {recipes[1].pk, recipes[2].pk})
+        self.assertEqual(SimilarRecipe.objects.count(), 6)
+        self.assertGreater(Recipe.objects.get(pk=recipes[0].pk).time_update, recipes[0].time_update)
+
+    def test_detail_etag_follows_similar_list(self):
+        pancakes = self.create_recipe('Блины', self.base)
+        borscht = self.create_recipe('Борщ', 'Свекла - 1 шт.;\nКапуста - 300 гр.;\nГовядина - 500 гр.;')
+        fritters = self.create_recipe('Оладьи', self.base + 'Кефир - 300 мл.;')
+        self.addCleanup(view_counter.flush)
+        url = pancakes.get_absolute_url()
+        etags = [self.client.get(url)['ETag']]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            fritters.name = 'Пышные оладьи'
+            fritters.save()
+        etags.append(self.client.get(url)['ETag'])
+        self.assertContains(self.client.get(url), 'Пышные оладьи')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            borscht.products = self.base + 'Свекла - 1 шт.;'
+            borscht.save()
+        self.assertIn(borscht.pk, self.similar(pancakes))
+        etags.append(self.client.get(url)['ETag'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            borscht.delete()
+        etags.append(self.client.get(url)['ETag'])
+        self.assertEqual(len(set(etags)), 4)
+
+
+class RateRecipeTests(TestCase):
+    """
+    Оценка рецепта через rate_recipe: одна оценка на пользователя, агрегаты изменяются на разницу оценок.
+    """
+
+    def setUp(self):
+        self.recipe = Recipe.objects.create(name='Блины', products='Мука - 200 гр.;')
+        self.url = reverse('rate_recipe', kwargs={'recipe_slug': self.recipe.slug})
+        self.users = [get_user_model().objects.create_user(username=f'rater{number}', password='password')
+                      for number in range(2)]
+
+    def rate(self, user, score):
+        self.client.force_login(user)
+        return self.client.post(self.url, {'score': score}, headers={'Accept': 'application/json'})
+
+    def test_create_and_update(self):
+        response = self.rate(self.users[0], 5)
+        self.assertEqual(response.json(), {'score': 5, 'average': 5.0, 'count': 1, 'created': True})
+        self.rate(self.users[1], 2)
+
+        self.client.force_login(self.users[0])
+        # Сессия, пользователь, рецепт, блокировка оценки, изменение оценки и агрегатов, чтение агрегатов и SAVEPOINT
+        with self.assertNumQueries(9):
+            response = self.client.post(self.url, {'score': 3}, headers={'Accept': 'application/json'})
+        self.assertEqual(response.json(), {'score': 3, 'average': 2.5, 'count': 2, 'created': False})
+        self.assertEqual(Rating.objects.filter(recipe=self.recipe).count(), 2)
+        self.recipe.refresh_from_db()
+        self.assertEqual((self.recipe.rating_sum, self.recipe.rating_count), (5, 2))
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.post(self.url, {'score': 5}).status_code, 403)
+        self.assertEqual(self.rate(self.users[0], 7).status_code, 400)
+        self.assertFalse(Rating.objects.exists())
+
+        # Без скрипта форма отправляется обычным запросом, и пользователь возвращается на страницу рецепта
+        self.client.force_login(self.users[0])
+        response = self.client.post(self.url, {'score': 4})
+        self.assertRedirects(response, self.recipe.get_absolute_url(), fetch_redirect_response=False)
+        self.assertEqual(Rating.objects.get().score, 4)
+
+
+class ViewerStateTests(TestCase):
+    """
+    Состояние рецептов для пользователя: оценки, авторство и комментарии загружаются пакетом один раз за запрос.
+    """
+
+    def setUp(self):
+        self.author, self.reader = [get_user_model().objects.create_user(username=name, password='password')
+                                    for name in ('author', 'reader')]
+        self.recipes = [Recipe.objects.create(name=f'Рецепт {number}', user=self.author) for number in range(3)]
+        Rating.objects.create(user=self.reader, recipe=self.recipes[0], score=4)
+        Comment.objects.create(user=self.reader, recipe=self.recipes[1], content='Вкусно')
+
+    def test_batch_load(self):
+        state = ViewerState(self.reader.pk)
+        with self.assertNumQueries(2):  # Оценки и комментарии, автор известен из загруженных рецептов
+            state.load(self.recipes)
+        with self.assertNumQueries(0):
+            state.load(self.recipes)
+            self.assertEqual(state.get(self.recipes[0]), (4, False, False))
+            self.assertEqual(state.get(self.recipes[1]), (None, False, True))
+            self.assertFalse(state.get(self.recipes[2]).rated)
+
+        state = ViewerState(self.author.pk)
+        with self.assertNumQueries(3):  # По id автор неизвестен
+            state.load([recipe.pk for recipe in self.recipes])
+        self.assertTrue(all(state.get(recipe).authored for recipe in self.recipes))
+        with self.assertNumQueries(0):
+            self.assertFalse(ViewerState(None).get(self.recipes[0]).rated)
+
+    def test_listing_badges(self):
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Ваша оценка: 4')
+        self.assertContains(response, 'Вы комментировали')
+        self.assertNotContains(response, 'Ваш рецепт')
+
+        self.addCleanup(view_counter.flush)
+        response = self.client.get(self.recipes[0].get_absolute_url())
+        self.assertContains(response, 'Вы уже оценили этот рецепт!')
+        self.assertNotContains(response, 'rating-form')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], RECIPE_PAGE_CACHE_TTL=0)
+class ReplicaRoutingTests(TestCase):
+    """
+    Чтение с реплики: основная база и реплика - два разных файла SQLite, данные в реплику не копируются,
+    поэтому по названию рецепта видно, из какой базы читала страница.
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.addCleanup(view_counter.flush)
+        self.user = get_user_model().objects.create_user(username='cook', password='password')
+        self.recipe = Recipe.objects.create(name='Новые блины', slug='bliny')
+        # На реплике - отставшая копия рецепта (без сигналов, которые пишут в основную базу)
+        Recipe.objects.using('replica').bulk_create([Recipe(pk=self.recipe.pk, name='Старые блины', slug='bliny')])
+
+    def test_router(self):
+        router = ReplicaRouter()
+        token = _state.set(RoutingState('replica'))
+        self.addCleanup(_state.reset, token)
+        self.assertEqual(router.db_for_read(Recipe), 'replica')
+        self.assertEqual(router.db_for_read(get_user_model()), 'default')
+        self.assertEqual(router.db_for_write(Recipe), 'default')
+        self.assertEqual(router.db_for_read(Recipe), 'default')  # После записи запрос читает с основной базы
+
+    def test_read_after_write(self):
+        url = self.recipe.get_absolute_url()
+        self.assertContains(self.client.get(url), 'Старые блины')
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Старые блины')
+        self.assertNotIn('ETag', response.headers)  # Каталог только что изменился, реплика могла отстать
+
+        # После записи пользователь читает с основной базы, пока реплика может отставать
+        self.client.force_login(self.user)
+        self.client.post(url, {'content': 'Вкусно'})
+        self.assertContains(self.client.get(url), 'Новые блины')
+        self.assertContains(self.client.get(reverse('home')), 'Новые блины')
+
+        with override_settings(DATABASE_REPLICA_LAG=0):
+            self.client.post(url, {'content': 'Очень вкусно'})
+        self.assertContains(self.client.get(url), 'Старые блины')
+        self.assertEqual(Comment.objects.filter(recipe=self.recipe).count(), 2)
+
+    @override_settings(RECIPE_PAGE_CACHE_TTL=600)
+    def test_page_cache_skips_lagging_replica(self):
+        url = self.recipe.get_absolute_url()
+        for _ in range(2):  # Первый запрос запоминает id рецепта по slug, второй создает версию страницы
+            self.client.get(url)
+        self.assertTrue(self.client.get(url).templates)  # Страница с реплики после изменения не закэширована
+        with override_settings(DATABASE_REPLICA_LAG=0):
+            self.client.get(url)
+        self.assertFalse(self.client.get(url).templates)
@@ -0,0 +1,182 @@
+import asyncio
+import time
+from typing import Callable, Iterable, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q, QuerySet
+
+from .conditional import bump_catalog_generation
+from .models import Recipe
+
+
+class TopRecipesList:
+    """
+    Кэшируемый список первых N рецептов по значению поля (для блоков в сайдбарах).
+    В кэше хранится список вместе со временем устаревания. Устаревший список пересчитывает
+    только один запрос (тот, кто взял блокировку), остальные в это время получают старый список.
+    """
+    # Сколько секунд ждать пересчета списка, если в кэше его еще нет
+    wait_timeout = 2
+    wait_step = 0.05
+
+    def __init__(self, name: str, field: str, condition: Optional[Q] = None):
+        self.name = name
+        self.field = field
+        self.condition = condition or Q()
+
+    @property
+    def cache_key(self) -> str:
+        return f'recipes:top:{self.name}'
+
+    @property
+    def lock_key(self) -> str:
+        return f'{self.cache_key}:lock'
+
+    @property
+    def size(self) -> int:
+        return getattr(settings, 'RECIPE_TOP_LIST_SIZE', 4)
+
+    @property
+    def ttl(self) -> int:
+        return getattr(settings, 'RECIPE_TOP_LIST_TTL', 300)
+
+    def queryset(self) -> QuerySet:
+        """
+        Метод возвращает запрос списка. Загружаются только поля, которые выводятся в сайдбаре.
+        :return: QuerySet
+        """
+        return (Recipe.objects.filter(self.condition).order_by(f'-{self.field}', '-pk')
+                .only('name', 'slug', 'image', 'image_variants', self.field)[:self.size])
+
+    def compute(self) -> List[Recipe]:
+        return list(self.queryset())
+
+    async def acompute(self) -> List[Recipe]:
+        return [recipe async for recipe in self.queryset()]
+
+    def get(self) -> List[Recipe]:
+        """
+        Метод возвращает список из кэша, при необходимости пересчитывая его.
+        :return: List
+        """
+        entry = cache.get(self.cache_key)
+        if entry is not None:
+            expires_at, recipes = entry
+            if time.time() < expires_at or not cache.add(self.lock_key, 1, self.wait_timeout * 5):
+                return recipes
+            return self._recompute()
+
+        if cache.add(self.lock_key, 1, self.wait_timeout * 5):
+            return self._recompute()
+        # Список пересчитывает другой запрос - ждем его результат
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.wait_step)
+            entry = cache.get(self.cache_key)
+            if entry is not None:
+                return entry[1]
+        return self.compute()
+
+    async def aget(self) -> List[Recipe]:
+        """
+        Асинхронный вариант get: список пересчитывается через асинхронный ORM,
+        ожидание чужого пересчета не блокирует цикл событий.
+        :return: List
+        """
+        entry = cache.get(self.cache_key)
+        if entry is not None:
+            expires_at, recipes = entry
+            if time.time() < expires_at or not cache.add(self.lock_key, 1, self.wait_timeout * 5):
+                return recipes
+            return await self._arecompute()
+
+        if cache.add(self.lock_key, 1, self.wait_timeout * 5):
+            return await self._arecompute()
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.wait_step)
+            entry = cache.get(self.cache_key)
+            if entry is not None:
+                return entry[1]
+        return await self.acompute()
+
+    def _recompute(self) -> List[Recipe]:
+        try:
+            return self._store(self.compute())
+        finally:
+            cache.delete(self.lock_key)
+
+    async def _arecompute(self) -> List[Recipe]:
+        try:
+            # Сохранение отмечает изменение каталога в текущей транзакции, а транзакции доступны только в потоке
+            return await sync_to_async(self._store)(await self.acompute())
+        finally:
+            cache.delete(self.lock_key)
+
+    def _store(self, recipes: List[Recipe]) -> List[Recipe]:
+        entry = cache.get(self.cache_key)
+        if entry is None or self._summary(entry[1]) != self._summary(recipes):
+            bump_catalog_generation()  # Блок сайдбара изменился - страницы списков нужно перерисовать
+        # Устаревший список хранится в кэше дольше TTL, чтобы его можно было отдавать во время пересчета
+        cache.set(self.cache_key, (time.time() + self.ttl, recipes), self.ttl * 10)
+        return recipes
+
+    @staticmethod
+    def _summary(recipes: List[Recipe]) -> list:
+        # Только то, что выводится в сайдбаре: значение поля (просмотры, рейтинг) меняется почти при каждом
+        # пересчете, но на страницу не попадает
+        return [(recipe.pk, recipe.name, recipe.slug, recipe.image.name, recipe.image_variants) for recipe in recipes]
+
+    def expire(self) -> None:
+        """
+        Метод помечает список устаревшим после фиксации текущей транзакции (иначе пересчет мог бы
+        прочитать данные до фиксации и сохранить их на весь TTL). Следующий запрос пересчитает список,
+        остальные получат старый список.
+        :return: None
+        """
+        transaction.on_commit(self._expire)
+
+    def _expire(self) -> None:
+        entry = cache.get(self.cache_key)
+        if entry is not None:
+            cache.set(self.cache_key, (0, entry[1]), self.ttl * 10)
+
+    def notify_changed(self, recipe_ids: Iterable[int], get_values: Callable[[List[int]], dict]) -> None:
+        """
+        Метод после фиксации текущей транзакции помечает список устаревшим, если изменение рецептов
+        может изменить его состав: рецепт уже есть в списке или его новое значение не меньше
+        последнего значения в списке.
+        :param recipe_ids: id измененных рецептов
+        :param get_values: функция, возвращающая {id: новое значение}; вызывается только при необходимости
+        :return: None
+        """
+        recipe_ids = list(recipe_ids)
+        transaction.on_commit(lambda: self._notify_changed(recipe_ids, get_values))
+
+    def _notify_changed(self, recipe_ids: List[int], get_values: Callable[[List[int]], dict]) -> None:
+        entry = cache.get(self.cache_key)
+        if entry is None or not entry[0]:
+            return
+        recipes = entry[1]
+        if len(recipes) < self.size or {recipe.pk for recipe in recipes} & set(recipe_ids):
+            self._expire()
+            return
+        threshold = getattr(recipes[-1], self.field)
+        if any(value >= threshold for value in get_values(recipe_ids).values()):
+            self._expire()
+
+
+top_rated_recipes = TopRecipesList('rating', 'rating_average', Q(rating_average__gte=4))
+most_viewed_recipes = TopRecipesList('views', 'views')
+
+
+def field_values(field: str) -> Callable[[List[int]], dict]:
+    """
+    Метод возвращает функцию для получения значений поля у списка рецептов одним запросом.
+    :param field: Str
+    :return: Callable
+    """
+    return lambda recipe_ids: dict(Recipe.objects.filter(pk__in=recipe_ids).values_list('pk', field))
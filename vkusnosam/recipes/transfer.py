@@ -0,0 +1,65 @@
+import gzip
+import sys
+from typing import IO
+
+from django.db.models import Prefetch, QuerySet
+
+from .models import Comment, Rating, Recipe, RecipeStepPreparing
+
+# Поля рецепта, которые переносятся в выгрузке как есть
+RECIPE_FIELDS = ('slug', 'name', 'description', 'products', 'views', 'number_servings', 'time_preparing', 'calorie')
+
+
+def open_dump(path: str, mode: str) -> IO:
+    """
+    Метод открывает файл выгрузки в бинарном режиме. Файлы *.gz сжимаются и распаковываются на лету,
+    '-' - стандартный ввод или вывод.
+    :param path: путь к файлу
+    :param mode: 'rb' или 'wb'
+    :return: IO
+    """
+    if path == '-':
+        return sys.stdin.buffer if mode == 'rb' else sys.stdout.buffer
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def export_queryset() -> QuerySet:
+    """
+    Метод возвращает рецепты со всеми связанными объектами, которые попадают в выгрузку.
+    Связанные объекты загружаются отдельными запросами на каждую пачку рецептов (iterator с chunk_size).
+    :return: QuerySet
+    """
+    return (Recipe.objects.select_related('user', 'tags_category').order_by('pk')
+            .prefetch_related(
+                'tags',
+                Prefetch('recipes_photo', RecipeStepPreparing.objects.order_by('pk')),
+                Prefetch('ratings', Rating.objects.select_related('user').order_by('pk')),
+                Prefetch('comments', Comment.objects.select_related('user').order_by('pk')),
+            ))
+
+
+def serialize_recipe(recipe: Recipe) -> dict:
+    """
+    Метод превращает рецепт со связанными объектами в словарь для одной строки JSONL.
+    Пользователи и категория записываются по username и slug, чтобы не зависеть от id в базе.
+    Изображения переносятся как пути в хранилище, сами файлы не выгружаются.
+    :param recipe: Recipe (из export_queryset)
+    :return: Dict
+    """
+    data = {field: getattr(recipe, field) for field in RECIPE_FIELDS}
+    data.update({
+        'image': recipe.image.name or None,
+        'author': recipe.user.username if recipe.user else None,
+        'category': {'slug': recipe.tags_category.slug, 'name': recipe.tags_category.name}
+        if recipe.tags_category else None,
+        'time_create': recipe.time_create.isoformat(),
+        'tags': sorted(tag.name for tag in recipe.tags.all()),
+        'steps': [{'description': step.step_description, 'image': step.step_image.name or None}
+                  for step in recipe.recipes_photo.all()],
+        'ratings': [{'user': rating.user.username, 'score': rating.score} for rating in recipe.ratings.all()],
+        'comments': [{'user': comment.user.username, 'content': comment.content,
+                      'time_create': comment.time_create.isoformat()} for comment in recipe.comments.all()],
+    })
+    return data
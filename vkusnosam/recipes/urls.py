@@ -1,17 +1,38 @@
+from django.conf import settings
 from django.urls import path
 
-from .views import HomeView, RecipeDetail, CreateRecipe, UpdateRecipe, DeleteRecipe, TagCloudByCategoryView, \
+from .async_views import AsyncHomeView, AsyncRecipeDetail, AsyncTagCloudByCategoryView, AsyncTaggedRecipesView
+from .views import HomeView, CookView, RecipeDetail, RecipeCommentsView, RateRecipeView, CreateRecipe, UpdateRecipe, DeleteRecipe, TagCloudByCategoryView, \
     TaggedRecipesView
 
-urlpatterns = [
-    path('', HomeView.as_view(), name='home'),
-    path('recipe_detail/<slug:recipe_slug>/', RecipeDetail.as_view(), name='recipe_detail'),
 
-    path('tag-cloud/', TagCloudByCategoryView.as_view(), name='tag_cloud_by_category'),
-    path('tag-cloud/<slug:tag_category_slug>/', TagCloudByCategoryView.as_view(), name='tag_cloud_by_category'),
-    path('tag/<str:tag_slug>/', TaggedRecipesView.as_view(), name='tagged_recipes'),
+def get_urlpatterns(async_views: bool) -> list:
+    """
+    Метод возвращает маршруты приложения.
+    Страницы для чтения можно обслуживать асинхронными вариантами представлений (для запуска через ASGI).
+    :param async_views: Bool
+    :return: List
+    """
+    if async_views:
+        home, detail, tag_cloud, tagged = AsyncHomeView, AsyncRecipeDetail, AsyncTagCloudByCategoryView, \
+            AsyncTaggedRecipesView
+    else:
+        home, detail, tag_cloud, tagged = HomeView, RecipeDetail, TagCloudByCategoryView, TaggedRecipesView
+    return [
+        path('', home.as_view(), name='home'),
+        path('recipe_detail/<slug:recipe_slug>/', detail.as_view(), name='recipe_detail'),
+        path('recipe_detail/<slug:recipe_slug>/comments/', RecipeCommentsView.as_view(), name='recipe_comments'),
+        path('recipe_detail/<slug:recipe_slug>/rate/', RateRecipeView.as_view(), name='rate_recipe'),
 
-    path('create_recipe/', CreateRecipe.as_view(), name='create_recipe'),
-    path('update_recipe/<slug:slug>/', UpdateRecipe.as_view(), name='update_recipe'),
-    path('delete_recipe/<slug:slug>/', DeleteRecipe.as_view(), name='delete_recipe'),
-]
+        path('tag-cloud/', tag_cloud.as_view(), name='tag_cloud_by_category'),
+        path('tag-cloud/<slug:tag_category_slug>/', tag_cloud.as_view(), name='tag_cloud_by_category'),
+        path('tag/<str:tag_slug>/', tagged.as_view(), name='tagged_recipes'),
+        path('cook/', CookView.as_view(), name='cook'),
+
+        path('create_recipe/', CreateRecipe.as_view(), name='create_recipe'),
+        path('update_recipe/<slug:slug>/', UpdateRecipe.as_view(), name='update_recipe'),
+        path('delete_recipe/<slug:slug>/', DeleteRecipe.as_view(), name='delete_recipe'),
+    ]
+
+
+urlpatterns = get_urlpatterns(getattr(settings, 'RECIPE_ASYNC_VIEWS', False))
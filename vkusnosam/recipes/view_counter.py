@@ -0,0 +1,108 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+    """
+    Буферизованный счетчик просмотров рецептов.
+    Просмотры копятся в памяти процесса и раз в RECIPE_VIEWS_FLUSH_INTERVAL секунд
+    записываются в базу одним пакетным UPDATE.
+    """
+    # Максимальное кол-во рецептов в одном UPDATE (ограничение на размер CASE)
+    batch_size = 500
+
+    def __init__(self):
+        self._pending = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    @property
+    def flush_interval(self) -> float:
+        """
+        Интервал сброса буфера в базу (в секундах).
+        :return: Float
+        """
+        return getattr(settings, 'RECIPE_VIEWS_FLUSH_INTERVAL', 10)
+
+    def increment(self, recipe_id: int, count: int = 1) -> None:
+        """
+        Метод добавляет просмотр рецепта в буфер.
+        Если с последнего сброса прошло больше интервала, то буфер записывается в базу.
+        :param recipe_id: id рецепта
+        :param count: кол-во просмотров
+        :return: None
+        """
+        with self._lock:
+            self._pending[recipe_id] = self._pending.get(recipe_id, 0) + count
+            flush_due = time.monotonic() - self._last_flush >= self.flush_interval
+        if flush_due:
+            self.flush()
+
+    def pending(self, recipe_id: int) -> int:
+        """
+        Метод возвращает кол-во просмотров рецепта, которые еще не записаны в базу.
+        :param recipe_id: id рецепта
+        :return: Int
+        """
+        with self._lock:
+            return self._pending.get(recipe_id, 0) + self._in_flight.get(recipe_id, 0)
+
+    def flush(self) -> int:
+        """
+        Метод записывает накопленные просмотры в базу.
+        Возвращает кол-во записанных просмотров.
+        :return: Int
+        """
+        from .models import Recipe
+        from .top_lists import field_values, most_viewed_recipes
+
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._pending or self._in_flight:
+                return 0
+            self._in_flight, self._pending = self._pending, {}
+            in_flight = list(self._in_flight.items())
+
+        written = 0
+        try:
+            for written in range(0, len(in_flight), self.batch_size):
+                batch = in_flight[written:written + self.batch_size]
+                delta = Case(*[When(pk=pk, then=Value(count)) for pk, count in batch],
+                             default=Value(0), output_field=PositiveIntegerField())
+                Recipe.objects.filter(pk__in=[pk for pk, _ in batch]).update(views=F('views') + delta)
+        except DatabaseError:
+            logger.exception("Не удалось записать просмотры рецептов в базу")
+            with self._lock:  # Возвращаем незаписанные просмотры в буфер, чтобы не потерять их
+                for pk, count in in_flight[written:]:
+                    self._pending[pk] = self._pending.get(pk, 0) + count
+                self._in_flight = {}
+            return 0
+
+        with self._lock:
+            self._in_flight = {}
+        most_viewed_recipes.notify_changed([pk for pk, _ in in_flight], field_values('views'))
+        return sum(count for _, count in in_flight)
+
+
+view_counter = ViewCounter()
+
+
+@atexit.register
+def _flush_on_exit() -> None:
+    """
+    Записывает оставшиеся в буфере просмотры при завершении процесса.
+    :return: None
+    """
+    try:
+        view_counter.flush()
+    except Exception:  # При завершении процесса база может быть уже недоступна
+        logger.exception("Не удалось записать просмотры рецептов при завершении процесса")
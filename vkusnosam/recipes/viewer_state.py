@@ -0,0 +1,143 @@
+import asyncio
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple, Union
+
+from django.http import HttpRequest
+
+from .models import Comment, Rating, Recipe
+
+REQUEST_ATTRIBUTE = '_viewer_state'
+
+
+class RecipeViewerState(NamedTuple):
+    """
+    Отношение текущего пользователя к рецепту.
+    """
+    score: Optional[int] = None  # Оценка пользователя (None - рецепт не оценен)
+    authored: bool = False  # Рецепт добавлен пользователем
+    commented: bool = False  # Пользователь комментировал рецепт
+
+    @property
+    def rated(self) -> bool:
+        return self.score is not None
+
+
+# Состояние для анонима и для рецептов, которые не загружались
+EMPTY_STATE = RecipeViewerState()
+
+
+class ViewerState:
+    """
+    Состояние рецептов для текущего пользователя (оценки, авторство, комментарии), загружаемое пакетами.
+    На пакет рецептов - по одному запросу оценок, рецептов пользователя и его комментариев; автора рецепта,
+    загруженного вместе с user_id, запрос не нужен. Загруженные рецепты повторно не запрашиваются,
+    для анонима запросов нет.
+    """
+
+    def __init__(self, user_id: Optional[int]):
+        self.user_id = user_id
+        self.states: Dict[int, RecipeViewerState] = {}
+
+    def pending(self, recipes: Iterable[Union[Recipe, int]]) -> Tuple[List[int], Set[int], List[int]]:
+        """
+        Метод разбирает рецепты пакета.
+        :param recipes: рецепты или их id
+        :return: Tuple (незагруженные id, id рецептов пользователя с известным автором, id с неизвестным автором)
+        """
+        if self.user_id is None:
+            return [], set(), []
+        recipe_ids, authored, unknown = [], set(), []
+        seen = set(self.states)
+        for recipe in recipes:
+            recipe_id = recipe.pk if isinstance(recipe, Recipe) else recipe
+            if recipe_id is None or recipe_id in seen:
+                continue
+            seen.add(recipe_id)
+            recipe_ids.append(recipe_id)
+            if isinstance(recipe, Recipe) and 'user_id' in recipe.__dict__:
+                if recipe.user_id == self.user_id:
+                    authored.add(recipe_id)
+            else:
+                unknown.append(recipe_id)
+        return recipe_ids, authored, unknown
+
+    def querysets(self, recipe_ids: List[int], unknown: List[int]) -> tuple:
+        """
+        Метод возвращает запросы пакета: оценки, рецепты пользователя с неизвестным автором, комментарии.
+        """
+        return (
+            Rating.objects.filter(user_id=self.user_id, recipe_id__in=recipe_ids).values_list('recipe_id', 'score'),
+            Recipe.objects.filter(user_id=self.user_id, pk__in=unknown).values_list('pk', flat=True),
+            Comment.objects.filter(user_id=self.user_id, recipe_id__in=recipe_ids).values_list(
+                'recipe_id', flat=True).distinct().order_by(),
+        )
+
+    def store(self, recipe_ids: List[int], scores: Iterable[Tuple[int, int]], authored: Iterable[int],
+              commented: Iterable[int]) -> None:
+        scores, authored, commented = dict(scores), set(authored), set(commented)
+        for recipe_id in recipe_ids:
+            self.states[recipe_id] = RecipeViewerState(scores.get(recipe_id), recipe_id in authored,
+                                                       recipe_id in commented)
+
+    def load(self, recipes: Iterable[Union[Recipe, int]]) -> None:
+        """
+        Метод загружает состояние пакета рецептов.
+        :param recipes: рецепты или их id
+        :return: None
+        """
+        recipe_ids, authored, unknown = self.pending(recipes)
+        if not recipe_ids:
+            return
+        ratings, own, comments = self.querysets(recipe_ids, unknown)
+        if unknown:
+            authored.update(own)
+        self.store(recipe_ids, ratings, authored, comments)
+
+    async def aload(self, recipes: Iterable[Union[Recipe, int]]) -> None:
+        """
+        Асинхронный вариант load: запросы пакета выполняются одновременно.
+        :param recipes: рецепты или их id
+        :return: None
+        """
+        recipe_ids, authored, unknown = self.pending(recipes)
+        if not recipe_ids:
+            return
+        ratings, own, comments = self.querysets(recipe_ids, unknown)
+        ratings, own, comments = await asyncio.gather(
+            _alist(ratings), _alist(own) if unknown else _empty(), _alist(comments))
+        authored.update(own)
+        self.store(recipe_ids, ratings, authored, comments)
+
+    def get(self, recipe: Union[Recipe, int]) -> RecipeViewerState:
+        """
+        Метод возвращает состояние рецепта (незагруженный рецепт загружается отдельно).
+        :param recipe: рецепт или его id
+        :return: RecipeViewerState
+        """
+        recipe_id = recipe.pk if isinstance(recipe, Recipe) else recipe
+        if self.user_id is None or recipe_id is None:
+            return EMPTY_STATE
+        if recipe_id not in self.states:
+            self.load([recipe])
+        return self.states[recipe_id]
+
+
+async def _alist(queryset) -> list:
+    return [row async for row in queryset]
+
+
+async def _empty() -> list:
+    return []
+
+
+def get_viewer_state(request: HttpRequest) -> ViewerState:
+    """
+    Метод возвращает состояние рецептов для пользователя запроса, одно на запрос.
+    :param request: HttpRequest
+    :return: ViewerState
+    """
+    state = getattr(request, REQUEST_ATTRIBUTE, None)
+    if state is None:
+        user = request.user
+        state = ViewerState(user.pk if user.is_authenticated else None)
+        setattr(request, REQUEST_ATTRIBUTE, state)
+    return state
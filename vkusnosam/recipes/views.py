@@ -1,22 +1,33 @@
 import logging
-from typing import Dict
+from typing import Dict, List
 
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import UserPassesTestMixin, PermissionRequiredMixin, LoginRequiredMixin
 from django.core.exceptions import PermissionDenied
-from django.db.models import Q, Count, Avg, Value, QuerySet
-from django.db.models.functions import Coalesce
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, QuerySet, Case, When, Value
 from django.shortcuts import render, get_object_or_404, redirect
 
-from django.http import HttpRequest, HttpResponse, HttpResponseForbidden, JsonResponse
+from django.http import Http404, HttpRequest, HttpResponse, HttpResponseRedirect, JsonResponse
 from django.urls import reverse_lazy, reverse
 from django.views import View
-from django.views.generic import ListView, DetailView, UpdateView, DeleteView, CreateView
+from django.views.generic import ListView, DetailView, UpdateView, DeleteView, CreateView, TemplateView
 from django.views.generic.edit import FormMixin
 from taggit.models import Tag
 
 from .forms import RecipeForm, CommentForm, SearchSortForm, RatingForm, RatingSortForm, RecipeStepPreparingForm
-from .models import Recipe, Comment, Rating, TagsCategory, RecipeStepPreparing
+from .models import Recipe, Comment, Rating, TagsCategory, RecipeStepPreparing, TagUsage
+from .comments import comments_page, first_comments_page
+from .conditional import CatalogConditionalGetMixin, ConditionalGetMixin
+from .images import schedule_variants
+from .ingredient_index import search_by_ingredients
+from .page_cache import AnonymousPageCacheMixin, CatalogPageCacheMixin, recipe_page_version, remember_recipe_slug
+from .pagination import KeysetPaginationMixin, decode_cursor, encode_cursor
+from .ratings import rate_recipe
+from .search import get_search_backend
+from .similar import similar_queryset
+from .view_counter import view_counter
 
 logger = logging.getLogger(__name__)  # Экземпляр logging, который мы можем использовать.
 
@@ -32,14 +43,33 @@ logger = logging.getLogger(__name__)  # Экземпляр logging, которы
 #         return super().dispatch(request, *args, **kwargs)
 
 
-class HomeView(ListView):
+class HomeView(CatalogPageCacheMixin, CatalogConditionalGetMixin, KeysetPaginationMixin, ListView):
     """
-    Класс для отображения списка рецептов
+    Класс для отображения списка рецептов.
+    Кол-во комментариев и рейтинг берутся из счетчиков рецепта, без JOIN с комментариями и оценками.
+    Бюджет запросов страницы (без учета сессии и пользователя):
+    1 запрос рецептов вместе с автором, +1 COUNT(*) только при пагинации по номерам страниц,
+    блоки сайдбаров читаются из кэша (по 1 запросу только при пересчете списка).
+    На повторный запрос с актуальным ETag отвечает 304 без запросов к базе,
+    анонимным посетителям страница отдается из кэша (см. recipes/page_cache.py).
     """
     model = Recipe
     context_object_name = 'recipes'
     template_name = 'recipes/index.html'
     paginate_by = 4
+    replica_reads = True  # GET-запросы читают с реплики (см. recipes/db_router.py)
+    page_cache_params = ('search', 'sort_by', 'sort_by_ratings', 'page', 'cursor')
+    # Ключи сортировки для курсорной пагинации. Последним полем всегда идет pk
+    sort_keys = {
+        '-time_create': ('-time_create', '-pk'),
+        'time_create': ('time_create', 'pk'),
+        '-comments_quantity': ('-comments_count', '-pk'),
+        'comments_quantity': ('comments_count', 'pk'),
+        '-ratings': ('-rating_average', '-pk'),
+        'ratings': ('rating_average', 'pk'),
+    }
+    card_fields = ('name', 'slug', 'image', 'image_variants', 'description', 'ingredients', 'time_preparing', 'calorie',
+                   'rating_average', 'comments_count', 'time_create', 'user__username')
 
     def get_queryset(self) -> QuerySet:
         """
@@ -47,27 +77,40 @@ class HomeView(ListView):
         Сортирует по дате, по кол-ву комментариев, по рейтингу.
         :return: QuerySet
         """
-        queryset = Recipe.objects.all().annotate(comments_quantity=Count('comments'),
-                                                 average_rating=Coalesce(Avg('ratings__score'), Value(0.0))
-                                                 ).select_related('user').prefetch_related('comments', 'ratings')
-        # for i, x in enumerate(queryset):
-        #     if i == 0:
-        #         print(list(x.__dict__)[1:])
-        #     print(list(x.__dict__.values())[1:])
+        # Загружаем только поля, которые выводятся в карточке рецепта
+        queryset = Recipe.objects.select_related('user').only(*self.card_fields)
         query = self.request.GET.get('search')
         sort_by_ratings = self.request.GET.get('sort_by_ratings')
-        sort_by = self.request.GET.get('sort_by', '-time_create')
+        sort_by = self.request.GET.get('sort_by')
+        self.search_hits = {}
+        self.ordering_keys = self.sort_keys['-time_create']
         if query:
-             queryset = queryset.filter(Q(name__iregex=query) | Q(products__iregex=query) | Q(calorie__icontains=query))
-        if sort_by in['time_create', '-time_create', 'comments_quantity', '-comments_quantity']:
-            queryset = queryset.order_by(sort_by)
-        if sort_by_ratings == '-ratings':
-            queryset = queryset.order_by('-average_rating')
-        if sort_by_ratings == 'ratings':
-            queryset = queryset.order_by('average_rating')
-
-        return queryset
-
+            hits = self.find_recipes(query)
+            self.search_hits = {hit.recipe_id: hit for hit in hits}
+            condition = Q(pk__in=list(self.search_hits))
+            if query.strip().isdigit():  # Поиск по калорийности
+                condition |= Q(calorie=int(query))
+            queryset = queryset.filter(condition)
+            if not sort_by and not sort_by_ratings:  # Без сортировки выводим по релевантности
+                queryset = queryset.annotate(search_rank=Case(
+                    *[When(pk=pk, then=Value(position)) for position, pk in enumerate(self.search_hits)],
+                    default=Value(len(self.search_hits)),
+                ))
+                self.ordering_keys = ('search_rank', '-pk')
+        if sort_by in self.sort_keys:
+            self.ordering_keys = self.sort_keys[sort_by]
+        if sort_by_ratings in ('-ratings', 'ratings'):
+            self.ordering_keys = self.sort_keys[sort_by_ratings]
+
+        return queryset.order_by(*self.ordering_keys)
+
+    def find_recipes(self, query: str) -> list:
+        """
+        Метод ищет рецепты в поисковом индексе.
+        :param query: поисковый запрос
+        :return: List (результаты поиска по убыванию релевантности)
+        """
+        return get_search_backend().search(query, limit=settings.RECIPE_SEARCH_MAX_RESULTS)
 
     def get_context_data(self, *, object_list=None, **kwargs):
         """
@@ -78,6 +121,11 @@ class HomeView(ListView):
         :return:
         """
         context = super().get_context_data(**kwargs)
+        for recipe in context['recipes']:  # Подсветка совпадений для найденных рецептов
+            hit = self.search_hits.get(recipe.pk)
+            if hit:
+                recipe.name_highlighted = hit.name_highlighted
+                recipe.search_snippet = hit.snippet
         context['title'] = 'Главная страница'
         context['search_form'] = SearchSortForm(self.request.GET)
         context['rating_form'] = RatingSortForm(self.request.GET)
@@ -90,6 +138,7 @@ class TagCloudByCategoryView(ListView):
     """
     template_name = 'recipes/tag_cloud.html'
     context_object_name = 'tags'
+    replica_reads = True  # GET-запросы читают с реплики (см. recipes/db_router.py)
 
     def get_queryset(self) -> QuerySet:
         """
@@ -97,19 +146,18 @@ class TagCloudByCategoryView(ListView):
         :return: QuerySet
         """
         tag_category_slug = self.kwargs.get('tag_category_slug')
+        self.category_tag = None
         if tag_category_slug:
-            category_tag = get_object_or_404(TagsCategory, slug=tag_category_slug)
-            tags = Tag.objects.filter(recipe__tags_category=category_tag
-                                      ).annotate(num_times=Count('taggit_taggeditem_items')).order_by('name')
-        else:
-            tags = Tag.objects.annotate(num_times=Count('taggit_taggeditem_items')).order_by('name')
+            self.category_tag = get_object_or_404(TagsCategory, slug=tag_category_slug)
+        return self.get_usages()
 
-        if tags.exists(): # Рассчитываем вес для каждого тега
-            max_count = max(tag.num_times for tag in tags)  # Максимальное количество использований
-            for tag in tags:
-                # Нормализуем вес тега (например, от 1 до 5)
-                tag.weight = int((tag.num_times / max_count) * 5) if max_count > 0 else 1
-        return tags
+    def get_usages(self) -> QuerySet:
+        """
+        Метод возвращает теги облака выбранной категории.
+        Кол-во использований и веса тегов заранее посчитаны в таблице TagUsage (см. recipes/tag_cloud.py).
+        :return: QuerySet
+        """
+        return TagUsage.objects.filter(category=self.category_tag).select_related('tag').order_by('name')
 
     def get_context_data(self, *, object_list=None, **kwargs) -> dict:
         """
@@ -120,22 +168,21 @@ class TagCloudByCategoryView(ListView):
         :return: Dict
         """
         context = super().get_context_data(**kwargs)
-        tag_category_slug = self.kwargs.get('tag_category_slug')
-        if tag_category_slug:
-            context['category_tag'] = get_object_or_404(TagsCategory, slug=tag_category_slug)
-        else:
-            context['category_tag'] = None
+        context['category_tag'] = self.category_tag
         context['categorys_tags'] = TagsCategory.objects.all()
         return context
 
 
 
-class TaggedRecipesView(ListView) :
+class TaggedRecipesView(CatalogPageCacheMixin, CatalogConditionalGetMixin, KeysetPaginationMixin, ListView):
     """
     Представление для фильтрации рецептов с конкретным тегом.
     """
     template_name = 'recipes/tagged_recipes.html'
     context_object_name = 'recipes'
+    paginate_by = 20
+    replica_reads = True  # GET-запросы читают с реплики (см. recipes/db_router.py)
+    page_cache_params = ('page', 'cursor')
 
     def get_queryset(self) -> QuerySet:
         """
@@ -145,7 +192,14 @@ class TaggedRecipesView(ListView) :
         """
         tag_slug = self.kwargs.get('tag_slug')
         self.tag = get_object_or_404(Tag, slug=tag_slug)
-        return Recipe.objects.filter(tags__in=[self.tag])
+        return self.get_recipes()
+
+    def get_recipes(self) -> QuerySet:
+        """
+        Метод возвращает рецепты с выбранным тегом.
+        :return: QuerySet
+        """
+        return Recipe.objects.filter(tags=self.tag).order_by(*self.ordering_keys)
 
     def get_context_data(self, **kwargs) -> dict:
         """
@@ -159,16 +213,94 @@ class TaggedRecipesView(ListView) :
         return context
 
 
+class CookView(CatalogPageCacheMixin, CatalogConditionalGetMixin, TemplateView):
+    """
+    Представление "Приготовить из того, что есть": рецепты, в которых есть продукты из запроса
+    (?products=мука, яйца, молоко). Сначала рецепты с наибольшим кол-вом совпавших продуктов.
+    Рецепты подбираются по индексу продуктов в памяти (см. recipes/ingredient_index.py),
+    бюджет запросов: 1 запрос версий битовых карт (+1 при их изменении) и 1 запрос рецептов страницы.
+    """
+    template_name = 'recipes/cook.html'
+    paginate_by = 20
+    page_cache_params = ('products', 'cursor')
+
+    def get_products(self) -> List[str]:
+        """
+        Метод возвращает названия продуктов из запроса (через запятую или точку с запятой).
+        :return: List
+        """
+        text = self.request.GET.get('products', '').replace(';', ',')
+        return [name.strip() for name in text.split(',') if name.strip()]
+
+    def get_cursor(self):
+        """
+        Метод возвращает курсор страницы: (совпало продуктов, id рецепта) или None для первой страницы.
+        :return: Tuple или None
+        """
+        token = self.request.GET.get('cursor')
+        if not token:
+            return None
+        values, _ = decode_cursor(token)
+        if len(values) != 2 or not all(isinstance(value, int) for value in values):
+            raise Http404('Неверный курсор страницы')
+        return tuple(values)
+
+    def get_context_data(self, **kwargs) -> dict:
+        """
+        Метод для передачи контекста в шаблон.
+        Рецепты страницы загружаются одним запросом и выводятся в порядке результатов поиска.
+        :param kwargs:
+        :return: Dict
+        """
+        context = super().get_context_data(**kwargs)
+        products = self.get_products()
+        recipes = []
+        result = None
+        if products:
+            result = search_by_ingredients(products, self.get_cursor(), self.paginate_by)
+            matched = dict(result.matches)
+            loaded = Recipe.objects.select_related('user').only(*HomeView.card_fields).order_by().in_bulk(list(matched))
+            for recipe_id, count in result.matches:
+                if recipe_id in loaded:  # Рецепт мог быть удален после чтения индекса
+                    loaded[recipe_id].matched = count
+                    recipes.append(loaded[recipe_id])
+        context.update({
+            'title': 'Приготовить из того, что есть',
+            'products': ', '.join(products),
+            'products_count': len(result.keys) if result else 0,
+            'recipes': recipes,
+            'search_result': result,
+            'next_cursor': encode_cursor(result.next_cursor, 'n') if result and result.next_cursor else None,
+        })
+        return context
+
+
+class CachedObjectMixin:
+    """
+    Миксин, который получает объект из базы один раз за запрос:
+    проверка прав (test_func) и обработка запроса используют один и тот же объект.
+    """
+
+    def get_object(self, queryset=None):
+        if not hasattr(self, '_cached_object'):
+            self._cached_object = super().get_object(queryset)
+        return self._cached_object
+
 
-class RecipeDetail(FormMixin, DetailView):
+class RecipeDetail(CachedObjectMixin, AnonymousPageCacheMixin, ConditionalGetMixin, FormMixin, DetailView):
     """
     Представление для отображения детальной информации о рецепте.
+    Версия страницы для ETag - время изменения рецепта (time_update), поэтому на повторный запрос
+    с актуальным ETag отвечает 304 после одного запроса рецепта.
+    Кол-во просмотров в версию не входит: иначе страница менялась бы при каждом просмотре.
+    Анонимным посетителям страница отдается из кэша, пока не изменятся рецепт, шаги, оценки или комментарии.
     """
     model = Recipe
     form_class = CommentForm
     context_object_name = 'recipe'
     slug_url_kwarg = 'recipe_slug'
     template_name = 'recipes/recipe_detail.html'
+    replica_reads = True  # GET-запросы читают с реплики (см. recipes/db_router.py)
 
     def get_success_url(self):
         """
@@ -176,57 +308,82 @@ class RecipeDetail(FormMixin, DetailView):
         Перенаправляет обратно в рецепт.
         :return:
         """
-        recipe = self.get_object()
-        return recipe.get_absolute_url()
+        return self.object.get_absolute_url()
         # return reverse("recipe_detail", kwargs={"recipe_slug": self.slug})
 
     def get_context_data(self, **kwargs) -> dict:
         """
         Метод для получения связанных данных и передачи контекста в представление.
-        Получает все картинки и комментарии, связанные с рецептом. Также форму для
-        комментариев и объект модели RecipeStepPreparing.
+        Получает первую страницу комментариев (следующие подгружаются через RecipeCommentsView),
+        похожие рецепты (одним запросом из таблицы SimilarRecipe),
+        форму для комментариев и объект модели RecipeStepPreparing.
         :param kwargs:
         :return: Dict
         """
         context = super().get_context_data(**kwargs)
-        recipe = self.get_object()
+        recipe = self.object
         # recipe_photos = RecipePhotos.objects.filter(recipe_id=recipe)
-        comments = recipe.comments.all()
         comments_form = self.get_form()
         # context['recipe_photos'] = recipe_photos
         recipe_step_preparing = RecipeStepPreparing.objects.filter(recipe_id=recipe)
         context['title'] = f"Детальная информация о рецепте {recipe.slug}"
-        context['comments'] = comments
+        if 'comments_page' not in context:
+            context['comments_page'] = first_comments_page(recipe)
+        if 'similar_recipes' not in context:
+            context['similar_recipes'] = similar_queryset(recipe.pk)
         context['comments_form'] = comments_form
         context['rating_form'] = RatingForm()
         context['recipe_step_preparing'] = recipe_step_preparing
         return context
 
 
-    def get_object(self, queryset=None):
+    def get_queryset(self) -> QuerySet:
         """
-        Метод для получения определенного рецепта из базы данных.
-        Возвращает выбранный объект по slug
-        :param queryset:
-        :return:
+        Метод для получения рецептов из базы данных вместе с автором.
+        Рецепт выбирается по slug в get_object.
+        :return: QuerySet
         """
-        recipe = get_object_or_404(Recipe, slug=self.kwargs[self.slug_url_kwarg])
-        recipe.increment_views()
-        return recipe
+        return Recipe.objects.select_related('user')
+
+    def get_version(self) -> str:
+        recipe = self.get_object()
+        return f'{recipe.pk}:{recipe.time_update.isoformat()}'
+
+    def get_last_modified(self):
+        return self.get_object().time_update
+
+    def get_page_cache_version(self):
+        return recipe_page_version(self.kwargs[self.slug_url_kwarg])
+
+    def page_cache_hit(self) -> None:
+        view_counter.increment(int(self.page_cache_version.split(':', 1)[0]))  # Версия начинается с id рецепта
+
+    def get_page_cache_changed(self):
+        return int(self.page_cache_version.split(':', 1)[1]) / 1e9  # Номер версии - время ее создания в наносекундах
+
+    def get(self, request, *args, **kwargs):
+        """
+        Метод для обработки GET-запроса.
+        Рецепт получается из базы один раз за запрос, просмотр записывается в буфер счетчика
+        (в том числе при ответе 304 и ответе из кэша страниц).
+        """
+        response = super().get(request, *args, **kwargs)
+        if not self.page_cache_used:
+            recipe = self.get_object()
+            recipe.increment_views()
+            remember_recipe_slug(recipe.slug, recipe.pk)
+        return response
 
     def post(self, request, *args, **kwargs):
         """
-        Метод для обработки POST-запроса (добавление комментария)
+        Метод для обработки POST-запроса (добавление комментария).
+        Оценки отправляются отдельно, в RateRecipeView.
         """
         self.object = self.get_object()  # Получаем объект рецепта
         form = self.get_form()
-        rating_form = RatingForm(request.POST)
         if form.is_valid():
             return self.form_valid(form)
-        if rating_form.is_valid():
-            return self.form_valid(rating_form)
-        else:
-            return self.form_invalid(form) or self.form_invalid(rating_form)
+        return self.form_invalid(form)
 
 
     def form_valid(self, form):
@@ -242,7 +399,117 @@ class RecipeDetail(FormMixin, DetailView):
 
 
 
-class CreateRecipe(LoginRequiredMixin, CreateView):
+class RateRecipeView(LoginRequiredMixin, View):
+    """
+    Представление для оценки рецепта без перезагрузки страницы.
+    Оценка ставится или изменяется одной транзакцией (см. recipes/ratings.py), в ответе - новый средний рейтинг
+    и кол-во оценок из агрегатов рецепта. Запросу без Accept: application/json (форма без скрипта)
+    отвечает перенаправлением обратно на страницу рецепта.
+    """
+    raise_exception = True  # Скрипт получает 403, а не страницу входа
+
+    def post(self, request, recipe_slug: str) -> HttpResponse:
+        recipe = get_object_or_404(Recipe.objects.only('slug'), slug=recipe_slug)
+        form = RatingForm(request.POST)
+        wants_json = 'application/json' in request.headers.get('Accept', '')
+        if not form.is_valid():
+            if wants_json:
+                return JsonResponse({'errors': form.errors}, status=400)
+            return redirect(recipe)
+        result = rate_recipe(recipe.pk, request.user.pk, form.cleaned_data['score'])
+        if wants_json:
+            return JsonResponse({'score': result.score, 'average': result.average, 'count': result.count,
+                                 'created': result.created})
+        return redirect(recipe)
+
+
+class RecipeCommentsView(View):
+    """
+    Представление для подгрузки комментариев рецепта страницами (новые первыми).
+    Страница рецепта выводит первую страницу комментариев, а следующие загружает скрипт при прокрутке.
+    По умолчанию отдает HTML-фрагмент со ссылкой на следующую страницу, с ?format=json - JSON.
+    """
+
+    def get(self, request, recipe_slug: str) -> HttpResponse:
+        recipe = get_object_or_404(Recipe.objects.only('pk'), slug=recipe_slug)
+        page = comments_page(recipe.pk, request.GET.get('cursor'))
+        next_url = f"{reverse('recipe_comments', args=[recipe_slug])}?cursor={page.next_cursor}" \
+            if page.has_next() else None
+        if request.GET.get('format') == 'json':
+            return JsonResponse({
+                'comments': [{
+                    'id': comment.pk,
+                    'author': comment.user.username,
+                    'avatar': comment.user.avatar.url if comment.user.avatar else None,
+                    'content': comment.content,
+                    'time_create': comment.time_create.isoformat(),
+                } for comment in page],
+                'next': next_url,
+            })
+        return render(request, 'recipes/includes/comments_page.html',
+                      {'comments_page': page, 'recipe_slug': recipe_slug})
+
+
+class RecipeStepsMixin:
+    """
+    Миксин для сохранения рецепта вместе с шагами приготовления (создание и обновление рецепта).
+    Сначала проверяются все шаги, затем рецепт и шаги сохраняются в одной транзакции,
+    все шаги - одним bulk_create.
+    """
+
+    def get_step_forms(self) -> List[RecipeStepPreparingForm]:
+        """
+        Метод собирает формы шагов из запроса. Шаги, где не заполнено ни одно поле, пропускаются.
+        Фото шага приходит в поле step_image_<номер шага> (номер проставляет forSite.js),
+        потому что браузер не отправляет пустые файловые поля и список step_image нельзя сопоставить с описаниями.
+        Без JavaScript фото приходят списком step_image и сопоставляются по порядку.
+        :return: List
+        """
+        descriptions = self.request.POST.getlist('step_description')
+        unnumbered_images = self.request.FILES.getlist('step_image')
+        step_forms = []
+        for i in range(max(len(descriptions), len(unnumbered_images))):
+            description = descriptions[i] if i < len(descriptions) else ''
+            image = self.request.FILES.get(f'step_image_{i}') or (
+                unnumbered_images[i] if i < len(unnumbered_images) else None)
+            if description.strip() or image:
+                step_forms.append(RecipeStepPreparingForm(data={'step_description': description},
+                                                          files={'step_image': image} if image else None))
+        return step_forms
+
+    def form_valid(self, form):
+        """
+        Метод проверяет шаги и сохраняет рецепт с шагами.
+        Ошибки шагов выводятся в ошибках формы рецепта, при этом ничего не сохраняется.
+        Файлы шагов записываются в хранилище при вставке строк (FileField.pre_save).
+        :param form: RecipeForm
+        :return: HttpResponseRedirect
+        """
+        step_forms = self.get_step_forms()
+        for number, step_form in enumerate(step_forms, 1):
+            if not step_form.is_valid():
+                for errors in step_form.errors.values():
+                    for error in errors:
+                        form.add_error(None, f'Шаг {number}: {error}')
+        if not form.is_valid():
+            return self.form_invalid(form)
+
+        with transaction.atomic():
+            form.instance.user = self.request.user  # user хранить имя текущего пользователя создающего статью
+            self.object = form.save()
+            steps = []
+            for step_form in step_forms:
+                step = step_form.save(commit=False)
+                step.recipe = self.object
+                step.users = self.request.user
+                steps.append(step)
+            RecipeStepPreparing.objects.bulk_create(steps)
+            for step in steps:  # bulk_create не вызывает post_save, поэтому варианты фото ставим в очередь сами
+                schedule_variants(step)
+        return HttpResponseRedirect(self.get_success_url())
+
+
+class CreateRecipe(LoginRequiredMixin, RecipeStepsMixin, CreateView):
     """
     Представление для создания нового рецепта.
     """
@@ -260,40 +527,7 @@ class CreateRecipe(LoginRequiredMixin, CreateView):
         return context
 
 
-    def form_valid(self, form):
-        """
-        Функция проверки на валидность. После чего происходит объект записи без занесения в базу данных(commit=False),
-        привязка пользователя к форме и сохранение в БД при помощи возвращения
-        самой себя через метод super().
-        Обрабатывает две формы RecipeForm и RecipeStepPreparingForm.
-        Из RecipeStepPreparingForm берет данные и создает список после чего создается объекты RecipeStepPreparing в БД.
-        :param form:
-        :return:
-        """
-        recipe = form.save(commit=False)
-        recipe.user = self.request.user   #   user хранить имя текущего пользователя создающего статью
-        recipe.save()
-
-        step_descriptions = self.request.POST.getlist('step_description')
-        step_images = self.request.FILES.getlist('step_image')
-
-        # Обрабатываем шаги, где заполнено хотя бы одно поле
-        for i in range(max(len(step_descriptions), len(step_images))):
-            # Безопасно получаем значения для текущего шага
-            description = step_descriptions[i] if i < len(step_descriptions) else ''
-            image = step_images[i] if i < len(step_images) else None
-            # Создаем шаг, если заполнено хотя бы одно поле
-            if description.strip() or image:
-                RecipeStepPreparing.objects.create(
-                    recipe=recipe,
-                    users=self.request.user,
-                    step_description=description,
-                    step_image=image
-                )
-        return super().form_valid(form)
-
-
-class UpdateRecipe(UserPassesTestMixin, UpdateView):
+class UpdateRecipe(CachedObjectMixin, UserPassesTestMixin, RecipeStepsMixin, UpdateView):
     """
     Представление для обновления данных рецепта.
     """
@@ -311,7 +545,7 @@ class UpdateRecipe(UserPassesTestMixin, UpdateView):
         user = self.request.user
         # Логируем информацию о пользователе и рецепте
         logger.info(f"Пользователь {user.username} пытается изменить рецепт {recipe.slug}")
-        if user == recipe.user:
+        if user.pk == recipe.user_id:  # Сравнение по id, без загрузки автора
             logger.info(f"Доступ разрешен: пользователь {user.username} является автором рецепта {recipe.slug}")
             return True
         else:
@@ -324,39 +558,14 @@ class UpdateRecipe(UserPassesTestMixin, UpdateView):
         :param kwargs:
         :return: Dict
         """
-        recipe = self.get_object()
+        recipe = self.object
         context = super().get_context_data(**kwargs)
         context['recipe_step_preparing_form'] = RecipeStepPreparingForm()
         context['title'] = f'Обновление рецепта {recipe.slug}'
         return context
 
-    def form_valid(self, form):
-        """
-        Функция проверки на валидность. После чего происходит объект записи без занесения в базу данных(commit=False),
-        привязка пользователя к форме и сохранение в БД при помощи возвращения
-        самой себя через метод super().
-        Обрабатывает форму RecipeStepPreparingForm.
-        Из RecipeStepPreparingForm берет данные и создает список после чего создается объекты RecipeStepPreparing в БД.
-        :param form:
-        :return:
-        """
-        recipe = form.save(commit=False)
-        recipe.user = self.request.user  # user хранить имя текущего пользователя создающего статью
-        recipe.save()
-
-        step_descriptions = self.request.POST.getlist('step_description')
-        step_images = self.request.FILES.getlist('step_image')
-
-        if step_descriptions or step_images:
-            for step_description, step_image in zip(step_descriptions, step_images):
-                RecipeStepPreparing.objects.create(recipe=recipe, users=self.request.user,
-                                                   step_image=step_image, step_description=step_description)
-
-        return super().form_valid(form)
-
-
 
-class DeleteRecipe(UserPassesTestMixin, DeleteView):
+class DeleteRecipe(CachedObjectMixin, UserPassesTestMixin, DeleteView):
     """
     Представление для удаления рецепта.
     """
@@ -387,7 +596,7 @@ class DeleteRecipe(UserPassesTestMixin, DeleteView):
         user = self.request.user
         # Логируем информацию о пользователе и рецепте
         logger.info(f"Пользователь {user.username} пытается удалить рецепт {recipe.slug}")
-        if user == recipe.user:
+        if user.pk == recipe.user_id:  # Сравнение по id, без загрузки автора
             logger.info(f"Доступ разрешен: пользователь {user.username} является автором рецепта {recipe.slug}")
             return True
         else:
@@ -404,4 +613,4 @@ def page_permission_denied(request, exception):
     :param exception:
     :return:
     """
-    return HttpResponseForbidden(render(request,'recipes/denied.html'))
+    return render(request, 'recipes/denied.html', status=403)
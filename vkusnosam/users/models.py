@@ -7,6 +7,8 @@ class User(AbstractUser):
     Класс для расширения стандартной модели user
     """
     avatar = models.ImageField(blank=True, null=True, upload_to='users/%Y/%m/%d', verbose_name='Аватар')
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False,
+                                       verbose_name='Варианты аватара')  # Уменьшенные копии (см. recipes/images.py)
     age = models.PositiveIntegerField(blank=True, null=True, verbose_name='Возраст')
     interests = models.TextField(blank=True, null=True, verbose_name='Интересы')
 
@@ -1,3 +1,102 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
 
-# Create your tests here.
+from recipes.models import Comment, Recipe
+from recipes.tests import SESSION_QUERIES, SESSION_ROWS, QueryBudgetMixin
+
+
+class UsersQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Бюджет запросов для страниц приложения users на каталоге, где в каждой связи 10 объектов.
+    """
+
+    def test_anonymous_pages(self):
+        for name in ('users:login', 'users:register', 'users:password_reset', 'users:password_reset_done',
+                     'users:password_reset_complete'):
+            with self.subTest(page=name):
+                self.assertWithinBudget(reverse(name), 0, 0)
+
+    def test_logout_requires_post(self):
+        self.assertWithinBudget(reverse('users:logout'), 0, 0, status_code=405)
+
+    def test_password_reset_confirm(self):
+        user = self.catalog['reader']
+        url = reverse('users:password_reset_confirm',
+                      args=[urlsafe_base64_encode(force_bytes(user.pk)), default_token_generator.make_token(user)])
+        # Пользователь по uid и создание сессии, в которую переносится токен; затем перенаправление
+        response = self.assertWithinBudget(url, 3, 1, status_code=302)
+        response = self.assertWithinBudget(response.url, 1 + SESSION_QUERIES, 1 + SESSION_ROWS)
+        self.assertTrue(response.context['validlink'])
+
+    def test_password_change(self):
+        for name in ('users:password-change', 'users:password-change-done'):
+            with self.subTest(page=name):
+                self.assertWithinBudget(reverse(name), 0, 0, status_code=302)
+                self.assertWithinBudget(reverse(name), SESSION_QUERIES, SESSION_ROWS, self.catalog['reader'])
+
+    def test_profile(self):
+        url = reverse('users:profile')
+        self.assertWithinBudget(url, 0, 0, status_code=302)
+        # Сводка по рецептам и комментариям пользователя одним запросом, списки подгружаются отдельно
+        self.assertWithinBudget(url, 1 + SESSION_QUERIES, 1 + SESSION_ROWS, self.catalog['author'])
+        self.assertWithinBudget(url, 1 + SESSION_QUERIES, 1 + SESSION_ROWS, self.catalog['reader'])
+
+    def test_profile_lists(self):
+        for name in ('users:profile_recipes', 'users:profile_comments'):
+            with self.subTest(page=name):
+                self.assertWithinBudget(reverse(name), 0, 0, status_code=302)
+                # Страница списка (на один объект больше, чтобы узнать о следующей), у комментариев - с рецептами
+                for user in (self.catalog['author'], self.catalog['reader']):
+                    self.assertWithinBudget(reverse(name), 1 + SESSION_QUERIES, 21 + SESSION_ROWS, user)
+
+
+class LargeCatalogUsersQueryBudgetTests(UsersQueryBudgetTests):
+    """
+    Те же бюджеты на каталоге, где в каждой связи 10 000 объектов.
+    """
+    scale = 10_000
+
+
+@override_settings(PROFILE_PAGE_SIZE=3)
+class ProfileTests(QueryBudgetMixin, TestCase):
+    """
+    Сводка и списки в профиле пользователя.
+    """
+
+    def test_stats(self):
+        author = self.catalog['author']
+        self.client.force_login(author)
+        stats = self.client.get(reverse('users:profile')).context['stats']
+        recipes = Recipe.objects.filter(user=author).aggregate(views=Sum('views'), rating_sum=Sum('rating_sum'),
+                                                               rating_count=Sum('rating_count'))
+        self.assertEqual(stats['recipes_count'], Recipe.objects.filter(user=author).count())
+        self.assertEqual(stats['comments_count'], Comment.objects.filter(user=author).count())
+        self.assertEqual(stats['views'], recipes['views'])
+        self.assertAlmostEqual(stats['rating_average'], recipes['rating_sum'] / recipes['rating_count'])
+
+    def test_empty_stats(self):
+        user = get_user_model().objects.create_user('newcomer', password='password')
+        self.client.force_login(user)
+        response = self.client.get(reverse('users:profile'))
+        self.assertEqual(response.context['stats'], {'recipes_count': 0, 'views': 0, 'rating_sum': 0,
+                                                     'rating_count': 0, 'comments_count': 0, 'rating_average': None})
+        self.assertContains(response, 'У вас нет опубликованных рецептов')
+        self.assertContains(response, 'У вас нет комментариев.')
+
+    def test_lists(self):
+        reader = self.catalog['reader']
+        self.client.force_login(reader)
+        for name, queryset in (('users:profile_recipes', Recipe.objects.filter(user=reader)),
+                               ('users:profile_comments', Comment.objects.filter(user=reader))):
+            with self.subTest(page=name):
+                ids, url = [], reverse(name)
+                while url:
+                    response = self.client.get(url)
+                    ids += [obj.pk for obj in response.context['page']]
+                    url = response.context['next_url']
+                self.assertEqual(ids, list(queryset.order_by('-time_create', '-pk').values_list('pk', flat=True)))
@@ -3,7 +3,8 @@ from django.contrib.auth.views import LogoutView, PasswordChangeDoneView, Passwo
 
 from django.urls import path, reverse_lazy
 
-from .views import CustomLoginView, RegisterView, ProfileView, UserPasswordChangeView
+from .views import CustomLoginView, RegisterView, ProfileView, ProfileRecipesView, ProfileCommentsView, \
+    UserPasswordChangeView
 
 app_name = 'users'
 
@@ -12,6 +13,8 @@ urlpatterns = [
     path('logout/', LogoutView.as_view(), name='logout'),
     path('register/', RegisterView.as_view(), name='register'),
     path('profile/', ProfileView.as_view(), name='profile'),
+    path('profile/recipes/', ProfileRecipesView.as_view(), name='profile_recipes'),
+    path('profile/comments/', ProfileCommentsView.as_view(), name='profile_comments'),
 
     # Изменение и сброс пароля
     path('password-change/', UserPasswordChangeView.as_view(), name='password-change'),
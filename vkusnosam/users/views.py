@@ -3,17 +3,24 @@ from typing import Dict
 
 from django.contrib import messages
 from django.contrib.auth import get_user_model
+from django.contrib.auth.mixins import LoginRequiredMixin
 from django.utils.translation import gettext as _
 
 
 from django.contrib.auth.views import LoginView, PasswordChangeView
+from django.conf import settings
+from django.db.models import Count, IntegerField, OuterRef, QuerySet, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse
 from django.shortcuts import render
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.views import View
 from django.views.generic import CreateView, UpdateView
 
 from users.forms import UserLoginForm, UserRegisterForm, Profile, UserPasswordChangeForm
 
 from recipes.models import Recipe, Comment
+from recipes.pagination import KeysetPaginator
 
 
 class CustomLoginView(LoginView):
@@ -70,11 +77,12 @@ class RegisterView(CreateView):
     }
 
 
-class ProfileView(UpdateView):
+class ProfileView(LoginRequiredMixin, UpdateView):
     """
     Представление для отображения и обновления профиля пользователя.
     """
     model = get_user_model()
+    login_url = reverse_lazy('users:login')
     form_class = Profile
     success_url = reverse_lazy('users:profile')
     template_name = 'users/profile.html'
@@ -88,17 +96,40 @@ class ProfileView(UpdateView):
         """
         return self.request.user
 
+    def get_stats(self) -> Dict:
+        """
+        Метод возвращает сводку по пользователю одним запросом: кол-во рецептов и комментариев,
+        сумму просмотров рецептов и средний рейтинг, полученный рецептами (по всем оценкам).
+        Просмотры и оценки берутся из счетчиков рецептов, а не пересчитываются по таблицам оценок.
+        :return: Dict
+        """
+        recipes = Recipe.objects.filter(user=OuterRef('pk')).order_by().values('user')
+
+        def recipes_total(expression):
+            return Coalesce(Subquery(recipes.annotate(total=expression).values('total'),
+                                     output_field=IntegerField()), 0)
+
+        stats = get_user_model().objects.filter(pk=self.request.user.pk).values(
+            recipes_count=recipes_total(Count('pk')),
+            views=recipes_total(Sum('views')),
+            rating_sum=recipes_total(Sum('rating_sum')),
+            rating_count=recipes_total(Sum('rating_count')),
+            comments_count=Coalesce(Subquery(
+                Comment.objects.filter(user=OuterRef('pk')).order_by().values('user')
+                .annotate(total=Count('pk')).values('total'), output_field=IntegerField()), 0),
+        ).get()
+        stats['rating_average'] = stats['rating_sum'] / stats['rating_count'] if stats['rating_count'] else None
+        return stats
+
     def get_context_data(self, **kwargs) -> Dict:
         """
-        Метод для получения связанных данных. Получает все рецепты опубликованные пользователем.
+        Метод для получения связанных данных. Получает сводку по рецептам и комментариям пользователя.
+        Сами списки подгружаются страницами через ProfileRecipesView и ProfileCommentsView.
         :param kwargs:
         :return: Dict
         """
         context = super().get_context_data(**kwargs)
-        users_recipes = Recipe.objects.filter(user=self.request.user)
-        users_comments = Comment.objects.filter(user=self.request.user)
-        context['users_recipes'] = users_recipes
-        context['users_comments'] = users_comments
+        context['stats'] = self.get_stats()
         return context
 
     def form_valid(self, form: any) -> str:
@@ -122,6 +153,50 @@ class ProfileView(UpdateView):
         return super().form_invalid(form)
 
 
+class ProfileListView(LoginRequiredMixin, View):
+    """
+    Базовое представление для подгрузки списков профиля страницами (новые первыми).
+    Отдает HTML-фрагмент, в конце которого ссылка на следующую страницу.
+    """
+    login_url = reverse_lazy('users:login')
+    template_name = None
+    url_name = None
+
+    def get_queryset(self) -> QuerySet:
+        raise NotImplementedError
+
+    def get(self, request) -> HttpResponse:
+        paginator = KeysetPaginator(self.get_queryset(), ('-time_create', '-pk'),
+                                    getattr(settings, 'PROFILE_PAGE_SIZE', 20))
+        page = paginator.page(request.GET.get('cursor'))
+        next_url = f'{reverse(self.url_name)}?cursor={page.next_cursor}' if page.has_next() else None
+        return render(request, self.template_name, {'page': page, 'next_url': next_url})
+
+
+class ProfileRecipesView(ProfileListView):
+    """
+    Представление для подгрузки рецептов пользователя в профиле.
+    """
+    template_name = 'users/includes/profile_recipes.html'
+    url_name = 'users:profile_recipes'
+
+    def get_queryset(self) -> QuerySet:
+        return Recipe.objects.filter(user=self.request.user).only('name', 'slug', 'image', 'image_variants',
+                                                                  'time_create')
+
+
+class ProfileCommentsView(ProfileListView):
+    """
+    Представление для подгрузки комментариев пользователя в профиле (вместе с названиями рецептов).
+    """
+    template_name = 'users/includes/profile_comments.html'
+    url_name = 'users:profile_comments'
+
+    def get_queryset(self) -> QuerySet:
+        return Comment.objects.filter(user=self.request.user).select_related('recipe').only(
+            'content', 'time_create', 'recipe__name', 'recipe__slug')
+
+
 class UserPasswordChangeView(PasswordChangeView):
     """
     Представление для смены старого пароля на новый